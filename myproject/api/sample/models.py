@@ -7,6 +7,8 @@ class Sample(BaseModel):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
 
+    VERSIONED_CACHE = True
+
     def __str__(self):
         return self.name
 
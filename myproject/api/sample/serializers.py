@@ -1,9 +1,192 @@
-from rest_framework.serializers import ModelSerializer
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.serializers import ListSerializer, ModelSerializer
+from rest_framework.status import HTTP_409_CONFLICT
+from rest_framework.validators import UniqueValidator
+
 from .models import Sample
 
+# Samples written per bulk query
+BULK_BATCH_SIZE = 1000
+
+# What to do with created samples whose name already exists
+ON_CONFLICT = ('error', 'skip', 'update')
+
+# Writes of a batch whose names keep being taken by concurrent requests
+BULK_WRITE_ATTEMPTS = 3
+
+
+class NameConflict(APIException):
+    status_code = HTTP_409_CONFLICT
+    default_detail = 'Samples with these names are being written by other requests, try again.'
+    default_code = 'conflict'
+
+
+class SampleListSerializer(ListSerializer):
+    """
+    Validates and writes arrays of samples in bulk.
+
+    Items are validated one by one, so an invalid item doesn't fail the
+    others, and written with `bulk_create`/`bulk_update`. `name` uniqueness
+    is checked with one query per batch instead of one per item. The bulk
+    methods return a result per item, in the order of the input.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Replaced by the batch check in `_existing_names`
+        name = self.child.fields['name']
+        name.validators = [v for v in name.validators if not isinstance(v, UniqueValidator)]
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        if self.max_length is not None and len(data) > self.max_length:
+            raise ValidationError({
+                'non_field_errors': [f'Ensure this field has no more than {self.max_length} elements.'],
+            })
+        if not data and not self.allow_empty:
+            raise ValidationError({'non_field_errors': ['This list may not be empty.']})
+
+        self.item_errors = {}
+        validated = []
+        for index, item in enumerate(data):
+            try:
+                attrs = self.child.run_validation(item)
+            except ValidationError as e:
+                self.item_errors[index] = e.detail
+                attrs = None
+            else:
+                if self.partial:
+                    # Updates refer to samples by id, which is read-only
+                    pk = item.get('id') if isinstance(item, dict) else None
+                    if not isinstance(pk, int) or isinstance(pk, bool):
+                        self.item_errors[index] = {'id': ['A valid integer is required.']}
+                        attrs = None
+                    else:
+                        attrs['id'] = pk
+            validated.append(attrs)
+
+        # Names must also be unique within the request
+        seen = set()
+        for index, attrs in enumerate(validated):
+            if attrs is None or 'name' not in attrs:
+                continue
+            if attrs['name'] in seen:
+                self.item_errors[index] = {'name': ['Duplicate name in this request.']}
+                validated[index] = None
+            seen.add(attrs['name'])
+        return validated
+
+    def bulk_create(self, on_conflict='error'):
+        """
+        Create the valid items. Items whose name already exists are
+        reported as errors, skipped, or update the fields they hold in the
+        existing sample, depending on `on_conflict`.
+        """
+        results = self._results()
+        items = [(index, attrs) for index, attrs in enumerate(self.validated_data) if attrs is not None]
+        for start in range(0, len(items), BULK_BATCH_SIZE):
+            self._write_batch(self._create_batch, items[start:start + BULK_BATCH_SIZE], results, on_conflict)
+        return results
+
+    def _create_batch(self, batch, results, on_conflict):
+        names = [attrs['name'] for _, attrs in batch]
+        if on_conflict == 'update':
+            # Updated samples are loaded, so the fields an item leaves out keep their values
+            existing = Sample.objects.in_bulk(names, field_name='name')
+        else:
+            existing = self._existing_names(names)
+        created, updated = [], []
+        fields = set()
+        for index, attrs in batch:
+            match = existing.get(attrs['name'])
+            if match is None:
+                created.append((index, Sample(**attrs)))
+            elif on_conflict == 'update':
+                for field, value in attrs.items():
+                    setattr(match, field, value)
+                fields.update(attrs)
+                updated.append((index, match))
+            elif on_conflict == 'skip':
+                results[index] = {'index': index, 'status': 'skipped', 'id': match}
+            else:
+                results[index] = self._error(index, {'name': ['sample with this name already exists.']})
+
+        with transaction.atomic():
+            Sample.objects.bulk_create([sample for _, sample in created])
+            if updated:
+                Sample.objects.bulk_update([sample for _, sample in updated], sorted(fields))
+        for status, samples in (('created', created), ('updated', updated)):
+            for index, sample in samples:
+                results[index] = {'index': index, 'status': status, 'id': sample.pk}
+
+    def bulk_update(self):
+        """Update the valid items, which refer to existing samples by id"""
+        results = self._results()
+        items = [(index, attrs) for index, attrs in enumerate(self.validated_data) if attrs is not None]
+        for start in range(0, len(items), BULK_BATCH_SIZE):
+            self._write_batch(self._update_batch, items[start:start + BULK_BATCH_SIZE], results)
+        return results
+
+    def _update_batch(self, batch, results):
+        samples = Sample.objects.in_bulk([attrs['id'] for _, attrs in batch])
+        existing = self._existing_names(attrs['name'] for _, attrs in batch if 'name' in attrs)
+        updated = []
+        fields = set()
+        for index, attrs in batch:
+            pk = attrs['id']
+            sample = samples.get(pk)
+            if sample is None:
+                results[index] = self._error(index, {'id': ['Not found.']})
+            elif existing.get(attrs.get('name'), pk) != pk:
+                results[index] = self._error(index, {'name': ['sample with this name already exists.']})
+            else:
+                for field, value in attrs.items():
+                    if field != 'id':
+                        setattr(sample, field, value)
+                        fields.add(field)
+                updated.append((index, sample))
+
+        if updated:
+            with transaction.atomic():
+                Sample.objects.bulk_update([sample for _, sample in updated], sorted(fields))
+        for index, sample in updated:
+            results[index] = {'index': index, 'status': 'updated', 'id': sample.pk}
+
+    def _write_batch(self, write, batch, results, *args):
+        """
+        Write a batch, looking the names up again when another request took
+        some of them after they were looked up. Those items then get the
+        result of a name that already exists.
+        """
+        for attempt in range(BULK_WRITE_ATTEMPTS):
+            try:
+                return write(batch, results, *args)
+            except IntegrityError:
+                if attempt == BULK_WRITE_ATTEMPTS - 1:
+                    names = self._existing_names(attrs['name'] for _, attrs in batch if 'name' in attrs)
+                    raise NameConflict({'detail': NameConflict.default_detail, 'names': sorted(names)})
+
+    def _results(self):
+        results = [None] * len(self.validated_data)
+        for index, errors in self.item_errors.items():
+            results[index] = self._error(index, errors)
+        return results
+
+    @staticmethod
+    def _error(index, errors):
+        return {'index': index, 'status': 'error', 'errors': errors}
+
+    @staticmethod
+    def _existing_names(names):
+        """Map the names among `names` that already exist to their sample ids"""
+        return dict(Sample.objects.filter(name__in=list(names)).values_list('name', 'id'))
+
 
 class SampleSerializer(ModelSerializer):
     class Meta:
         model = Sample
         fields = '__all__'
-        read_only_fields = ('id', 'created_by', 'created_at', 'updated_by', 'updated_at')
\ No newline at end of file
+        read_only_fields = ('id', 'created_by', 'created_at', 'updated_by', 'updated_at')
+        list_serializer_class = SampleListSerializer
@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('sample/', views.SampleLCView.as_view()),
+    path('sample/bulk/', views.SampleBulkView.as_view()),
     path('sample/<int:pk>/', views.SampleRUDView.as_view()),
     path('hello/', views.hello, name='hello'),
 ]
\ No newline at end of file
@@ -1,21 +1,62 @@
 from rest_framework.decorators import api_view
-from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import GenericAPIView, ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from common.response_cache import CachedResponseMixin
+from common.values import ValuesListMixin
+
 from .serializers import *
 
 
-class SampleLCView(ListCreateAPIView):
+class SampleLCView(CachedResponseMixin, ValuesListMixin, ListCreateAPIView):
+    queryset = Sample.objects.all()
+    serializer_class = SampleSerializer
+    permission_classes = [IsAuthenticated]
+
+
+class SampleRUDView(CachedResponseMixin, RetrieveUpdateDestroyAPIView):
     queryset = Sample.objects.all()
     serializer_class = SampleSerializer
     permission_classes = [IsAuthenticated]
 
 
-class SampleRUDView(RetrieveUpdateDestroyAPIView):
+class SampleBulkView(GenericAPIView):
+    """
+    Create (POST) or update (PATCH) samples in bulk from an array.
+
+    Each item gets a result, in the order of the input: its status
+    (`created`, `updated`, `skipped` or `error`) and its id or errors.
+    `?on_conflict=` decides what POST does with names that already exist:
+    `error` (default), `skip` or `update`. PATCH items need an `id`.
+    Names taken by concurrent requests are looked up again; if they keep
+    conflicting the request fails with 409 and the names.
+    """
     queryset = Sample.objects.all()
     serializer_class = SampleSerializer
     permission_classes = [IsAuthenticated]
+    max_items = 10000
+
+    def post(self, request):
+        on_conflict = request.query_params.get('on_conflict', 'error')
+        if on_conflict not in ON_CONFLICT:
+            raise ValidationError({'on_conflict': [f"Expected one of {', '.join(ON_CONFLICT)}."]})
+        serializer = self.get_serializer(data=request.data, many=True, max_length=self.max_items)
+        serializer.is_valid(raise_exception=True)
+        return self._response(serializer.bulk_create(on_conflict))
+
+    def patch(self, request):
+        serializer = self.get_serializer(data=request.data, many=True, partial=True, max_length=self.max_items)
+        serializer.is_valid(raise_exception=True)
+        return self._response(serializer.bulk_update())
+
+    @staticmethod
+    def _response(results):
+        counts = {'created': 0, 'updated': 0, 'skipped': 0, 'error': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({**counts, 'results': results})
 
 
 @api_view(['GET'])
@@ -1,10 +1,29 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from common.throttling import IPRateThrottle, UsernameRateThrottle, throttle_scope
+
+
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    """
+    Login, throttled per IP and per username before the password is hashed
+    """
+    throttle_classes = [IPRateThrottle, UsernameRateThrottle]
+    throttle_scope = 'token_obtain'
+
+
+class ThrottledTokenRefreshView(TokenRefreshView):
+    """Token refresh, throttled per IP"""
+    throttle_classes = [IPRateThrottle]
+    throttle_scope = 'token_refresh'
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([IPRateThrottle, UsernameRateThrottle])
+@throttle_scope('token_info')
 def token_info(request):
     """
     Endpoint to retrieve information about the current user's token.
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import APILog
+from .search import filter_matching
 
 
 @admin.register(APILog)
@@ -7,12 +8,12 @@ class APILogAdmin(admin.ModelAdmin):
     """Admin interface for API logs"""
     
     list_display = [
-        'method', 'path', 'response_status_code', 'request_user',
+        'method', 'path', 'route', 'response_status_code', 'request_user',
         'request_timestamp', 'duration_ms', 'request_ip'
     ]
     
     list_filter = [
-        'method', 'response_status_code', 'request_user',
+        'method', 'route', 'response_status_code', 'request_user',
         'request_timestamp', 'content_type'
     ]
     
@@ -21,30 +22,41 @@ class APILogAdmin(admin.ModelAdmin):
     ]
     
     readonly_fields = [
-        'method', 'path', 'query_params', 'request_headers', 'request_body',
+        'method', 'path', 'route', 'query_params', 'request_headers', 'request_body',
         'request_user', 'request_ip', 'response_status_code', 'response_headers',
-        'response_body', 'request_timestamp', 'response_timestamp',
-        'duration_ms', 'user_agent', 'content_type', 'created_at', 'updated_at'
+        'response_body', 'response_size', 'request_timestamp', 'response_timestamp',
+        'duration_ms', 'sql_count', 'sql_time_ms', 'auth_time_ms', 'view_time_ms', 'render_time_ms',
+        'sample_weight', 'user_agent', 'content_type', 'created_at', 'updated_at'
     ]
     
     fieldsets = (
         ('Request Information', {
-            'fields': ('method', 'path', 'query_params', 'request_headers', 'request_body')
+            'fields': ('method', 'path', 'route', 'query_params', 'request_headers', 'request_body')
         }),
         ('User Information', {
             'fields': ('request_user', 'request_ip', 'user_agent')
         }),
         ('Response Information', {
-            'fields': ('response_status_code', 'response_headers', 'response_body')
+            'fields': ('response_status_code', 'response_headers', 'response_body', 'response_size')
         }),
         ('Timing', {
-            'fields': ('request_timestamp', 'response_timestamp', 'duration_ms')
+            'fields': (
+                'request_timestamp', 'response_timestamp', 'duration_ms',
+                'sql_count', 'sql_time_ms', 'auth_time_ms', 'view_time_ms', 'render_time_ms', 'sample_weight'
+            )
         }),
         ('Metadata', {
             'fields': ('content_type', 'created_at', 'updated_at')
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        """Search through the full-text index where there is one"""
+        matching = filter_matching(queryset, search_term) if search_term.strip() else None
+        if matching is None:
+            return super().get_search_results(request, queryset, search_term)
+        return matching | queryset.filter(request_user__username=search_term.strip()), False
+
     def has_add_permission(self, request):
         """Disable adding new logs manually"""
         return False
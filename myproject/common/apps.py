@@ -0,0 +1,33 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_delete, post_migrate, post_save
+
+
+def install_search_indexes(sender, using, **kwargs):
+    from .routes import install_path_search
+    from .search import install_search_index
+    install_path_search(using)
+    install_search_index(using)
+
+
+def sync_partition_schemas(sender, using, **kwargs):
+    from .partitions import sync_schemas
+    sync_schemas(using)
+
+
+class CommonConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'common'
+
+    def ready(self):
+        from . import partitions
+        partitions.install()
+        post_migrate.connect(install_search_indexes, sender=self)
+        post_migrate.connect(sync_partition_schemas, sender=self)
+
+        from .timing import install
+        install()
+
+        from .authentication import invalidate_user
+        post_save.connect(invalidate_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(invalidate_user, sender=settings.AUTH_USER_MODEL)
@@ -1,14 +1,143 @@
+import copy
+import hashlib
+import threading
+import time
+from functools import lru_cache
+from time import perf_counter_ns
+
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from middlewares.current_user import _current_user
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from middlewares.current_user import CurrentUserMiddleware
+
+from .caches import TTLCache
+from .conf import authentication_settings
+from .timing import add_auth_time
 
 
 class CustomJWTAuthentication(JWTAuthentication):
     """
     Custom JWT Authentication that updates the current user context variable.
+
+    Validated tokens are cached until they expire, so a token is only
+    decoded and its signature checked the first time it is seen (see
+    `AUTHENTICATION['TOKEN_CACHE']`). Users are looked up in a per-process
+    cache keyed by the token's user id before going to the database (see
+    `AUTHENTICATION['USER_CACHE']`). The time spent is added to the
+    request's timings (see common.timing).
     """
     def authenticate(self, request):
-        result = super().authenticate(request)
+        start = perf_counter_ns()
+        try:
+            result = super().authenticate(request)
+        finally:
+            add_auth_time(perf_counter_ns() - start)
         if result:
             user, _ = result
-            _current_user.set(user)  # Update context variable
+            # Reset by CurrentUserMiddleware at the end of the request
+            CurrentUserMiddleware.set_current_user(user)
         return result
+
+    def get_validated_token(self, raw_token):
+        conf = authentication_settings('TOKEN_CACHE')
+        if not conf['ENABLED']:
+            token = super().get_validated_token(raw_token)
+        else:
+            cache = get_token_cache()
+            key = token_key(raw_token)
+            token = cache.get(key)
+            if token is None:
+                token = super().get_validated_token(raw_token)
+                ttl = token.get('exp', 0) - time.time()
+                if ttl > 0:
+                    cache.set(key, token, ttl=ttl)
+        if conf['REVOKED_CHECK'] and _revoked_check(conf['REVOKED_CHECK'])(token):
+            raise InvalidToken(_("Token has been revoked"))
+        return token
+
+    def get_user(self, validated_token):
+        if not authentication_settings('USER_CACHE')['ENABLED']:
+            return super().get_user(validated_token)
+        try:
+            # Claims hold the id as a string in recent simplejwt versions
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        cache = get_user_cache()
+        user = cache.get(user_id)
+        if user is None:
+            # Raises for unknown and inactive users, which are never cached
+            user = super().get_user(validated_token)
+            cache.set(user_id, user)
+        else:
+            # Repeat simplejwt's checks, the token may be older than the entry
+            if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+                raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+            if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        # Requests get their own copy, so changes made to request.user never
+        # leak into the cache
+        return copy.copy(user)
+
+
+def token_key(raw_token):
+    """Token cache key of a raw token, so the cache never holds usable tokens"""
+    if isinstance(raw_token, str):
+        raw_token = raw_token.encode()
+    return hashlib.sha256(raw_token).digest()
+
+
+@lru_cache
+def _revoked_check(path):
+    return import_string(path)
+
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """Return the process-wide validated token cache, creating it on first use"""
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                conf = authentication_settings('TOKEN_CACHE')
+                _token_cache = TTLCache(max_size=conf['MAX_SIZE'], name='token')
+    return _token_cache
+
+
+def forget_token(raw_token):
+    """
+    Drop a token from the token cache, e.g. when revoking it, so that it is
+    validated again on its next use
+    """
+    get_token_cache().delete(token_key(raw_token))
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Return the process-wide user cache, creating it on first use"""
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                conf = authentication_settings('USER_CACHE')
+                _user_cache = TTLCache(max_size=conf['MAX_SIZE'], ttl=conf['TTL'], name='user')
+    return _user_cache
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """Drop a saved or deleted user from the user cache"""
+    get_user_cache().delete(str(getattr(instance, api_settings.USER_ID_FIELD)))
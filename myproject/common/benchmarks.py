@@ -0,0 +1,48 @@
+"""
+Helpers shared by the `bench_*` management commands
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+# Synthetic request durations in milliseconds, drawn from a random.Random
+DISTRIBUTIONS = {
+    'lognormal': lambda rng: rng.lognormvariate(3, 1),
+    'exponential': lambda rng: rng.expovariate(1 / 40),
+    'uniform': lambda rng: rng.uniform(1, 500),
+    'bimodal': lambda rng: rng.gauss(20, 3) if rng.random() < 0.9 else rng.gauss(900, 100),
+    'heavy-tail': lambda rng: rng.paretovariate(1.5) * 10,
+    'with-zeros': lambda rng: 0.0 if rng.random() < 0.2 else rng.lognormvariate(1, 2),
+}
+
+
+@contextmanager
+def benchmark_database(verbosity=0):
+    """
+    Run the benchmark against a throwaway test database so that it never
+    reads or writes real data
+    """
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+class Timer:
+    """Context manager measuring wall-clock and CPU time of a block"""
+
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.wall_start
+        self.cpu = time.process_time() - self.cpu_start
+
+    def rate(self, count):
+        """Operations per second of wall-clock time"""
+        return count / self.wall if self.wall else float('inf')
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+
+class TTLCache:
+    """
+    Bounded in-process cache. Entries expire `ttl` seconds after they are
+    set and the least recently used entry is evicted once `max_size`
+    entries are stored. Safe to share between threads.
+
+    Caches given a `name` also count their events in the live metrics,
+    labelled with it.
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0, name=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and entry[1] <= time.monotonic()
+            if expired:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._record('hit' if entry is not None else 'miss', resized=expired)
+        return entry[0] if entry is not None else default
+
+    def set(self, key, value, ttl=None):
+        """Store `value`, expiring after `ttl` seconds (default: the cache's ttl)"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        self._record('eviction', evicted, resized=True)
+
+    def delete(self, key):
+        with self._lock:
+            deleted = self._entries.pop(key, None) is not None
+            if deleted:
+                self.invalidations += 1
+        self._record('invalidation', int(deleted), resized=deleted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._record('invalidation', 0, resized=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _record(self, event, count=1, resized=False):
+        """Count `count` events in the live metrics, and the size if it changed"""
+        if self.name is None or not metrics.enabled():
+            return
+        if count:
+            metrics.CACHE_EVENTS.inc(self.name, event, amount=count)
+        if resized:
+            metrics.CACHE_ENTRIES.set(len(self._entries), self.name)
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
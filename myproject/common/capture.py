@@ -0,0 +1,192 @@
+"""
+Bounded capture of request bodies for API logging.
+
+Only a prefix of the body is ever read, and the bytes are handed back to
+the request stream so the view still sees the complete body.
+"""
+import random
+
+from .conf import api_logging_settings
+
+
+class PrefixedStream:
+    """
+    File-like wrapper returning already read `prefix` bytes before the rest
+    of the wrapped `stream`
+    """
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.stream.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix, b''
+            return data + self.stream.read()
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+    def readline(self, size=-1):
+        if not self.prefix:
+            return self.stream.readline(size)
+        end = self.prefix.find(b'\n')
+        if end != -1 and (size is None or size < 0 or end < size):
+            return self.read(end + 1)
+        if size is not None and 0 <= size <= len(self.prefix):
+            return self.read(size)
+        data, self.prefix = self.prefix, b''
+        remaining = -1 if size is None or size < 0 else size - len(data)
+        return data + self.stream.readline(remaining)
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        close = getattr(self.stream, 'close', None)
+        if close is not None:
+            close()
+
+
+def decode_prefix(data):
+    """
+    Decode a byte prefix as UTF-8, dropping a multi-byte character that was
+    cut in half at the end. Returns None for anything that isn't text.
+    """
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # At most 3 bytes of a 4-byte character can be left over
+        if e.start >= len(data) - 3 and e.reason == 'unexpected end of data':
+            return data[:e.start].decode('utf-8')
+        return None
+
+
+def sample_rate_for_path(path, rates, default):
+    """Return the rate of the longest prefix of `path` (or route template) in `rates`"""
+    best = None
+    for prefix in rates:
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return default if best is None else rates[best]
+
+
+def capture_request_body(request, route=None):
+    """
+    Capture at most `MAX_BYTES` of the request body without consuming the
+    stream for the view. Returns the decoded text, or None if the body is
+    empty, binary, skipped by its content type or not sampled.
+
+    `SAMPLE_RATES` are matched against the request's route template, like
+    the rates of `API_LOGGING['SAMPLING']`, or its path if it didn't resolve.
+    """
+    conf = api_logging_settings('BODY_CAPTURE')
+
+    content_type = (request.META.get('CONTENT_TYPE') or '').lower()
+    if content_type.startswith(tuple(conf['SKIP_CONTENT_TYPES'])):
+        return None
+
+    rate = sample_rate_for_path(route or request.path_info, conf['SAMPLE_RATES'], conf['DEFAULT_SAMPLE_RATE'])
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return None
+
+    limit = conf['MAX_BYTES']
+    # The body was already read into memory by someone else
+    if hasattr(request, '_body'):
+        return decode_prefix(request._body[:limit]) if request._body else None
+    if getattr(request, '_read_started', False) or not hasattr(request, '_stream'):
+        return None
+
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    # Bodies without a length are only possible under ASGI, where the body
+    # has already been spooled, so it's safe to peek at them too
+    if content_length == 0 and 'CONTENT_LENGTH' in request.META:
+        return None
+
+    size = limit if not content_length else min(limit, content_length)
+    stream = request._stream
+    seekable = getattr(stream, 'seekable', None)
+    if seekable is not None and seekable():
+        # e.g. the spooled body file of an ASGI request, which can just be rewound
+        position = stream.tell()
+        prefix = stream.read(size)
+        stream.seek(position)
+    else:
+        prefix = stream.read(size)
+        if prefix:
+            request._stream = PrefixedStream(prefix, stream)
+    return decode_prefix(prefix) if prefix else None
+
+
+def capture_response_body(response, limit=None):
+    """
+    Capture at most `limit` bytes of a non-streaming response body without
+    joining its content. Returns `(text, total_size)`.
+    """
+    if limit is None:
+        limit = api_logging_settings('RESPONSE_CAPTURE')['MAX_BYTES']
+
+    # HttpResponse keeps its content as a list of byte chunks
+    chunks = getattr(response, '_container', None)
+    if chunks is None:
+        chunks = [response.content]
+
+    prefix = []
+    captured = 0
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if captured < limit:
+            prefix.append(chunk[:limit - captured])
+            captured += len(prefix[-1])
+    data = b''.join(prefix)
+    return (decode_prefix(data) if data else None), size
+
+
+class StreamingResponseCapture:
+    """
+    Tee the first `limit` bytes of a streaming response as it is sent and
+    count its total size, without buffering the rest of the body
+    """
+
+    def __init__(self, limit=None):
+        if limit is None:
+            limit = api_logging_settings('RESPONSE_CAPTURE')['MAX_BYTES']
+        self.limit = limit
+        self.size = 0
+        self._prefix = []
+        self._captured = 0
+
+    def install(self, response):
+        """Wrap the streaming content of `response` in place"""
+        if response.is_async:
+            response.streaming_content = self._atee(response.streaming_content)
+        else:
+            response.streaming_content = self._tee(response.streaming_content)
+
+    @property
+    def body(self):
+        data = b''.join(self._prefix)
+        return decode_prefix(data) if data else None
+
+    def _record(self, chunk):
+        self.size += len(chunk)
+        if self._captured < self.limit:
+            self._prefix.append(chunk[:self.limit - self._captured])
+            self._captured += len(self._prefix[-1])
+
+    def _tee(self, iterator):
+        for chunk in iterator:
+            self._record(chunk)
+            yield chunk
+
+    async def _atee(self, iterator):
+        async for chunk in iterator:
+            self._record(chunk)
+            yield chunk
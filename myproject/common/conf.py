@@ -0,0 +1,240 @@
+from django.conf import settings
+
+# Defaults for the `API_LOGGING` setting. Each key is a section that can be
+# partially overridden in the settings module, e.g.
+#
+#     API_LOGGING = {
+#         'WRITER': {'BATCH_SIZE': 500},
+#     }
+DEFAULTS = {
+    'WRITER': {
+        # Write logs from a background thread instead of inside the response path
+        'ENABLED': True,
+        # Maximum number of records waiting to be written
+        'QUEUE_SIZE': 10000,
+        # Maximum number of records written with a single bulk_create
+        'BATCH_SIZE': 200,
+        # Seconds to wait for a batch to fill up before writing what we have
+        'FLUSH_INTERVAL': 1.0,
+        # What to do when the queue is full: 'drop_newest', 'drop_oldest' or 'block'
+        'FULL_POLICY': 'drop_newest',
+        # Seconds to wait for free space when FULL_POLICY is 'block'
+        'BLOCK_TIMEOUT': 0.05,
+        # Seconds to wait for pending records to be written on shutdown
+        'SHUTDOWN_TIMEOUT': 5.0,
+    },
+    'SINK': {
+        # Where log records go: 'common.sinks.DatabaseSink' or
+        # 'common.sinks.SegmentFileSink', or the dotted path of another BaseLogSink
+        'BACKEND': 'common.sinks.DatabaseSink',
+    },
+    'SEGMENTS': {
+        # Directory of the segment files (default: BASE_DIR / 'api_log_segments')
+        'DIRECTORY': None,
+        # A segment is sealed once it reaches this size in bytes...
+        'MAX_BYTES': 64 * 1024 * 1024,
+        # ...or this age in seconds
+        'MAX_AGE': 300.0,
+        # Records and seconds between fsyncs, whichever comes first
+        'FSYNC_RECORDS': 1000,
+        'FSYNC_INTERVAL': 1.0,
+        # Write buffer size in bytes
+        'BUFFER_SIZE': 64 * 1024,
+    },
+    'BODY_CAPTURE': {
+        # Maximum number of request body bytes read for the log
+        'MAX_BYTES': 10000,
+        # Content types whose bodies are never captured (prefix match)
+        'SKIP_CONTENT_TYPES': [
+            'multipart/', 'application/octet-stream', 'application/zip', 'application/gzip',
+            'application/pdf', 'image/', 'audio/', 'video/', 'font/',
+        ],
+        # Fraction of requests whose body is captured, by route template
+        # prefix like SAMPLING['ROUTES'] (longest prefix wins), e.g.
+        # {'/api/sample/': 0.1}. Requests that don't resolve use their path
+        'SAMPLE_RATES': {},
+        'DEFAULT_SAMPLE_RATE': 1.0,
+    },
+    'RESPONSE_CAPTURE': {
+        # Maximum number of response body bytes kept for the log
+        'MAX_BYTES': 10000,
+    },
+    'RETENTION': {
+        # Days logs are kept when no policy matches them
+        'DEFAULT_DAYS': 30,
+        # Policies checked in order, the first matching one applies, e.g.
+        # {'NAME': 'server errors', 'STATUS_MIN': 500, 'STATUS_MAX': 599, 'DAYS': 90}
+        # {'NAME': 'token', 'PATH_PREFIX': '/api/token/', 'DAYS': 7}
+        'POLICIES': [],
+        # Maximum number of logs deleted by one DELETE statement
+        'BATCH_SIZE': 5000,
+        # Seconds to sleep between batches
+        'SLEEP': 0.0,
+        # Days the minute/hour/day rollups are kept, None to keep them forever.
+        # Statistics reaching further back use whole hours, then whole days
+        'ROLLUP_DAYS': {'minute': 7, 'hour': 90, 'day': None},
+    },
+    'PAYLOADS': {
+        # Compression of stored headers and bodies: 'zstd', 'zlib' or None.
+        # zstd needs Python 3.14 or the zstandard package, zlib is used otherwise
+        'COMPRESSION': 'zstd',
+        # Compression level, None for the default of the algorithm
+        'LEVEL': None,
+        # Payloads smaller than this many bytes are stored uncompressed
+        'MIN_SIZE': 256,
+    },
+    'SEARCH': {
+        # Full-text index over paths, user agents, headers and bodies (SQLite only)
+        'ENABLED': True,
+        # Most logs a search returns
+        'MAX_RESULTS': 1000,
+    },
+    'PARTITIONING': {
+        # Write logs to one partition per period instead of the api_logs table
+        'ENABLED': False,
+        # 'day' or 'month'
+        'PERIOD': 'month',
+        # Directory of the per-period database files on SQLite
+        # (default: BASE_DIR / 'api_log_partitions')
+        'DIRECTORY': None,
+    },
+    'SAMPLING': {
+        # Log only a sample of the requests (see common.sampling)
+        'ENABLED': False,
+        # Fraction of requests logged, by route template prefix (longest
+        # prefix wins), e.g. {'/api/sample/sample/<int:pk>/': 0.01}
+        'ROUTES': {},
+        'DEFAULT_RATE': 1.0,
+        # Always log 4xx/5xx responses...
+        'KEEP_ERRORS': True,
+        # ...and requests taking at least this many milliseconds (None: no threshold)
+        'SLOW_MS': 1000,
+        # Most sampled logs written per route and second, None for no cap
+        'MAX_PER_SECOND': None,
+        # Logs a route can write at once after being idle (default: MAX_PER_SECOND)
+        'BURST': None,
+    },
+    'TIMING': {
+        # Return the SQL/auth/view/render breakdown of API requests in a
+        # Server-Timing header: True for every client, 'staff' for staff
+        # users (and everyone when DEBUG is on), False for nobody. It is
+        # recorded in the logs either way
+        'SERVER_TIMING': 'staff',
+    },
+}
+
+
+def api_logging_settings(section):
+    """Return a section of the `API_LOGGING` setting merged over its defaults"""
+    overrides = getattr(settings, 'API_LOGGING', {}).get(section, {})
+    return {**DEFAULTS[section], **overrides}
+
+
+# Defaults for the `AUTHENTICATION` setting, overridden per section like
+# `API_LOGGING`
+AUTHENTICATION_DEFAULTS = {
+    'USER_CACHE': {
+        # Cache the users of authenticated requests in memory, per process
+        'ENABLED': True,
+        # Maximum number of cached users, the least recently used are evicted
+        'MAX_SIZE': 1024,
+        # Seconds a user is cached. Saving or deleting a user drops it from the
+        # cache of the process doing it, other processes see the change once
+        # their entry expires
+        'TTL': 60.0,
+    },
+    'TOKEN_CACHE': {
+        # Cache validated access tokens in memory, per process, until they
+        # expire, skipping their signature check on later requests
+        'ENABLED': True,
+        # Maximum number of cached tokens, the least recently used are evicted
+        'MAX_SIZE': 4096,
+        # Dotted path of a `callable(token) -> bool` telling whether a
+        # validated token was revoked, called on every request, cached or not
+        'REVOKED_CHECK': None,
+    },
+}
+
+
+def authentication_settings(section):
+    """Return a section of the `AUTHENTICATION` setting merged over its defaults"""
+    overrides = getattr(settings, 'AUTHENTICATION', {}).get(section, {})
+    return {**AUTHENTICATION_DEFAULTS[section], **overrides}
+
+
+# Defaults for the `RESPONSE_CACHE` setting (see common.response_cache)
+RESPONSE_CACHE_DEFAULTS = {
+    # Cache the GET responses of views using CachedResponseMixin. Only enable
+    # it with a CACHE shared by all processes, such as Redis or Memcached: a
+    # per-process cache (LocMemCache) keeps serving responses another process
+    # has invalidated
+    'ENABLED': False,
+    # Alias of the Django cache holding versions and responses
+    'CACHE': 'default',
+    # Seconds a response is cached
+    'TIMEOUT': 300,
+}
+
+
+def response_cache_settings():
+    """Return the `RESPONSE_CACHE` setting merged over its defaults"""
+    return {**RESPONSE_CACHE_DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {})}
+
+
+# Defaults for the `METRICS` setting (see common.metrics)
+METRICS_DEFAULTS = {
+    # Count API requests for the /metrics endpoint
+    'ENABLED': True,
+    # Directory of the per-process metric files. Every process serving the
+    # API must use the same one, emptied when the server starts. Without it
+    # /metrics only reports the process answering the scrape
+    'DIRECTORY': None,
+    # Bearer token required to read /metrics. Without one only logged in
+    # staff users can read it, unless PUBLIC is True
+    'TOKEN': None,
+    'PUBLIC': False,
+}
+
+
+def metrics_settings():
+    """Return the `METRICS` setting merged over its defaults"""
+    return {**METRICS_DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+# Defaults for the `THROTTLING` setting (see common.throttling). Limits are
+# token buckets refilled at RATE ('<number>/<s|min|hour|day>') and holding
+# at most BURST tokens (default: the number of the rate)
+THROTTLING_DEFAULTS = {
+    'ENABLED': True,
+    # Alias of the database holding the buckets (the throttle_buckets table)
+    'DATABASE': 'default',
+    # Number of trusted reverse proxies in front of the API. Client IPs are
+    # taken from X-Forwarded-For only when set, REMOTE_ADDR otherwise, so
+    # clients can't pick their bucket. None uses REST_FRAMEWORK['NUM_PROXIES']
+    'NUM_PROXIES': None,
+    # Limits per throttle scope, per client IP and per username. Scopes set
+    # in the settings replace the default of the same name
+    'SCOPES': {
+        'token_obtain': {
+            'IP': {'RATE': '20/min', 'BURST': 10},
+            'USERNAME': {'RATE': '5/min', 'BURST': 5},
+        },
+        'token_refresh': {
+            'IP': {'RATE': '60/min', 'BURST': 20},
+        },
+        'token_info': {
+            'IP': {'RATE': '120/min', 'BURST': 30},
+            'USERNAME': {'RATE': '60/min', 'BURST': 20},
+        },
+    },
+}
+
+
+def throttling_settings():
+    """Return the `THROTTLING` setting merged over its defaults"""
+    overrides = getattr(settings, 'THROTTLING', {})
+    return {
+        **THROTTLING_DEFAULTS,
+        **overrides,
+        'SCOPES': {**THROTTLING_DEFAULTS['SCOPES'], **overrides.get('SCOPES', {})},
+    }
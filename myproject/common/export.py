@@ -0,0 +1,166 @@
+"""
+Streaming export of API logs as NDJSON or CSV.
+
+Logs are read in keyset batches on `(request_timestamp, id)`, oldest
+first, each batch through `.iterator()`, and encoded as they are read, so
+memory use doesn't grow with the size of the export. Used by the
+`api-logs/export/` endpoint and the `export_api_logs` command.
+"""
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from .payloads import PAYLOAD_FIELDS, decode
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Exported columns: output name -> model attribute
+EXPORT_FIELDS = {
+    'id': 'id',
+    'method': 'method',
+    'path': 'path',
+    'route': 'route',
+    'query_params': 'query_params',
+    'request_user': 'request_user_id',
+    'request_ip': 'request_ip',
+    'response_status_code': 'response_status_code',
+    'response_size': 'response_size',
+    'request_timestamp': 'request_timestamp',
+    'response_timestamp': 'response_timestamp',
+    'duration_ms': 'duration_ms',
+    'sql_count': 'sql_count',
+    'sql_time_ms': 'sql_time_ms',
+    'auth_time_ms': 'auth_time_ms',
+    'view_time_ms': 'view_time_ms',
+    'render_time_ms': 'render_time_ms',
+    'sample_weight': 'sample_weight',
+    'user_agent': 'user_agent',
+    'content_type': 'content_type',
+}
+
+BATCH_SIZE = 2000
+
+# Bytes of output gathered before a chunk is yielded
+CHUNK_SIZE = 64 * 1024
+
+
+def _isoformat(value):
+    # Like the API: full precision, UTC as Z
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def field_names(payloads=False):
+    return [*EXPORT_FIELDS, *(PAYLOAD_FIELDS if payloads else ())]
+
+
+def iter_rows(querysets, payloads=False, batch_size=BATCH_SIZE):
+    """
+    Yield the logs of `querysets` as dicts, one queryset after the other and
+    oldest first within each. With `payloads`, headers and bodies are
+    included, decoded from the payload store.
+    """
+    columns = list(EXPORT_FIELDS.values())
+    if payloads:
+        for field in PAYLOAD_FIELDS.values():
+            columns += [f'{field}__encoding', f'{field}__data']
+    names = list(EXPORT_FIELDS)
+    payload_names = list(PAYLOAD_FIELDS) if payloads else []
+
+    for queryset in querysets:
+        queryset = queryset.order_by('request_timestamp', 'id').values_list(*columns)
+        last = None
+        while True:
+            batch = queryset
+            if last is not None:
+                timestamp, pk = last
+                batch = batch.filter(
+                    Q(request_timestamp__gte=timestamp)
+                    & (Q(request_timestamp__gt=timestamp) | Q(id__gt=pk))
+                )
+            count = 0
+            for row in batch[:batch_size].iterator(chunk_size=batch_size):
+                count += 1
+                record = dict(zip(names, row))
+                for index, name in enumerate(payload_names):
+                    encoding, data = row[len(names) + 2 * index:len(names) + 2 * index + 2]
+                    record[name] = decode(encoding, data) if data is not None else None
+                last = record['request_timestamp'], record['id']
+                for name in ('request_timestamp', 'response_timestamp'):
+                    if record[name] is not None:
+                        record[name] = _isoformat(record[name])
+                yield record
+            if count < batch_size:
+                break
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, separators=(',', ':')) + '\n'
+
+
+class _Echo:
+    """File-like object returning what is written, for `csv.writer`"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def export_chunks(querysets, export_format='ndjson', compress=False, payloads=False, batch_size=BATCH_SIZE):
+    """Bytes of the export of `querysets`, in chunks of about CHUNK_SIZE"""
+    rows = iter_rows(querysets, payloads=payloads, batch_size=batch_size)
+    if export_format == 'csv':
+        lines = csv_lines(rows, field_names(payloads))
+    else:
+        lines = ndjson_lines(rows)
+
+    # gzip container, compressed as it streams
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            chunk = ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = ''.join(buffer).encode('utf-8')
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+async def aexport_chunks(*args, **kwargs):
+    """
+    `export_chunks` as an async iterator, for ASGI servers, which read sync
+    iterators to the end before sending anything. Each chunk is produced in
+    the thread running the request's sync code, with its connection.
+    """
+    chunks = export_chunks(*args, **kwargs)
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,238 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from django.db import connection, transaction
+
+from .conf import api_logging_settings
+
+FULL_POLICIES = ('drop_newest', 'drop_oldest', 'block')
+
+
+class APILogWriter:
+    """
+    Background writer for API logs.
+
+    Records are put on a bounded in-process queue by the middleware and a
+    single worker thread drains the queue, writing them with `bulk_create`
+    in batches of up to `batch_size` records or every `flush_interval`
+    seconds, whichever comes first.
+    """
+
+    def __init__(self, queue_size=10000, batch_size=200, flush_interval=1.0,
+                 full_policy='drop_newest', block_timeout=0.05, shutdown_timeout=5.0):
+        if full_policy not in FULL_POLICIES:
+            raise ValueError(f"Unknown full policy {full_policy!r}, expected one of {FULL_POLICIES}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+        self.shutdown_timeout = shutdown_timeout
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pid = None
+
+        # Counters
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    @classmethod
+    def from_settings(cls):
+        conf = api_logging_settings('WRITER')
+        return cls(
+            queue_size=conf['QUEUE_SIZE'],
+            batch_size=conf['BATCH_SIZE'],
+            flush_interval=conf['FLUSH_INTERVAL'],
+            full_policy=conf['FULL_POLICY'],
+            block_timeout=conf['BLOCK_TIMEOUT'],
+            shutdown_timeout=conf['SHUTDOWN_TIMEOUT'],
+        )
+
+    def submit(self, record, block=True):
+        """
+        Queue a log record for writing. Never raises and never blocks for
+        longer than `block_timeout`, or at all when `block` is False.
+        Returns False if the record was dropped.
+        """
+        self._ensure_started()
+        try:
+            if self.full_policy == 'block' and block:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            if self.full_policy != 'drop_oldest':
+                self._count('dropped')
+                return False
+            # Make room by discarding the oldest pending record
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self._count('dropped')
+                return False
+        self._count('enqueued')
+        return True
+
+    def flush(self, timeout=None):
+        """Block until all records queued so far have been written"""
+        if self._thread is None or not self._thread.is_alive():
+            self._drain()
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+
+    def close(self):
+        """Stop the worker thread after writing any pending records"""
+        self._stopping.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(self.shutdown_timeout)
+        self._drain()
+
+    def stats(self):
+        return {
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'pending': self._queue.qsize(),
+        }
+
+    def _count(self, name, value=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def _ensure_started(self):
+        # The pid check restarts the worker in processes forked after the
+        # writer was created (e.g. gunicorn with --preload)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._stopping.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='api-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                batch = self._collect_batch()
+                if batch:
+                    self._write(batch)
+        finally:
+            connection.close()
+
+    def _collect_batch(self):
+        """Wait for the first record, then gather more until the batch is full or the interval passes"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        """Write everything left in the queue from the calling thread"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            write_records(batch, batch_size=self.batch_size)
+            self._count('flushed', len(batch))
+            self._count('batches')
+        except Exception as e:
+            # Don't let one bad batch stop the writer
+            self._count('failed', len(batch))
+            print(f"Error writing API logs: {e}")
+            connection.close()
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+
+def write_records(records, batch_size=None):
+    """
+    Insert log records (dicts of APILog field values) and add them to the
+    rollups in a single transaction, or one per group of partitions when
+    they span more partitions than a transaction can use. Returns the
+    created logs.
+    """
+    from . import partitions
+    from .models import APILog
+
+    if not partitions.enabled():
+        return _write_groups({APILog: records}, batch_size)
+    logs = []
+    for groups in partitions.group_records(records):
+        logs += _write_groups(groups, batch_size)
+    return logs
+
+
+def _write_groups(groups, batch_size):
+    from .payloads import store_records
+    from .rollups import apply_records
+    from .search import index_logs
+
+    with transaction.atomic():
+        logs = []
+        for model, model_records in groups.items():
+            created = model.objects.bulk_create(
+                [model(**record) for record in store_records(model_records)], batch_size=batch_size
+            )
+            index_logs([log.id for log in created], model_records, model=model)
+            logs += created
+        apply_records([record for model_records in groups.values() for record in model_records])
+    return logs
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer():
+    """Return the process-wide log writer, creating it on first use"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = APILogWriter.from_settings()
+                atexit.register(_writer.close)
+    return _writer
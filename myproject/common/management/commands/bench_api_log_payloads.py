@@ -0,0 +1,141 @@
+import json
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from common.benchmarks import Timer, benchmark_database
+from common.models import APILog
+from common.payloads import PAYLOAD_FIELDS, compression, store_records
+
+
+def inline_model():
+    """APILog with the payloads stored in the row, as before the payload store"""
+    attrs = {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {'app_label': 'common', 'db_table': 'bench_inline_api_logs'}),
+    }
+    for field in APILog._meta.local_fields:
+        if field.name in PAYLOAD_FIELDS.values():
+            continue
+        clone = field.clone()
+        if field.is_relation:
+            clone.remote_field.related_name = '+'
+        attrs[field.name] = clone
+    for name in PAYLOAD_FIELDS:
+        attrs[name] = models.TextField(blank=True, null=True)
+    return type('BenchInlineAPILog', (models.Model,), attrs)
+
+
+class Command(BaseCommand):
+    help = 'Compare row size and scan speed of API logs with inline payloads and with the payload store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--logs',
+            type=int,
+            default=20000,
+            help='Number of synthetic logs (default: 20000)'
+        )
+        parser.add_argument(
+            '--distinct-bodies',
+            type=int,
+            default=200,
+            help='Number of distinct response bodies the logs share (default: 200)'
+        )
+        parser.add_argument(
+            '--scans',
+            type=int,
+            default=5,
+            help='Number of full scans timed per layout (default: 5)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        records = self._records(options['logs'], options['distinct_bodies'], random.Random(options['seed']))
+        self.stdout.write(f'{len(records)} logs, payload compression: {compression() or "none"}')
+
+        with benchmark_database():
+            inline = inline_model()
+            with connection.schema_editor() as editor:
+                editor.create_model(inline)
+
+            with Timer() as timer, transaction.atomic():
+                inline.objects.bulk_create([inline(**record) for record in records], batch_size=500)
+            self._report('inline payloads', inline, timer, len(records), options['scans'])
+
+            with Timer() as timer, transaction.atomic():
+                APILog.objects.bulk_create(
+                    [APILog(**record) for record in store_records(records)], batch_size=500
+                )
+            self._report('payload store', APILog, timer, len(records), options['scans'], payloads=True)
+
+    def _records(self, count, distinct_bodies, rng):
+        now = timezone.now()
+        bodies = [
+            json.dumps({
+                'results': [{'id': rng.randrange(10 ** 6), 'name': f'item {j}'} for j in range(rng.randint(1, 40))]
+            })
+            for _ in range(distinct_bodies)
+        ]
+        user_agents = [f'Mozilla/5.0 (bench {i}) AppleWebKit/537.36 (KHTML, like Gecko)' for i in range(5)]
+        records = []
+        for i in range(count):
+            user_agent = rng.choice(user_agents)
+            method = 'POST' if rng.random() < 0.2 else 'GET'
+            records.append({
+                'method': method,
+                'path': f'/api/sample/{rng.randrange(50)}/',
+                'request_headers': json.dumps({
+                    'Host': 'localhost:8000', 'User-Agent': user_agent, 'Accept': 'application/json',
+                    'Accept-Encoding': 'gzip, deflate, br', 'Accept-Language': 'en-US,en;q=0.9',
+                }),
+                'request_body': json.dumps({'name': f'item {i}'}) if method == 'POST' else None,
+                'response_status_code': 200,
+                'response_headers': json.dumps({
+                    'Content-Type': 'application/json', 'Vary': 'Accept, Origin', 'Allow': 'GET, POST, HEAD, OPTIONS',
+                    'X-Frame-Options': 'DENY', 'X-Content-Type-Options': 'nosniff',
+                }),
+                'response_body': rng.choice(bodies),
+                'request_timestamp': now - timedelta(seconds=i),
+                'response_timestamp': now - timedelta(seconds=i),
+                'duration_ms': rng.lognormvariate(3, 1),
+                'user_agent': user_agent,
+                'content_type': 'application/json',
+            })
+        return records
+
+    def _report(self, name, model, timer, count, scans, payloads=False):
+        row_bytes = self._table_bytes(model._meta.db_table)
+        # duration_ms has no index, so this reads every row
+        scan = model.objects.filter(duration_ms__gte=0)
+        with Timer() as scan_timer:
+            for _ in range(scans):
+                scan.aggregate(count=Count('id'), average=Avg('duration_ms'))
+
+        self.stdout.write(f'{name}:')
+        self.stdout.write(f'  write {timer.rate(count):,.0f} logs/s')
+        if row_bytes is not None:
+            self.stdout.write(f'  api_logs {row_bytes / count:,.0f} bytes/row')
+            if payloads:
+                total = row_bytes + self._table_bytes('api_log_payloads')
+                self.stdout.write(f'  with payloads {total / count:,.0f} bytes/row')
+        self.stdout.write(f'  scan {scan_timer.rate(count * scans):,.0f} rows/s')
+
+    def _table_bytes(self, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SELECT pg_table_size(%s)', [table])
+            else:
+                return None
+            return cursor.fetchone()[0]
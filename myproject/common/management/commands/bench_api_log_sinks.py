@@ -0,0 +1,84 @@
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from common.benchmarks import Timer, benchmark_database
+from common.log_writer import get_log_writer
+from common.models import APILog
+from common.sinks import DatabaseSink, SegmentFileSink
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-request cost of logging to the database and to segment files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=5000,
+            help='Number of logs written per sink (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        with benchmark_database(), tempfile.TemporaryDirectory() as directory:
+            runs = [
+                ('database, inline insert', DatabaseSink(), {'ENABLED': False}),
+                ('database, background writer', DatabaseSink(), {'ENABLED': True}),
+                ('segment files', SegmentFileSink(directory), {'ENABLED': False}),
+            ]
+            for name, sink, writer in runs:
+                conf = dict(settings.API_LOGGING, WRITER=dict(settings.API_LOGGING.get('WRITER', {}), **writer))
+                with override_settings(API_LOGGING=conf):
+                    records = self._records(count)
+                    durations = []
+                    with Timer() as timer:
+                        for record in records:
+                            start = time.perf_counter()
+                            sink.write(record)
+                            durations.append(time.perf_counter() - start)
+                    with Timer() as flush_timer:
+                        sink.close()
+                        if writer['ENABLED']:
+                            get_log_writer().flush()
+
+                durations.sort()
+                self.stdout.write(f'{name}:')
+                self.stdout.write(
+                    f'  per request: mean {timer.wall / count * 1e6:,.1f}us, '
+                    f'p50 {durations[count // 2] * 1e6:,.1f}us, p99 {durations[int(count * 0.99)] * 1e6:,.1f}us'
+                )
+                self.stdout.write(f'  flush/close {flush_timer.wall * 1000:,.1f}ms')
+
+            before = APILog.objects.count()
+            with Timer() as load_timer:
+                call_command('load_api_log_segments', directory=directory, verbosity=0)
+            loaded = APILog.objects.count() - before
+            self.stdout.write(f'segment load: {loaded} logs, {load_timer.rate(loaded):,.0f} logs/s')
+
+    def _records(self, count):
+        now = timezone.now()
+        return [
+            {
+                'method': 'GET',
+                'path': f'/api/sample/sample/{i}/',
+                'route': '/api/sample/sample/<int:pk>/',
+                'request_headers': '{"Host": "localhost:8000", "Accept": "application/json"}',
+                'response_status_code': 200,
+                'response_headers': '{"Content-Type": "application/json"}',
+                'response_body': '{"id": %d, "name": "item"}' % i,
+                'response_size': 30,
+                'request_timestamp': now - timedelta(milliseconds=count - i),
+                'response_timestamp': now - timedelta(milliseconds=count - i),
+                'duration_ms': 1.5,
+                'user_agent': 'bench',
+                'content_type': 'application/json',
+            }
+            for i in range(count)
+        ]
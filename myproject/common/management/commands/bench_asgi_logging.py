@@ -0,0 +1,132 @@
+import asyncio
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from common.benchmarks import Timer, benchmark_database
+from common.sinks import get_log_sink
+from middlewares.api_logging import APILoggingMiddleware
+from middlewares.current_user import CurrentUserMiddleware
+
+THREAD_ADAPTED_MIDDLEWARE = {
+    'middlewares.current_user.CurrentUserMiddleware':
+        'common.management.commands.bench_asgi_logging.ThreadAdaptedCurrentUserMiddleware',
+    'middlewares.api_logging.APILoggingMiddleware':
+        'common.management.commands.bench_asgi_logging.ThreadAdaptedAPILoggingMiddleware',
+}
+
+
+class ThreadAdaptedCurrentUserMiddleware(CurrentUserMiddleware):
+    """Sync-only variant, which Django runs in a thread under ASGI"""
+    async_capable = False
+
+
+class ThreadAdaptedAPILoggingMiddleware(APILoggingMiddleware):
+    """Sync-only variant, which Django runs in a thread under ASGI"""
+    async_capable = False
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ASGI throughput with thread-adapted and native async logging middlewares'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help='Number of requests per run (default: 2000)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Number of concurrent requests (default: 50)'
+        )
+        parser.add_argument(
+            '--without',
+            action='append',
+            default=[],
+            metavar='MIDDLEWARE',
+            help='Dotted path of a middleware to leave out of the stack (can be repeated)'
+        )
+        parser.add_argument(
+            '--path',
+            default='/api/sample/hello/',
+            help='Path to request (default: /api/sample/hello/)'
+        )
+
+    def handle(self, *args, **options):
+        native = [m for m in settings.MIDDLEWARE if m not in options['without']]
+        thread_adapted = [THREAD_ADAPTED_MIDDLEWARE.get(m, m) for m in native]
+        runs = [
+            ('native', native),
+            ('thread-adapted', thread_adapted),
+        ]
+
+        with benchmark_database():
+            for name, middleware in runs:
+                with override_settings(MIDDLEWARE=middleware):
+                    handler = ASGIHandler()
+                    # Warm up URL resolvers, connections and the log writer
+                    asyncio.run(self._run(handler, options['path'], 50, options['concurrency']))
+                    get_log_sink().flush()
+
+                    with Timer() as timer:
+                        statuses = asyncio.run(
+                            self._run(handler, options['path'], options['requests'], options['concurrency'])
+                        )
+                    get_log_sink().flush()
+
+                errors = sum(1 for status in statuses if status >= 500)
+                self.stdout.write(
+                    f'{name:>15}: {timer.rate(len(statuses)):8.1f} req/s '
+                    f'({timer.wall * 1000 / len(statuses):.3f} ms/req, cpu {timer.cpu:.2f}s, errors {errors})'
+                )
+
+    async def _run(self, handler, path, count, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                return await self._request(handler, path)
+
+        return await asyncio.gather(*(one() for _ in range(count)))
+
+    @staticmethod
+    async def _request(handler, path):
+        """Send a single GET request straight to the ASGI handler"""
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+        request_sent = False
+        disconnected = asyncio.Event()
+        status = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await handler(scope, receive, send)
+        disconnected.set()
+        return status[0]
@@ -0,0 +1,63 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common.authentication import CustomJWTAuthentication, get_token_cache, get_user_cache
+from common.benchmarks import Timer, benchmark_database
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of authenticating a request with and without the token and user caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=10000,
+            help='Number of requests authenticated per run (default: 10000)'
+        )
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        runs = [
+            ('no caches', False, False),
+            ('token cache', True, False),
+            ('user cache', False, True),
+            ('token and user caches', True, True),
+        ]
+        with benchmark_database():
+            user = get_user_model().objects.create_user('bench', password='bench')
+            request = RequestFactory().get(
+                '/api/token/info/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}'
+            )
+            authentication = CustomJWTAuthentication()
+
+            for name, token_cache, user_cache in runs:
+                get_token_cache().clear()
+                get_user_cache().clear()
+                conf = {
+                    'TOKEN_CACHE': {'ENABLED': token_cache},
+                    'USER_CACHE': {'ENABLED': user_cache},
+                }
+                durations = []
+                queries = []
+                with override_settings(AUTHENTICATION=conf), connection.execute_wrapper(
+                    lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)
+                ):
+                    with Timer() as timer:
+                        for _ in range(count):
+                            start = time.perf_counter()
+                            authentication.authenticate(request)
+                            durations.append(time.perf_counter() - start)
+
+                durations.sort()
+                self.stdout.write(f'{name}:')
+                self.stdout.write(
+                    f'  per request: mean {timer.wall / count * 1e6:,.1f}us, '
+                    f'p50 {durations[count // 2] * 1e6:,.1f}us, p99 {durations[int(count * 0.99)] * 1e6:,.1f}us'
+                )
+                self.stdout.write(f'  queries: {len(queries) / count:.3f} per request')
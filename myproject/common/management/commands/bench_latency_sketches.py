@@ -0,0 +1,72 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.benchmarks import DISTRIBUTIONS, Timer
+from common.rollups import PERCENTILES
+from common.sketches import DDSketch
+
+
+class Command(BaseCommand):
+    help = 'Check the accuracy of the latency sketches against exact percentiles on synthetic data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--values',
+            type=int,
+            default=100000,
+            help='Number of synthetic durations per distribution (default: 100000)'
+        )
+        parser.add_argument(
+            '--buckets',
+            type=int,
+            default=100,
+            help='Number of sketches the durations are split into and merged from (default: 100)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        failures = []
+
+        for name, distribution in DISTRIBUTIONS.items():
+            values = [max(distribution(rng), 0.0) for _ in range(options['values'])]
+
+            # Fill one sketch per bucket, round trip them through storage and merge
+            sketches = [DDSketch() for _ in range(options['buckets'])]
+            with Timer() as add_timer:
+                for i, value in enumerate(values):
+                    sketches[i % len(sketches)].add(value)
+            stored = [sketch.to_json() for sketch in sketches]
+            merged = DDSketch()
+            with Timer() as merge_timer:
+                for data in stored:
+                    merged.merge(DDSketch.from_json(data))
+
+            exact = sorted(values)
+            errors = []
+            for label, q in PERCENTILES + (('max', 1.0),):
+                expected = exact[int(q * (len(exact) - 1))]
+                estimate = merged.quantile(q)
+                error = abs(estimate - expected) / expected if expected else abs(estimate)
+                errors.append(f'{label} {estimate:10.3f} / {expected:10.3f} ({error:.4%})')
+                if error > merged.relative_accuracy + 1e-9:
+                    failures.append(f'{name} {label}: {estimate} vs {expected}')
+
+            self.stdout.write(f'{name}:')
+            for line in errors:
+                self.stdout.write(f'  {line}')
+            self.stdout.write(
+                f'  add {add_timer.rate(len(values)):,.0f} values/s, '
+                f'merge {merge_timer.rate(len(stored)):,.0f} sketches/s, '
+                f'{sum(map(len, stored)) / len(stored):,.0f} bytes/sketch'
+            )
+
+        if failures:
+            raise CommandError('Sketch error above the relative accuracy: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('All percentiles within the relative accuracy'))
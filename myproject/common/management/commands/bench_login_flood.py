@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+
+from common.benchmarks import benchmark_database
+from common.models import ThrottleBucket
+
+
+class Command(BaseCommand):
+    help = 'Measure worker CPU under a flood of failed logins, with and without throttling'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker processes flooded (default: 4)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=20.0,
+            help='Login attempts sent to each worker per second (default: 20)'
+        )
+        parser.add_argument(
+            '--seconds',
+            type=float,
+            default=30.0,
+            help='Duration of each flood in seconds (default: 30)'
+        )
+        parser.add_argument(
+            '--ips',
+            type=int,
+            default=2,
+            help='Number of client IPs the flood comes from (default: 2)'
+        )
+        parser.add_argument(
+            '--usernames',
+            type=int,
+            default=20,
+            help='Number of usernames tried (default: 20)'
+        )
+
+    def handle(self, *args, **options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # A file the workers share the throttle buckets through, as in
+                # production, rather than an in-memory database each fork copies
+                test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+            try:
+                with benchmark_database():
+                    get_user_model().objects.create_user('bench', password='correct horse battery staple')
+                    for name, enabled in [('without throttling', False), ('with throttling', True)]:
+                        ThrottleBucket.objects.all().delete()
+                        with override_settings(THROTTLING={'ENABLED': enabled}):
+                            results = self._flood(options)
+                        self._report(name, results, options)
+            finally:
+                test_settings['NAME'] = old_test_name
+
+    def _flood(self, options):
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        usernames = ['bench'] + [f'user{i}' for i in range(options['usernames'] - 1)]
+        ips = [f'203.0.113.{i + 1}' for i in range(options['ips'])]
+
+        def worker(seed):
+            rng = random.Random(seed)
+            client = Client()
+            statuses = Counter()
+            cpu_start = time.process_time()
+            start = time.perf_counter()
+            deadline = start + options['seconds']
+            # Attempts arrive at a fixed rate, whether or not the worker keeps up
+            for attempt in range(int(options['rate'] * options['seconds'])):
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                scheduled = start + attempt / options['rate']
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+                response = client.post(
+                    '/api/token/',
+                    {'username': rng.choice(usernames), 'password': 'wrong password'},
+                    REMOTE_ADDR=rng.choice(ips),
+                )
+                statuses[response.status_code] += 1
+            queue.put((time.process_time() - cpu_start, dict(statuses)))
+
+        # Workers are forked and open their own connections to the benchmark database
+        connections.close_all()
+        processes = [context.Process(target=worker, args=(i,)) for i in range(options['workers'])]
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return results
+
+    def _report(self, name, results, options):
+        seconds = options['seconds']
+        cpu = sum(cpu_seconds for cpu_seconds, _ in results)
+        statuses = Counter()
+        for _, counts in results:
+            statuses.update(counts)
+        total = sum(statuses.values())
+        throttled = statuses.get(429, 0)
+        offered = options['rate'] * options['workers']
+        self.stdout.write(f'{name}:')
+        self.stdout.write(
+            f'  {total / seconds:,.1f} attempts/s handled of {offered:,.0f}/s sent, '
+            f'{(total - throttled) / seconds:,.2f} password checks/s, {throttled / seconds:,.1f} throttled/s'
+        )
+        self.stdout.write(
+            f'  worker CPU {cpu / seconds:.2f} cores, '
+            f'{cpu / total * 1000 if total else 0:,.1f}ms per attempt'
+        )
@@ -0,0 +1,74 @@
+import multiprocessing
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from common.benchmarks import Timer
+from common.metrics import MetricsRegistry
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of recording request metrics and of scraping them as traffic grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=4,
+            help='Number of worker processes recording metrics (default: 4)'
+        )
+        parser.add_argument(
+            '--routes',
+            type=int,
+            default=50,
+            help='Number of distinct routes (default: 50)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help='Total numbers of requests recorded before each scrape (default: 10000 100000 1000000)'
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS={'DIRECTORY': directory}):
+            registry = MetricsRegistry()
+            requests = registry.counter('requests_total', 'Requests', ('method', 'route', 'status'))
+            duration = registry.histogram('duration_seconds', 'Duration', ('method', 'route', 'status'))
+            routes = [f'/api/bench/{i}/<int:pk>/' for i in range(options['routes'])]
+
+            def record(count, seed):
+                rng = random.Random(seed)
+                for _ in range(count):
+                    labels = ('GET', rng.choice(routes), 200 if rng.random() < 0.95 else 500)
+                    requests.inc(*labels)
+                    duration.observe(rng.lognormvariate(-4, 1), *labels)
+
+            with Timer() as timer:
+                record(50000, 0)
+            self.stdout.write(f'Recording: {timer.wall / 50000 * 1e9:,.0f}ns per request (one process)')
+
+            # Workers are forked, so each one writes a file of its own
+            context = multiprocessing.get_context('fork')
+            recorded = 50000
+            for total in sorted(options['requests']):
+                per_process = max(total - recorded, 0) // options['processes']
+                workers = [
+                    context.Process(target=record, args=(per_process, total + i))
+                    for i in range(options['processes'])
+                ]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                recorded += per_process * options['processes']
+
+                with Timer() as timer:
+                    text = registry.exposition()
+                self.stdout.write(
+                    f'Scrape after {recorded:>10,} requests: {timer.wall * 1000:7.2f}ms, '
+                    f'{len(text.splitlines()):,} lines'
+                )
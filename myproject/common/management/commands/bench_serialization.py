@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.sample.models import Sample
+from api.sample.serializers import SampleSerializer
+from common.benchmarks import Timer, benchmark_database
+from common.models import APILog
+from common.serializers import APILogSummarySerializer
+from common.values import ValuesSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the ModelSerializer and ValuesSerializer paths of the read-only list endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            nargs='+',
+            default=[10000, 100000],
+            help='Numbers of rows serialized (default: 10000 100000)'
+        )
+
+    def handle(self, *args, **options):
+        sizes = options['rows']
+        with benchmark_database():
+            self._populate(max(sizes))
+            cases = [
+                ('api logs', APILogSummarySerializer, APILog.objects.only(*APILogSummarySerializer.Meta.fields)),
+                ('samples', SampleSerializer, Sample.objects.all()),
+            ]
+            for name, serializer_class, queryset in cases:
+                for size in sizes:
+                    queryset = queryset.order_by('-id')
+                    with Timer() as model_timer:
+                        expected = serializer_class(queryset[:size], many=True).data
+                    values = ValuesSerializer(serializer_class)
+                    with Timer() as values_timer:
+                        data = values.serialize(values.rows(queryset)[:size])
+                    if data != list(expected):
+                        raise CommandError(f'{name}: the two paths serialized {size} rows differently')
+
+                    self.stdout.write(f'{name}, {size} rows:')
+                    for label, timer in (('ModelSerializer', model_timer), ('ValuesSerializer', values_timer)):
+                        self.stdout.write(
+                            f'  {label:<16} {timer.rate(size):>10,.0f} rows/s ({timer.wall * 1000:,.0f}ms)'
+                        )
+
+    def _populate(self, count):
+        user = get_user_model().objects.create_user('bench')
+        now = timezone.now()
+        with transaction.atomic():
+            APILog.objects.bulk_create(
+                [
+                    APILog(
+                        method='GET',
+                        path=f'/api/sample/sample/{i}/',
+                        route='/api/sample/sample/<int:pk>/',
+                        request_user=user if i % 2 else None,
+                        response_status_code=200 if i % 10 else 404,
+                        request_timestamp=now - timedelta(seconds=count - i),
+                        response_timestamp=now - timedelta(seconds=count - i),
+                        duration_ms=1.0 + i % 100 / 7,
+                    )
+                    for i in range(count)
+                ],
+                batch_size=5000,
+            )
+            Sample.objects.bulk_create(
+                [
+                    Sample(name=f'sample {i}', description=f'description {i}' if i % 3 else None, created_by=user)
+                    for i in range(count)
+                ],
+                batch_size=5000,
+            )
@@ -1,7 +1,11 @@
+from datetime import timedelta
 from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
 from django.utils import timezone
-from datetime import timedelta
-from common.models import APILog
+from common import partitions, rollups
+from common.conf import api_logging_settings
+from common.payloads import collect_garbage
+from common.retention import RetentionEngine, expired_partitions, policies_from_settings
 
 
 class Command(BaseCommand):
@@ -11,52 +15,117 @@ class Command(BaseCommand):
         parser.add_argument(
             '--days',
             type=int,
-            default=30,
-            help='Delete logs older than this many days (default: 30)'
+            default=None,
+            help='Delete logs older than this many days when no retention policy matches them '
+                 '(default: API_LOGGING["RETENTION"]["DEFAULT_DAYS"], 30)'
         )
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Show what would be deleted without actually deleting'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Maximum number of logs deleted per batch (default: API_LOGGING["RETENTION"]["BATCH_SIZE"])'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=None,
+            help='Seconds to sleep between batches (default: API_LOGGING["RETENTION"]["SLEEP"])'
+        )
+        parser.add_argument(
+            '--start-id',
+            type=int,
+            default=None,
+            help='Resume an interrupted cleanup from this log id'
+        )
 
     def handle(self, *args, **options):
-        days = options['days']
+        conf = api_logging_settings('RETENTION')
+        policies, default_days = policies_from_settings()
+        days = options['days'] if options['days'] is not None else default_days
         dry_run = options['dry_run']
 
-        cutoff_date = timezone.now() - timedelta(days=days)
-
-        # Get logs to delete
-        logs_to_delete = APILog.objects.filter(
-            request_timestamp__lt=cutoff_date
+        now = timezone.now()
+        engine_options = dict(
+            batch_size=options['batch_size'] or conf['BATCH_SIZE'],
+            sleep=options['sleep'] if options['sleep'] is not None else conf['SLEEP'],
+            now=now,
         )
+        engines = [RetentionEngine(policies, days, **engine_options)]
 
-        count = logs_to_delete.count()
+        for policy in policies:
+            self.stdout.write(f'Keeping logs matching {policy} for {policy.days} days')
+
+        if partitions.enabled():
+            # Whole partitions past every retention are dropped, the rows of
+            # those overlapping the cutoffs are deleted like the main table's
+            dropped = expired_partitions(policies, days, now)
+            for key in dropped:
+                if dry_run:
+                    self.stdout.write(self.style.WARNING(f'DRY RUN: Would drop partition {key}'))
+                else:
+                    partitions.drop_partition(key)
+                    self.stdout.write(f'Dropped partition {key}')
+            cutoff = now - timedelta(days=engines[0].shortest_days())
+            for key in partitions.partitions_between(end=cutoff)[::-1]:
+                if key not in dropped:
+                    engines.append(
+                        RetentionEngine(policies, days, model=partitions.partition_model(key), **engine_options)
+                    )
 
         if dry_run:
+            for granularity, rows in rollups.prune(now, dry_run=True).items():
+                if rows:
+                    self.stdout.write(self.style.WARNING(f'DRY RUN: Would delete {rows} {granularity} rollup rows'))
+            count = sum(engine.expired_logs().count() for engine in engines)
             self.stdout.write(
                 self.style.WARNING(
                     f'DRY RUN: Would delete {count} API logs older than {days} days'
                 )
             )
             if count > 0:
+                timestamps = [
+                    engine.expired_logs().aggregate(oldest=Min('request_timestamp'), newest=Max('request_timestamp'))
+                    for engine in engines
+                ]
                 self.stdout.write(
-                    f'Oldest log: {logs_to_delete.earliest("request_timestamp").request_timestamp}'
+                    f'Oldest log: {min(value["oldest"] for value in timestamps if value["oldest"])}'
                 )
                 self.stdout.write(
-                    f'Newest log to delete: {logs_to_delete.latest("request_timestamp").request_timestamp}'
+                    f'Newest log to delete: {max(value["newest"] for value in timestamps if value["newest"])}'
                 )
-        else:
-            if count > 0:
-                logs_to_delete.delete()
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Successfully deleted {count} API logs older than {days} days'
-                    )
+            return
+
+        def progress(deleted, total, last_id):
+            self.stdout.write(
+                f'Deleted {deleted} logs ({total} in total), done up to id {last_id}. '
+                f'Resume with --start-id {last_id + 1}'
+            )
+
+        count = 0
+        for engine in engines:
+            count += engine.run(
+                start_id=options['start_id'], progress=progress if options['verbosity'] > 0 else None
+            )
+        payloads = collect_garbage(batch_size=engine_options['batch_size'])
+        if payloads:
+            self.stdout.write(f'Deleted {payloads} payloads no longer used by any log')
+        for granularity, rows in rollups.prune(now, batch_size=engine_options['batch_size']).items():
+            if rows:
+                self.stdout.write(f'Deleted {rows} {granularity} rollup rows past their retention')
+        if count > 0:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Successfully deleted {count} API logs older than {days} days'
                 )
-            else:
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'No API logs older than {days} days found'
-                    )
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'No API logs older than {days} days found'
                 )
+            )
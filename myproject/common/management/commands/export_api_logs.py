@@ -0,0 +1,83 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from rest_framework.exceptions import ValidationError
+
+from common.export import BATCH_SIZE, EXPORT_FORMATS, export_chunks
+from common.views import APILogFilter, filter_log_querysets
+
+
+class Command(BaseCommand):
+    help = 'Export API logs as NDJSON or CSV, streamed so that memory use stays constant'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            dest='export_format',
+            choices=EXPORT_FORMATS,
+            default='ndjson',
+            help='Output format (default: ndjson)'
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='File written to, "-" for stdout (default: -)'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output with gzip'
+        )
+        parser.add_argument(
+            '--payloads',
+            action='store_true',
+            help='Include request/response headers and bodies'
+        )
+        parser.add_argument(
+            '--filter',
+            action='append',
+            default=[],
+            metavar='NAME=VALUE',
+            help=f'API log filter, as accepted by the API ({", ".join(APILogFilter.Meta.fields)}). Repeatable'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Number of logs read per query (default: {BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for item in options['filter']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError(f'Invalid filter {item!r}, expected NAME=VALUE')
+            params.appendlist(name, value)
+        try:
+            querysets = filter_log_querysets(params)
+        except ValidationError as e:
+            raise CommandError(f'Invalid filters: {e.detail}')
+
+        chunks = export_chunks(
+            querysets,
+            options['export_format'],
+            compress=options['gzip'],
+            payloads=options['payloads'],
+            batch_size=options['batch_size'],
+        )
+        size = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        if options['output'] != '-':
+            self.stdout.write(
+                self.style.SUCCESS(f'Successfully exported API logs to {options["output"]} ({size:,} bytes)')
+            )
@@ -0,0 +1,92 @@
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.conf import api_logging_settings
+from common.log_writer import write_records
+from common.sinks import OPEN_SUFFIX, SEGMENT_SUFFIX, SegmentReader, sealed_segments
+
+
+class Command(BaseCommand):
+    help = 'Load the API log segment files written by SegmentFileSink into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            default=None,
+            help='Segment directory (default: API_LOGGING["SEGMENTS"]["DIRECTORY"])'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of logs inserted per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--include-open',
+            action='store_true',
+            help='Also load the complete records of segments still being written'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep sealed segments once loaded instead of deleting them'
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(
+            options['directory'] or api_logging_settings('SEGMENTS')['DIRECTORY']
+            or settings.BASE_DIR / 'api_log_segments'
+        )
+        paths = sealed_segments(directory)
+        if options['include_open'] and directory.exists():
+            paths += sorted(directory.glob(f'*{SEGMENT_SUFFIX}{OPEN_SUFFIX}'))
+
+        total = 0
+        for path in paths:
+            count = self._load(path, options['batch_size'])
+            total += count
+            sealed = not path.name.endswith(OPEN_SUFFIX)
+            if sealed and not options['keep']:
+                path.unlink()
+                self._offset_path(path).unlink(missing_ok=True)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Loaded {count} logs from {path.name}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully loaded {total} API logs from {len(paths)} segments')
+        )
+
+    def _load(self, path, batch_size):
+        """
+        Insert the records of a segment after the last loaded offset,
+        recording the offset after each batch so that an interrupted load
+        resumes where it stopped
+        """
+        offset_path = self._offset_path(path)
+        offset = int(offset_path.read_text()) if offset_path.exists() else 0
+        count = 0
+        batch = []
+        for record, end in SegmentReader(path, offset):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                count += self._write(batch, offset_path, end)
+                batch = []
+            offset = end
+        if batch:
+            count += self._write(batch, offset_path, offset)
+        return count
+
+    def _write(self, batch, offset_path, end):
+        write_records(batch, batch_size=len(batch))
+        temporary = offset_path.with_name(offset_path.name + '.tmp')
+        temporary.write_text(str(end))
+        os.replace(temporary, offset_path)
+        return len(batch)
+
+    @staticmethod
+    def _offset_path(path):
+        # Shared by a segment before and after it is sealed
+        return path.with_name(path.name.removesuffix(OPEN_SUFFIX) + '.offset')
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from django.utils import timezone
+from datetime import timedelta
+from common.models import APILog
+from common import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the API log rollups used by the statistics endpoint from the raw logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=1,
+            help='Rebuild the rollups of the last this many days (default: 1)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild the rollups of every day that has logs'
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            bounds = APILog.objects.aggregate(start=Min('request_timestamp'), end=Max('request_timestamp'))
+            if bounds['start'] is None:
+                self.stdout.write(self.style.SUCCESS('No API logs found'))
+                return
+            start, end = bounds['start'], bounds['end']
+        else:
+            end = timezone.now()
+            start = end - timedelta(days=options['days'])
+
+        days = rollups.rebuild(start, end)
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully rebuilt API log rollups for {days} days')
+        )
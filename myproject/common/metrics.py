@@ -0,0 +1,382 @@
+"""
+Live request metrics shared by all worker processes.
+
+Counters, gauges and fixed-bucket histograms are kept in a memory-mapped
+file per process (`METRICS['DIRECTORY']`), so recording a value is a
+dictionary lookup and a write to memory, and a worker being recycled
+doesn't lose what it counted. `/metrics` merges the files of every
+process into the Prometheus text format: its cost depends on the number
+of series and processes, not on the number of requests.
+
+Without a directory values are kept in anonymous memory and only the
+process serving the scrape is reported.
+
+Each file is a sequence of entries appended as new series appear: the
+length of a JSON key, the key padded to 8 bytes and a float64 value. The
+first 8 bytes hold the number of bytes in use.
+"""
+import json
+import os
+import struct
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from mmap import mmap
+from pathlib import Path
+
+from .conf import metrics_settings
+
+INITIAL_SIZE = 64 * 1024
+
+# Methods counted under their own label, any other is counted as 'other'
+# so clients can't create series at will
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'))
+
+# Upper bounds of the request duration buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_USED = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+
+def _entries(data, used):
+    """Yield the `(key, value, value offset)` entries of a values file"""
+    offset = _USED.size
+    while offset < used:
+        length, = _LENGTH.unpack_from(data, offset)
+        key_end = offset + _LENGTH.size + length
+        value_offset = key_end + (-key_end % 8)
+        value, = _VALUE.unpack_from(data, value_offset)
+        yield data[offset + _LENGTH.size:key_end].decode('utf-8'), value, value_offset
+        offset = value_offset + _VALUE.size
+
+
+class ValueFile:
+    """Values of the current process, in a memory-mapped file or anonymous memory"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._file = None
+        if path is None:
+            self._map = mmap(-1, INITIAL_SIZE)
+        else:
+            self._file = open(path, 'a+b')
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._file.truncate(INITIAL_SIZE)
+            self._map = mmap(self._file.fileno(), 0)
+        self._used = _USED.unpack_from(self._map, 0)[0] or _USED.size
+        self._offsets = {key: offset for key, _, offset in _entries(self._map, self._used)}
+
+    def add(self, key, amount):
+        offset = self._offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def set(self, key, value):
+        offset = self._offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        _VALUE.pack_into(self._map, offset, value)
+
+    def items(self):
+        return [(key, value) for key, value, _ in _entries(self._map, self._used)]
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        key_end = self._used + _LENGTH.size + len(encoded)
+        value_offset = key_end + (-key_end % 8)
+        end = value_offset + _VALUE.size
+        if end > len(self._map):
+            self._grow(end)
+        _LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + _LENGTH.size:key_end] = encoded
+        _VALUE.pack_into(self._map, value_offset, 0.0)
+        # Readers only see the entry once it is complete
+        self._used = end
+        _USED.pack_into(self._map, 0, end)
+        self._offsets[key] = value_offset
+        return value_offset
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        if self._file is None:
+            grown = mmap(-1, size)
+            grown[:len(self._map)] = self._map[:]
+        else:
+            self._map.close()
+            self._file.truncate(size)
+            grown = mmap(self._file.fileno(), 0)
+        self._map = grown
+
+
+def read_values(path):
+    """Entries of another process's values file"""
+    data = Path(path).read_bytes()
+    if len(data) < _USED.size:
+        return []
+    used = _USED.unpack_from(data, 0)[0]
+    return [(key, value) for key, value, _ in _entries(data, min(used, len(data)))]
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+
+    def _key(self, labels):
+        key = self._keys.get(labels)
+        if key is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+            key = self._keys[labels] = json.dumps([self.name, [str(label) for label in labels]])
+        return key
+
+    def samples(self, values):
+        """Exposition lines of the `(labels, value)` pairs merged for this metric"""
+        for labels, value in sorted(values):
+            yield f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self.registry.add(self._key(labels), amount)
+
+
+class Gauge(Metric):
+    """Per-process value, summed over the processes still running"""
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        self.registry.add(self._key(labels), amount)
+
+    def dec(self, *labels, amount=1):
+        self.registry.add(self._key(labels), -amount)
+
+    def set(self, value, *labels):
+        self.registry.set(self._key(labels), value)
+
+
+class Histogram(Metric):
+    """
+    Counts of observations per bucket, plus their sum. Buckets are stored
+    individually and made cumulative when exposed.
+    """
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _key(self, labels):
+        keys = self._keys.get(labels)
+        if keys is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+            labels_list = [str(label) for label in labels]
+            keys = self._keys[labels] = (
+                [json.dumps([self.name, labels_list, bound]) for bound in (*self.buckets, '+Inf')],
+                json.dumps([self.name, labels_list, 'sum']),
+            )
+        return keys
+
+    def observe(self, value, *labels):
+        buckets, total = self._key(labels)
+        self.registry.observe(buckets[bisect_left(self.buckets, value)], total, value)
+
+    def samples(self, values):
+        series = defaultdict(lambda: ([0.0] * (len(self.buckets) + 1), [0.0]))
+        bounds = {bound: index for index, bound in enumerate((*self.buckets, '+Inf'))}
+        for (labels, part), value in values:
+            counts, total = series[labels]
+            if part == 'sum':
+                total[0] += value
+            elif part in bounds:
+                counts[bounds[part]] += value
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                bucket_labels = _format_labels((*self.labelnames, 'le'), (*labels, _format_value(bound)))
+                yield f'{self.name}_bucket{bucket_labels} {_format_value(cumulative)}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total[0])}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(cumulative)}'
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return value
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsRegistry:
+    """Metrics of the application and the values file of this process"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._values = None
+        self._pid = None
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add(self, key, amount):
+        with self._lock:
+            self._file().add(key, amount)
+
+    def set(self, key, value):
+        with self._lock:
+            self._file().set(key, value)
+
+    def observe(self, bucket_key, sum_key, value):
+        with self._lock:
+            values = self._file()
+            values.add(bucket_key, 1)
+            values.add(sum_key, value)
+
+    def _file(self):
+        # A forked worker gets a file of its own, the parent keeps counting in its own
+        pid = os.getpid()
+        if self._pid != pid:
+            directory = metrics_settings()['DIRECTORY']
+            path = None
+            if directory:
+                Path(directory).mkdir(parents=True, exist_ok=True)
+                path = Path(directory) / f'metrics_{pid}.db'
+            self._values = ValueFile(path)
+            self._pid = pid
+        return self._values
+
+    def collect(self):
+        """Values of every process merged per metric: {metric: [(labels, value)]}"""
+        with self._lock:
+            own = self._file()
+            sources = [(True, own.items())]
+        if own.path is not None:
+            for path in own.path.parent.glob('metrics_*.db'):
+                if path == own.path:
+                    continue
+                try:
+                    pid = int(path.stem.split('_', 1)[1])
+                except ValueError:
+                    continue
+                sources.append((_process_alive(pid), read_values(path)))
+
+        merged = defaultdict(float)
+        for alive, items in sources:
+            for key, value in items:
+                name, labels, *part = json.loads(key)
+                metric = self._metrics.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                merged[(name, tuple(labels), *part)] += value
+
+        collected = defaultdict(list)
+        for (name, labels, *part), value in merged.items():
+            collected[name].append(((labels, part[0]), value) if part else (labels, value))
+        return collected
+
+    def exposition(self):
+        """All metrics in the Prometheus text format"""
+        collected = self.collect()
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric.samples(collected.get(name, [])))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter(
+    'api_requests_total', 'API requests handled', ('method', 'route', 'status'),
+)
+REQUEST_DURATION = registry.histogram(
+    'api_request_duration_seconds', 'Duration of API requests in seconds', ('method', 'route', 'status'),
+)
+REQUESTS_IN_PROGRESS = registry.gauge(
+    'api_requests_in_progress', 'API requests being handled',
+)
+SQL_QUERIES = registry.counter(
+    'api_sql_queries_total', 'SQL queries run by API requests', ('method', 'route'),
+)
+
+THROTTLED = registry.counter(
+    'api_throttled_total', 'Requests rejected by throttling', ('scope', 'limit'),
+)
+
+RESPONSE_CACHE_REQUESTS = registry.counter(
+    'api_response_cache_requests_total', 'GET requests served by the response cache', ('model', 'result'),
+)
+RESPONSE_CACHE_BYTES_SAVED = registry.counter(
+    'api_response_cache_bytes_saved_total', 'Response bytes not sent thanks to 304 responses', ('model',),
+)
+
+CACHE_EVENTS = registry.counter(
+    'api_cache_events_total', 'Hits, misses, evictions and invalidations of in-process caches', ('cache', 'event'),
+)
+CACHE_ENTRIES = registry.gauge(
+    'api_cache_entries', 'Entries held by in-process caches', ('cache',),
+)
+
+
+def enabled():
+    return metrics_settings()['ENABLED']
+
+
+def record_request(method, route, status, duration_ms, sql_count):
+    """Count a finished API request"""
+    route = route or ''
+    if method not in METHODS:
+        method = 'other'
+    REQUESTS.inc(method, route, status)
+    REQUEST_DURATION.observe(duration_ms / 1000, method, route, status)
+    SQL_QUERIES.inc(method, route, amount=sql_count)
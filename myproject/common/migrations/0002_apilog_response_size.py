@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-17 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apilog',
+            name='response_size',
+            field=models.BigIntegerField(blank=True, help_text='Response body size in bytes', null=True),
+        ),
+    ]
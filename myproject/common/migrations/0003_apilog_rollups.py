@@ -0,0 +1,49 @@
+# Generated by Django 6.1.2 on 2026-10-17 18:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_apilog_response_size'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APILogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=6)),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket')),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('status_code', models.IntegerField()),
+                ('request_count', models.BigIntegerField(default=0)),
+                ('duration_sum', models.FloatField(default=0, help_text='Sum of request durations in milliseconds')),
+                ('duration_min', models.FloatField(blank=True, null=True)),
+                ('duration_max', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'api_log_rollups',
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'method', 'path', 'status_code'), name='api_log_rollups_unique_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='APILogUserRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=6)),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket')),
+                ('request_count', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'api_log_user_rollups',
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'user'), name='api_log_user_rollups_unique_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.1.2 on 2026-10-17 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_apilog_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APILogLatencySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=6)),
+                ('bucket', models.DateTimeField(help_text='Start of the time bucket')),
+                ('path', models.CharField(max_length=500)),
+                ('sketch', models.TextField(help_text='Serialized DDSketch of request durations in milliseconds')),
+                ('version', models.PositiveIntegerField(default=0, help_text='Incremented on every update')),
+            ],
+            options={
+                'db_table': 'api_log_latency_sketches',
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'path'), name='api_log_latency_sketches_unique_key')],
+            },
+        ),
+    ]
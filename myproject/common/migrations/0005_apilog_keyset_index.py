@@ -0,0 +1,23 @@
+# Generated by Django 6.1.2 on 2026-10-17 18:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_apilog_latency_sketches'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='apilog',
+            name='api_logs_request_d14007_idx',
+        ),
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['request_timestamp', 'id'], name='api_logs_request_690790_idx'),
+        ),
+    ]
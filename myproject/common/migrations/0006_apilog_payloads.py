@@ -0,0 +1,152 @@
+# Generated by Django 6.1.2 on 2026-10-17 18:57
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+BATCH_SIZE = 1000
+
+# Frozen copies of the helpers of common.payloads at the time of this
+# migration, so that later changes to the module don't change what it does
+PAYLOAD_FIELDS = {
+    'request_headers': 'request_headers_payload',
+    'request_body': 'request_body_payload',
+    'response_headers': 'response_headers_payload',
+    'response_body': 'response_body_payload',
+}
+
+MIN_SIZE = 256
+
+
+def encode(text):
+    """Return `(digest, encoding, data, size)` of a payload, zlib compressed"""
+    raw = text.encode('utf-8')
+    digest = hashlib.blake2b(raw, digest_size=20).hexdigest()
+    if len(raw) >= MIN_SIZE:
+        data = zlib.compress(raw)
+        if len(data) < len(raw):
+            return digest, 'zlib', data, len(raw)
+    return digest, '', raw, len(raw)
+
+
+def decode(encoding, data):
+    data = bytes(data)
+    if encoding == 'zstd':
+        if zstd is None:
+            raise RuntimeError('Reading zstd payloads requires Python 3.14 or the zstandard package')
+        if hasattr(zstd, 'ZstdDecompressor') and not hasattr(zstd, 'decompress'):
+            data = zstd.ZstdDecompressor().decompress(data)
+        else:
+            data = zstd.decompress(data)
+    elif encoding == 'zlib':
+        data = zlib.decompress(data)
+    return data.decode('utf-8')
+
+
+def move_payloads(apps, schema_editor):
+    APILog = apps.get_model('common', 'APILog')
+    APILogPayload = apps.get_model('common', 'APILogPayload')
+    last_id = 0
+    while True:
+        logs = list(APILog.objects.filter(id__gt=last_id).order_by('id').only('id', *PAYLOAD_FIELDS)[:BATCH_SIZE])
+        if not logs:
+            break
+        payloads = {}
+        for log in logs:
+            for field, fk in PAYLOAD_FIELDS.items():
+                text = getattr(log, field)
+                if text is not None:
+                    digest, encoding, data, size = encode(text)
+                    payloads[digest] = APILogPayload(digest=digest, encoding=encoding, data=data, size=size)
+                    setattr(log, f'{fk}_id', digest)
+        APILogPayload.objects.bulk_create(payloads.values(), ignore_conflicts=True)
+        APILog.objects.bulk_update(logs, list(PAYLOAD_FIELDS.values()))
+        last_id = logs[-1].id
+
+
+def restore_payloads(apps, schema_editor):
+    APILog = apps.get_model('common', 'APILog')
+    APILogPayload = apps.get_model('common', 'APILogPayload')
+    last_id = 0
+    while True:
+        logs = list(APILog.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not logs:
+            break
+        digests = {getattr(log, f'{fk}_id') for log in logs for fk in PAYLOAD_FIELDS.values()}
+        payloads = APILogPayload.objects.in_bulk(digests - {None})
+        for log in logs:
+            for field, fk in PAYLOAD_FIELDS.items():
+                payload = payloads.get(getattr(log, f'{fk}_id'))
+                setattr(log, field, decode(payload.encoding, payload.data) if payload else None)
+        APILog.objects.bulk_update(logs, list(PAYLOAD_FIELDS))
+        last_id = logs[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_apilog_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APILogPayload',
+            fields=[
+                ('digest', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('encoding', models.CharField(blank=True, max_length=10)),
+                ('data', models.BinaryField()),
+                ('size', models.IntegerField(help_text='Uncompressed size in bytes')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'api_log_payloads',
+            },
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='request_body_payload',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='common.apilogpayload'),
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='request_headers_payload',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='common.apilogpayload'),
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='response_body_payload',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='common.apilogpayload'),
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='response_headers_payload',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='common.apilogpayload'),
+        ),
+        migrations.RunPython(move_payloads, restore_payloads),
+        migrations.RemoveField(
+            model_name='apilog',
+            name='request_body',
+        ),
+        migrations.RemoveField(
+            model_name='apilog',
+            name='request_headers',
+        ),
+        migrations.RemoveField(
+            model_name='apilog',
+            name='response_body',
+        ),
+        migrations.RemoveField(
+            model_name='apilog',
+            name='response_headers',
+        ),
+    ]
@@ -0,0 +1,163 @@
+# Generated by Django 6.1.2 on 2026-10-17 19:00
+
+import json
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import migrations, models
+from django.urls import Resolver404, resolve
+
+BATCH_SIZE = 1000
+
+# Most bins of a latency sketch, as in common.sketches.DDSketch
+MAX_SKETCH_BINS = 2048
+
+
+@lru_cache(maxsize=None)
+def route_for(path):
+    """Route template `path` resolves to, or None"""
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    return '/' + match.route
+
+
+def backfill_log_routes(apps, schema_editor):
+    APILog = apps.get_model('common', 'APILog')
+    last_id = 0
+    while True:
+        rows = list(APILog.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'path')[:BATCH_SIZE])
+        if not rows:
+            break
+        ids_by_route = defaultdict(list)
+        for pk, path in rows:
+            ids_by_route[route_for(path)].append(pk)
+        for route, ids in ids_by_route.items():
+            if route is not None:
+                APILog.objects.filter(id__in=ids).update(route=route)
+        last_id = rows[-1][0]
+
+
+def merge_rollup_counts(kept, row):
+    kept.request_count += row.request_count
+    kept.duration_sum += row.duration_sum
+    kept.duration_min = min(value for value in (kept.duration_min, row.duration_min, float('inf')) if value is not None)
+    kept.duration_max = max(value for value in (kept.duration_max, row.duration_max, float('-inf')) if value is not None)
+
+
+def merge_sketches(kept, row):
+    """Merge two serialized DDSketches, a frozen copy of DDSketch.merge"""
+    sketch = json.loads(kept.sketch)
+    other = json.loads(row.sketch)
+    bins = {int(key): count for key, count in sketch['b'].items()}
+    for key, count in other['b'].items():
+        bins[int(key)] = bins.get(int(key), 0) + count
+    if len(bins) > MAX_SKETCH_BINS:
+        # Fold the lowest bins together
+        keys = sorted(bins)
+        excess = keys[:len(keys) - MAX_SKETCH_BINS + 1]
+        bins[keys[len(excess)]] += sum(bins.pop(key) for key in excess)
+    sketch['b'] = bins
+    sketch['z'] += other['z']
+    sketch['n'] += other['n']
+    sketch['s'] += other['s']
+    if other['min'] is not None:
+        sketch['min'] = other['min'] if sketch['min'] is None else min(sketch['min'], other['min'])
+        sketch['max'] = other['max'] if sketch['max'] is None else max(sketch['max'], other['max'])
+    kept.sketch = json.dumps(sketch, separators=(',', ':'))
+
+
+def merge_rows(model, rows, key_fields, merged_fields, merge):
+    kept = {}
+    duplicates = []
+    for row in rows:
+        key = tuple(getattr(row, field) for field in key_fields)
+        if key in kept:
+            merge(kept[key], row)
+            duplicates.append(row.pk)
+        else:
+            kept[key] = row
+    model.objects.bulk_update(kept.values(), ['route', *merged_fields], batch_size=BATCH_SIZE)
+    model.objects.filter(pk__in=duplicates).delete()
+
+
+def rekey_by_route(model, key_fields, merged_fields, merge):
+    """Key rows by the route of their path, merging rows that end up with the same key"""
+    rows = []
+    current = None
+    for row in model.objects.order_by('granularity', 'bucket', 'id').iterator():
+        if (row.granularity, row.bucket) != current:
+            merge_rows(model, rows, key_fields, merged_fields, merge)
+            rows = []
+            current = (row.granularity, row.bucket)
+        row.route = route_for(row.path) or ''
+        rows.append(row)
+    merge_rows(model, rows, key_fields, merged_fields, merge)
+
+
+def rekey_rollups(apps, schema_editor):
+    rekey_by_route(
+        apps.get_model('common', 'APILogRollup'),
+        ['method', 'route', 'status_code'],
+        ['request_count', 'duration_sum', 'duration_min', 'duration_max'],
+        merge_rollup_counts,
+    )
+    rekey_by_route(apps.get_model('common', 'APILogLatencySketch'), ['route'], ['sketch'], merge_sketches)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_apilog_payloads'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='apiloglatencysketch',
+            name='api_log_latency_sketches_unique_key',
+        ),
+        migrations.RemoveConstraint(
+            model_name='apilogrollup',
+            name='api_log_rollups_unique_key',
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='route',
+            field=models.CharField(blank=True, help_text='URL pattern the path resolved to', max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='apiloglatencysketch',
+            name='route',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='route',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['route'], name='api_logs_route_4ab79d_idx'),
+        ),
+        migrations.RunPython(backfill_log_routes, migrations.RunPython.noop),
+        migrations.RunPython(rekey_rollups, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='apiloglatencysketch',
+            name='path',
+        ),
+        migrations.RemoveField(
+            model_name='apilogrollup',
+            name='path',
+        ),
+        migrations.AddConstraint(
+            model_name='apiloglatencysketch',
+            constraint=models.UniqueConstraint(fields=('granularity', 'bucket', 'route'), name='api_log_latency_sketches_unique_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='apilogrollup',
+            constraint=models.UniqueConstraint(fields=('granularity', 'bucket', 'method', 'route', 'status_code'), name='api_log_rollups_unique_key'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.1.2 on 2026-10-17 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_apilog_route'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apilog',
+            name='auth_time_ms',
+            field=models.FloatField(blank=True, help_text='Authentication time in milliseconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='render_time_ms',
+            field=models.FloatField(blank=True, help_text='Response rendering time in milliseconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='sql_count',
+            field=models.IntegerField(blank=True, help_text='Number of SQL queries', null=True),
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='sql_time_ms',
+            field=models.FloatField(blank=True, help_text='Time spent in SQL queries in milliseconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='apilog',
+            name='view_time_ms',
+            field=models.FloatField(blank=True, help_text='View time in milliseconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='auth_time_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='render_time_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='sql_count_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='sql_time_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='timed_count',
+            field=models.BigIntegerField(default=0, help_text='Number of requests with a duration breakdown'),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='view_time_sum',
+            field=models.FloatField(default=0),
+        ),
+    ]
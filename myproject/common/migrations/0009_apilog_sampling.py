@@ -0,0 +1,46 @@
+# Generated by Django 6.1.2 on 2026-10-17 19:27
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_request_counts(apps, schema_editor):
+    # Rollups written before sampling counted every request once
+    APILogRollup = apps.get_model('common', 'APILogRollup')
+    APILogRollup.objects.using(schema_editor.connection.alias).update(weighted_count=F('request_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_apilog_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apilog',
+            name='sample_weight',
+            field=models.FloatField(blank=True, help_text='Number of requests this log stands for when sampling, null for 1', null=True),
+        ),
+        migrations.AddField(
+            model_name='apilogrollup',
+            name='weighted_count',
+            field=models.FloatField(default=0, help_text='Estimated number of requests'),
+        ),
+        migrations.AlterField(
+            model_name='apilogrollup',
+            name='request_count',
+            field=models.BigIntegerField(default=0, help_text='Number of logs'),
+        ),
+        migrations.AlterField(
+            model_name='apilogrollup',
+            name='sql_count_sum',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='apilogrollup',
+            name='timed_count',
+            field=models.FloatField(default=0, help_text='Number of requests with a duration breakdown'),
+        ),
+        migrations.RunPython(copy_request_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.1.2 on 2026-10-17 19:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0009_apilog_sampling'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['request_headers_payload'], name='api_logs_request_a9cec0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['request_body_payload'], name='api_logs_request_6406cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['response_headers_payload'], name='api_logs_respons_d50a29_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apilog',
+            index=models.Index(fields=['response_body_payload'], name='api_logs_respons_e0e77c_idx'),
+        ),
+    ]
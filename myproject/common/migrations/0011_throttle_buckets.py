@@ -0,0 +1,25 @@
+# Generated by Django 6.1.2 on 2026-10-17 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0010_apilog_payload_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField(help_text='Tokens left after the last request')),
+                ('updated', models.FloatField(help_text='Unix time of the last request')),
+                ('full_at', models.FloatField(db_index=True, help_text='Unix time the bucket is full again')),
+            ],
+            options={
+                'db_table': 'throttle_buckets',
+            },
+        ),
+    ]
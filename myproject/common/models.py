@@ -4,6 +4,69 @@ import json
 from django.utils import timezone
 
 from middlewares.current_user import CurrentUserMiddleware
+from .capture import capture_response_body
+from .response_cache import invalidate_model
+from .routes import request_route
+from .sinks import get_log_sink
+
+
+def audit_user():
+    """The authenticated user of the current request, or None"""
+    current_user = CurrentUserMiddleware.get_current_user()
+    if current_user and current_user.is_authenticated:
+        return current_user
+    return None
+
+
+class AuditQuerySet(models.QuerySet):
+    """
+    Bulk operations of `BaseModel`s, which skip `save()`, stamping the audit
+    fields from the current user like `save()` does and invalidating the
+    response cache of the model
+    """
+
+    def _invalidate(self):
+        if self.model.VERSIONED_CACHE:
+            invalidate_model(self.model, using=self.db)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        # Only resolve the user if some object needs it
+        if any(obj.created_by_id is None or obj.updated_by_id is None for obj in objs):
+            user = audit_user()
+            if user is not None:
+                for obj in objs:
+                    if obj.created_by_id is None:
+                        obj.created_by = user
+                    if obj.updated_by_id is None:
+                        obj.updated_by = user
+        created = super().bulk_create(objs, *args, **kwargs)
+        self._invalidate()
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        # auto_now fields aren't updated by bulk_update
+        now = timezone.now()
+        user = audit_user()
+        for obj in objs:
+            obj.updated_at = now
+            if user is not None:
+                obj.updated_by = user
+        fields = [*fields, *(field for field in ('updated_at', 'updated_by') if field not in fields)]
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        self._invalidate()
+        return updated
+
+    def update(self, **kwargs):
+        updated = super().update(**kwargs)
+        self._invalidate()
+        return updated
+
+    def delete(self):
+        deleted = super().delete()
+        self._invalidate()
+        return deleted
 
 
 class BaseModel(models.Model):
@@ -16,16 +79,90 @@ class BaseModel(models.Model):
     )
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AuditQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
+    # Invalidate the response cache of the model on writes (see
+    # common.response_cache)
+    VERSIONED_CACHE = False
+
+    # Always written when a loaded object is saved
+    AUDIT_UPDATE_FIELDS = ('updated_by', 'updated_at')
+
+    @classmethod
+    def from_db(cls, db, field_names, values, **kwargs):
+        instance = super().from_db(db, field_names, values, **kwargs)
+        # Snapshot of the loaded values, compared on save. Values aren't
+        # copied, so in-place changes of mutable values go unnoticed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if '_loaded_values' in self.__dict__:
+            if fields is None:
+                attnames = [f.attname for f in self._meta.concrete_fields]
+            else:
+                attnames = [self._meta.get_field(name).attname for name in fields]
+            self._loaded_values.update(
+                (attname, self.__dict__[attname]) for attname in attnames if attname in self.__dict__
+            )
+
+    def changed_fields(self):
+        """Attribute names of the fields changed since the object was loaded or saved"""
+        loaded = self.__dict__.get('_loaded_values')
+        if loaded is None:
+            return None
+        return [
+            attname for attname, value in loaded.items()
+            if attname in self.__dict__ and self.__dict__[attname] != value
+        ]
+
     def save(self, *args, **kwargs):
-        current_user = CurrentUserMiddleware.get_current_user()
-        if current_user and current_user.is_authenticated:
-            if not self.created_by:
+        update_fields = kwargs.get('update_fields')
+        changed = None
+        if (
+            update_fields is None and not args and not kwargs.get('force_insert')
+            and not self._state.adding
+        ):
+            changed = self.changed_fields()
+        if changed is not None and self._meta.pk.attname in changed:
+            # Saving under another primary key writes every field
+            changed = None
+        if changed is not None:
+            changed = [attname for attname in changed if attname not in ('updated_by_id', 'updated_at')]
+            if not changed:
+                # Nothing to write
+                return
+            kwargs['update_fields'] = [*changed, *self.AUDIT_UPDATE_FIELDS]
+
+        current_user = audit_user()
+        if current_user:
+            if self.created_by_id is None:
                 self.created_by = current_user
+                if changed is not None:
+                    kwargs['update_fields'].append('created_by')
             self.updated_by = current_user
         super(BaseModel, self).save(*args, **kwargs)
+        if self.VERSIONED_CACHE:
+            invalidate_model(type(self), using=self._state.db)
+
+        saved = kwargs.get('update_fields')
+        if saved is None:
+            attnames = [f.attname for f in self._meta.concrete_fields]
+        else:
+            attnames = [self._meta.get_field(name).attname for name in saved]
+        self.__dict__.setdefault('_loaded_values', {}).update(
+            (attname, self.__dict__[attname]) for attname in attnames if attname in self.__dict__
+        )
+
+    def delete(self, *args, **kwargs):
+        deleted = super().delete(*args, **kwargs)
+        if self.VERSIONED_CACHE:
+            invalidate_model(type(self), using=kwargs.get('using') or self._state.db)
+        return deleted
 
     def to_dict(self):
         return {k: v for k, v in vars(self).items() if not k.startswith('_')}
@@ -33,16 +170,83 @@ class BaseModel(models.Model):
     DEFAULT_SERIALIZER_EXCLUDE = ('created_by', 'created_at', 'updated_by', 'updated_at')
 
 
-class APILog(BaseModel):
+class APILogPayload(models.Model):
+    """
+    Request/response headers or body of API logs, stored once per distinct
+    content and compressed (see `common.payloads`)
+    """
+    digest = models.CharField(max_length=40, primary_key=True)
+    encoding = models.CharField(max_length=10, blank=True)
+    data = models.BinaryField()
+    size = models.IntegerField(help_text="Uncompressed size in bytes")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'api_log_payloads'
+
+    def __str__(self):
+        return f"{self.digest} ({self.size} bytes)"
+
+    @property
+    def text(self):
+        from .payloads import decode
+        return decode(self.encoding, self.data)
+
+
+def _payload_field():
+    # No constraint: unreferenced payloads are collected by `cleanup_api_logs`,
+    # through the indexes declared in APILog.Meta
+    return models.ForeignKey(
+        APILogPayload, on_delete=models.DO_NOTHING, null=True, blank=True,
+        db_constraint=False, db_index=False, related_name='+',
+    )
+
+
+class APILogPayloadMixin:
+    """
+    Text of the payloads of a log, loaded from the payload store when first
+    accessed. Use `select_related` on the payload fields to load them with
+    the log.
+    """
+
+    @property
+    def request_headers(self):
+        return self._payload_text('request_headers_payload')
+
+    @property
+    def request_body(self):
+        return self._payload_text('request_body_payload')
+
+    @property
+    def response_headers(self):
+        return self._payload_text('response_headers_payload')
+
+    @property
+    def response_body(self):
+        return self._payload_text('response_body_payload')
+
+    def _payload_text(self, field):
+        if getattr(self, f'{field}_id') is None:
+            return None
+        try:
+            return getattr(self, field).text
+        except APILogPayload.DoesNotExist:
+            return None
+
+
+class APILog(APILogPayloadMixin, BaseModel):
     """
     Model to store API request and response logs
     """
     # Request information
     method = models.CharField(max_length=10)
     path = models.CharField(max_length=500)
+    route = models.CharField(
+        max_length=500, blank=True, null=True, help_text="URL pattern the path resolved to"
+    )
     query_params = models.TextField(blank=True, null=True)
-    request_headers = models.TextField(blank=True, null=True)
-    request_body = models.TextField(blank=True, null=True)
+    request_headers_payload = _payload_field()
+    request_body_payload = _payload_field()
     request_user = models.ForeignKey(
         User, on_delete=models.SET_NULL, null=True, blank=True, related_name='api_logs'
     )
@@ -50,14 +254,26 @@ class APILog(BaseModel):
 
     # Response information
     response_status_code = models.IntegerField()
-    response_headers = models.TextField(blank=True, null=True)
-    response_body = models.TextField(blank=True, null=True)
+    response_headers_payload = _payload_field()
+    response_body_payload = _payload_field()
+    response_size = models.BigIntegerField(null=True, blank=True, help_text="Response body size in bytes")
 
     # Timing information
     request_timestamp = models.DateTimeField()
     response_timestamp = models.DateTimeField()
     duration_ms = models.FloatField(help_text="Request duration in milliseconds")
 
+    # Breakdown of the duration, see common.timing. Null for logs written
+    # before it was recorded
+    sql_count = models.IntegerField(null=True, blank=True, help_text="Number of SQL queries")
+    sql_time_ms = models.FloatField(null=True, blank=True, help_text="Time spent in SQL queries in milliseconds")
+    auth_time_ms = models.FloatField(null=True, blank=True, help_text="Authentication time in milliseconds")
+    view_time_ms = models.FloatField(null=True, blank=True, help_text="View time in milliseconds")
+    render_time_ms = models.FloatField(null=True, blank=True, help_text="Response rendering time in milliseconds")
+    sample_weight = models.FloatField(
+        null=True, blank=True, help_text="Number of requests this log stands for when sampling, null for 1"
+    )
+
     # Additional metadata
     user_agent = models.CharField(max_length=500, blank=True, null=True)
     content_type = models.CharField(max_length=100, blank=True, null=True)
@@ -67,18 +283,58 @@ class APILog(BaseModel):
         ordering = ['-request_timestamp']
         indexes = [
             models.Index(fields=['method', 'path']),
-            models.Index(fields=['request_timestamp']),
+            models.Index(fields=['route']),
+            # Keyset pagination key, also used for time range filters
+            models.Index(fields=['request_timestamp', 'id']),
             models.Index(fields=['response_status_code']),
             models.Index(fields=['request_user']),
+            # Payload garbage collection looks payloads up by digest
+            models.Index(fields=['request_headers_payload']),
+            models.Index(fields=['request_body_payload']),
+            models.Index(fields=['response_headers_payload']),
+            models.Index(fields=['response_body_payload']),
         ]
 
     def __str__(self):
         return f"{self.method} {self.path} - {self.response_status_code} ({self.duration_ms:.2f}ms)"
 
     @classmethod
-    def log_request(cls, request, response, duration_ms):
+    def log_request(cls, request, response, duration_ms, user=None, response_capture=None):
         """
-        Create a log entry for an API request/response
+        Log an API request/response through the configured sink (see
+        common.sinks).
+
+        With the database sink and the background writer disabled, the log
+        entry is created immediately and returned. Otherwise nothing is
+        returned.
+        """
+        record = cls.build_log_record(request, response, duration_ms, user=user, response_capture=response_capture)
+        if record is None:
+            return None
+        return get_log_sink().write(record)
+
+    @classmethod
+    async def alog_request(cls, request, response, duration_ms, user=None, response_capture=None):
+        """
+        Async version of `log_request` that never blocks the event loop.
+
+        `user` should already be resolved, since evaluating a lazy
+        `request.user` here could query the database.
+        """
+        record = cls.build_log_record(request, response, duration_ms, user=user, response_capture=response_capture)
+        if record is None:
+            return None
+        return await get_log_sink().awrite(record)
+
+    @classmethod
+    def build_log_record(cls, request, response, duration_ms, user=None, response_capture=None):
+        """
+        Build the field values of a log entry for an API request/response
+        without touching the database, as long as `user` or an already
+        evaluated `request.user` is available.
+
+        `response_capture` is a `(body, size)` tuple for responses whose body
+        was captured elsewhere, e.g. while streaming.
         """
         try:
             # Get request data
@@ -96,34 +352,44 @@ class APILog(BaseModel):
 
             # Get response data
             response_headers = dict(response.headers)
-            response_body = None
-            if hasattr(response, 'content') and response.content:
-                try:
-                    content_str = response.content.decode('utf-8')
-                    if len(content_str) <= 10000:  # Limit to 10KB
-                        response_body = content_str
-                except (UnicodeDecodeError, AttributeError):
-                    pass
-
-            # Create log entry
-            log_entry = cls.objects.create(
-                method=request.method,
-                path=request.path,
-                query_params=json.dumps(dict(request.GET)) if request.GET else None,
-                request_headers=json.dumps(request_headers),
-                request_body=request_body,
-                request_user=request.user if request.user.is_authenticated else None,
-                request_ip=cls._get_client_ip(request),
-                response_status_code=response.status_code,
-                response_headers=json.dumps(response_headers),
-                response_body=response_body,
-                request_timestamp=timezone.now(),
-                response_timestamp=timezone.now(),
-                duration_ms=duration_ms,
-                user_agent=request.META.get('HTTP_USER_AGENT', ''),
-                content_type=request.content_type or '',
-            )
-            return log_entry
+            if response_capture is not None:
+                response_body, response_size = response_capture
+            elif response.streaming:
+                # Streaming content can only be captured while it is sent
+                response_body, response_size = None, None
+            else:
+                response_body, response_size = capture_response_body(response)
+
+            # The writer uses bulk_create, which doesn't go through save(),
+            # so the audit fields are filled in here
+            if user is None:
+                user = request.user
+            user_id = user.pk if user.is_authenticated else None
+            now = timezone.now()
+            timings = getattr(request, 'timings', None)
+            return {
+                'method': request.method,
+                'path': request.path,
+                'route': request_route(request),
+                'query_params': json.dumps(dict(request.GET)) if request.GET else None,
+                'request_headers': json.dumps(request_headers),
+                'request_body': request_body,
+                'request_user_id': user_id,
+                'request_ip': cls._get_client_ip(request),
+                'response_status_code': response.status_code,
+                'response_headers': json.dumps(response_headers),
+                'response_body': response_body,
+                'response_size': response_size,
+                'request_timestamp': timings.started_at if timings is not None else now,
+                'response_timestamp': now,
+                'duration_ms': duration_ms,
+                **(timings.fields() if timings is not None else {}),
+                'sample_weight': getattr(request, 'sample_weight', None),
+                'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                'content_type': request.content_type or '',
+                'created_by_id': user_id,
+                'updated_by_id': user_id,
+            }
         except Exception as e:
             # Log the error but don't break the request
             print(f"Error logging API request: {e}")
@@ -138,3 +404,111 @@ class APILog(BaseModel):
         else:
             ip = request.META.get('REMOTE_ADDR')
         return ip
+
+
+class APILogRollup(models.Model):
+    """
+    Pre-aggregated API log counts and timings per time bucket, maintained
+    as logs are written. One row per bucket and method/route/status code.
+    Requests that didn't resolve to a route are counted under an empty route.
+    """
+    GRANULARITY_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    granularity = models.CharField(max_length=6, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the time bucket")
+    method = models.CharField(max_length=10)
+    route = models.CharField(max_length=500, blank=True)
+    status_code = models.IntegerField()
+
+    request_count = models.BigIntegerField(default=0, help_text="Number of logs")
+    # Sums below are weighted by the logs' sample weights (see common.sampling)
+    weighted_count = models.FloatField(default=0, help_text="Estimated number of requests")
+    duration_sum = models.FloatField(default=0, help_text="Sum of request durations in milliseconds")
+    duration_min = models.FloatField(null=True, blank=True)
+    duration_max = models.FloatField(null=True, blank=True)
+
+    # Sums of the duration breakdown over the requests that have one
+    timed_count = models.FloatField(default=0, help_text="Number of requests with a duration breakdown")
+    sql_count_sum = models.FloatField(default=0)
+    sql_time_sum = models.FloatField(default=0)
+    auth_time_sum = models.FloatField(default=0)
+    view_time_sum = models.FloatField(default=0)
+    render_time_sum = models.FloatField(default=0)
+
+    class Meta:
+        db_table = 'api_log_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'method', 'route', 'status_code'],
+                name='api_log_rollups_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.method} {self.route} {self.status_code}"
+
+
+class APILogUserRollup(models.Model):
+    """Number of API requests per user and time bucket, used to count unique users"""
+    granularity = models.CharField(max_length=6, choices=APILogRollup.GRANULARITY_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the time bucket")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    request_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'api_log_user_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'user'],
+                name='api_log_user_rollups_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.user_id}"
+
+
+class APILogLatencySketch(models.Model):
+    """
+    Mergeable latency quantile sketch (see common.sketches) per route and
+    time bucket, used for percentiles over any range of buckets
+    """
+    granularity = models.CharField(max_length=6, choices=APILogRollup.GRANULARITY_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the time bucket")
+    route = models.CharField(max_length=500, blank=True)
+    sketch = models.TextField(help_text="Serialized DDSketch of request durations in milliseconds")
+    version = models.PositiveIntegerField(default=0, help_text="Incremented on every update")
+
+    class Meta:
+        db_table = 'api_log_latency_sketches'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'route'],
+                name='api_log_latency_sketches_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.route}"
+
+
+class ThrottleBucket(models.Model):
+    """
+    Token bucket of a throttled identity (see common.throttling), updated
+    with a single conditional UPDATE so concurrent requests can't both
+    take the last token
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    tokens = models.FloatField(help_text="Tokens left after the last request")
+    updated = models.FloatField(help_text="Unix time of the last request")
+    full_at = models.FloatField(db_index=True, help_text="Unix time the bucket is full again")
+
+    class Meta:
+        db_table = 'throttle_buckets'
+
+    def __str__(self):
+        return self.key
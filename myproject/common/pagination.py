@@ -0,0 +1,181 @@
+import base64
+from urllib import parse
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a `(timestamp, id)` key, newest first.
+
+    Each page continues right after the last row of the previous one with a
+    `WHERE (timestamp, id) < (...)` condition, so every page costs the same
+    however deep it is, as long as there is an index on both columns.
+    Rows added while paginating don't shift the pages.
+
+    Search results, ordered by relevance, are paginated by offset instead
+    (`paginate_ranked`).
+    """
+    timestamp_field = 'request_timestamp'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_querysets([queryset], request, view)
+
+    def paginate_querysets(self, querysets, request, view=None):
+        """
+        Paginate over several querysets as if they were one, e.g. the tables
+        of a partitioned model. Each one is read up to a page and the rows
+        are merged on their key.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        rows = []
+        for queryset in querysets:
+            rows += self._after_cursor(queryset, cursor)[:page_size + 1]
+        if len(querysets) > 1:
+            rows.sort(key=self._get_key, reverse=True)
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        self.next_offset = None
+        return self.page
+
+    def paginate_ranked(self, fetch, request, view=None):
+        """
+        Paginate results ordered by relevance, which have no key to continue
+        from, by offset: `fetch(limit)` returns the best `limit` results.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        offset = self.decode_offset(request)
+        rows = fetch(offset + page_size + 1)[offset:]
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        self.next_offset = offset + page_size
+        return self.page
+
+    def _after_cursor(self, queryset, cursor):
+        queryset = queryset.order_by(f'-{self.timestamp_field}', '-id')
+        if cursor is None:
+            return queryset
+        timestamp, pk = cursor
+        # Written as `timestamp <= t AND (timestamp < t OR id < pk)` so that
+        # the database can walk the index from `t` downwards
+        return queryset.filter(
+            Q(**{f'{self.timestamp_field}__lte': timestamp})
+            & (Q(**{f'{self.timestamp_field}__lt': timestamp}) | Q(id__lt=pk))
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.next_offset is not None:
+            cursor = self._encode({'o': self.next_offset})
+        else:
+            cursor = self.encode_cursor(self._get_key(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def decode_cursor(self, request):
+        values = self._decode(request)
+        if values is None:
+            return None
+        try:
+            timestamp = parse_datetime(values['t'][0])
+            pk = int(values['id'][0])
+        except (TypeError, ValueError, KeyError):
+            self._invalid_cursor()
+        # Ids beyond 64 bits would overflow the database's integers
+        if timestamp is None or not 0 <= pk < 2 ** 63:
+            self._invalid_cursor()
+        return timestamp, pk
+
+    def decode_offset(self, request):
+        values = self._decode(request)
+        if values is None:
+            return 0
+        try:
+            offset = int(values['o'][0])
+        except (ValueError, KeyError):
+            self._invalid_cursor()
+        if offset < 0:
+            self._invalid_cursor()
+        return offset
+
+    def _invalid_cursor(self):
+        raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+
+    def _decode(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            querystring = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+        except (TypeError, ValueError, UnicodeError):
+            self._invalid_cursor()
+        return parse.parse_qs(querystring, keep_blank_values=True)
+
+    def encode_cursor(self, key):
+        timestamp, pk = key
+        return self._encode({'t': timestamp.isoformat(), 'id': pk})
+
+    def _encode(self, values):
+        querystring = parse.urlencode(values)
+        return base64.urlsafe_b64encode(querystring.encode('ascii')).decode('ascii')
+
+    def _get_key(self, row):
+        return getattr(row, self.timestamp_field), row.id
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
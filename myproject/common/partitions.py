@@ -0,0 +1,414 @@
+"""
+Time-partitioned storage for API logs.
+
+When enabled, logs are written to one table per day or month instead of
+the single `api_logs` table. Queries only touch the partitions overlapping
+their date range, and retention drops whole partitions instead of
+deleting rows.
+
+Partitions are `api_logs_<period>` tables. On SQLite each one lives in
+its own database file attached to the connection (`ATTACH DATABASE`)
+under the same name, where unqualified table names still find it. SQLite
+limits how many databases a connection attaches (10 by default), so an
+execute wrapper attaches the partitions each statement refers to just
+before it runs, detaching the least recently used ones to make room. A
+transaction keeps the partitions it used attached until it ends, so it
+can't use more than that many.
+
+Each partition hands out ids starting at `<period> * ID_MULTIPLIER`, so
+ids stay unique and ordered across partitions and the partition of a log
+can be told from its id.
+"""
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, models, router
+from django.db.backends.signals import connection_created
+
+from .conf import api_logging_settings
+from .models import APILog, APILogPayloadMixin
+from .routes import install_path_search
+from .search import install_search_index
+
+ID_MULTIPLIER = 10 ** 10
+
+PERIOD_FORMATS = {
+    'day': '%Y%m%d',
+    'month': '%Y%m',
+}
+
+_KEY_LENGTHS = {
+    'day': 8,
+    'month': 6,
+}
+
+_models = {}
+_models_lock = threading.Lock()
+
+# Partition names in SQL, e.g. "api_logs_202510"
+_SCHEMA_PREFIX = f'"{APILog._meta.db_table}_'
+_SCHEMA_PATTERN = re.compile(rf'{re.escape(_SCHEMA_PREFIX)}(\d{{6}}|\d{{8}})"')
+
+
+def enabled():
+    return api_logging_settings('PARTITIONING')['ENABLED']
+
+
+def period():
+    value = api_logging_settings('PARTITIONING')['PERIOD']
+    if value not in PERIOD_FORMATS:
+        raise ValueError(f"Unknown partition period {value!r}, expected one of {tuple(PERIOD_FORMATS)}")
+    return value
+
+
+def partition_key(dt):
+    """Return the key of the partition holding logs from `dt`, e.g. '202510'"""
+    return dt.astimezone(dt_timezone.utc).strftime(PERIOD_FORMATS[period()])
+
+
+def partition_bounds(key):
+    """Return the `[start, end)` datetimes covered by a partition"""
+    start = datetime.strptime(key, PERIOD_FORMATS[period()]).replace(tzinfo=dt_timezone.utc)
+    if period() == 'day':
+        end = datetime.fromordinal(start.toordinal() + 1).replace(tzinfo=dt_timezone.utc)
+    elif start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+
+def partition_for_id(pk):
+    """Return the key of the partition a log id belongs to, or None for the main table"""
+    if pk < ID_MULTIPLIER:
+        return None
+    return str(pk // ID_MULTIPLIER)
+
+
+def _using():
+    return router.db_for_write(APILog)
+
+
+def _is_sqlite(connection):
+    return connection.vendor == 'sqlite'
+
+
+def _schema(key):
+    return f'{APILog._meta.db_table}_{key}'
+
+
+def _sqlite_directory():
+    return Path(api_logging_settings('PARTITIONING')['DIRECTORY'] or settings.BASE_DIR / 'api_log_partitions')
+
+
+def _sqlite_path(key):
+    return _sqlite_directory() / f'{_schema(key)}.sqlite3'
+
+
+def partition_model(key):
+    """
+    Return an unmanaged model class reading and writing a partition, with
+    the same fields and indexes as APILog. Foreign keys have no database
+    constraint, since SQLite can't enforce them across attached databases.
+    """
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _models_lock:
+        if key in _models:
+            return _models[key]
+        attrs = {
+            '__module__': __name__,
+            'Meta': type('Meta', (), {
+                'app_label': APILog._meta.app_label,
+                'db_table': _schema(key),
+                'managed': False,
+                'ordering': APILog._meta.ordering,
+                # Named after the partition's table, so the names don't clash
+                'indexes': [models.Index(fields=index.fields) for index in APILog._meta.indexes],
+            }),
+            '__str__': APILog.__str__,
+        }
+        for field in APILog._meta.local_fields:
+            clone = field.clone()
+            if field.is_relation:
+                clone.db_constraint = False
+                clone.remote_field.related_name = '+'
+            attrs[field.name] = clone
+        model = type(f'APILogPartition{key}', (APILogPayloadMixin, models.Model), attrs)
+        _models[key] = model
+        return model
+
+
+def attach(key, using=None):
+    """
+    Make a partition available to the current SQLite connection, detaching
+    the least recently used partitions if there are too many. Partitions
+    used by the current transaction or an unfinished query stay attached.
+    Does nothing on other backends.
+    """
+    connection = connections[using or _using()]
+    if not _is_sqlite(connection):
+        return
+    # Connecting resets the attached partitions, so it must come first
+    connection.ensure_connection()
+    _attach(connection, key)
+
+
+def max_attached(using=None):
+    """Most partitions a connection can use at once, None if there is no limit"""
+    connection = connections[using or _using()]
+    if not _is_sqlite(connection):
+        return None
+    connection.ensure_connection()
+    return connection.connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+
+
+def _attach(connection, key, keep=()):
+    attached = connection.__dict__.setdefault('_api_log_partitions', OrderedDict())
+    if key in attached:
+        attached.move_to_end(key)
+        return
+    limit = connection.connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    for old in list(attached):
+        if len(attached) < limit:
+            break
+        if old not in keep:
+            _detach(connection, old)
+    if len(attached) >= limit:
+        raise ValueError(f"Can't use more than {limit} API log partitions at once on SQLite")
+    path = _sqlite_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # On the underlying connection, where the execute wrapper doesn't see it
+    connection.connection.execute(f'ATTACH DATABASE ? AS "{_schema(key)}"', [str(path)])
+    attached[key] = None
+
+
+def _detach(connection, key):
+    try:
+        connection.connection.execute(f'DETACH DATABASE "{_schema(key)}"')
+    except sqlite3.OperationalError:
+        # Still used by the current transaction or an unfinished query
+        return
+    del connection.__dict__['_api_log_partitions'][key]
+
+
+def attach_partitions(execute, sql, params, many, context):
+    """Execute wrapper attaching the partitions a statement refers to"""
+    if _SCHEMA_PREFIX in sql:
+        keys = set(_SCHEMA_PATTERN.findall(sql))
+        for key in keys:
+            _attach(context['connection'], key, keep=keys)
+    return execute(sql, params, many, context)
+
+
+def _connection_created(sender, connection, **kwargs):
+    if not _is_sqlite(connection):
+        return
+    # A new underlying connection has nothing attached yet
+    connection.__dict__['_api_log_partitions'] = OrderedDict()
+    if attach_partitions not in connection.execute_wrappers:
+        connection.execute_wrappers.append(attach_partitions)
+
+
+def install():
+    """Attach partitions on demand on every SQLite connection, including those already open"""
+    connection_created.connect(_connection_created, dispatch_uid='common.partitions')
+    for connection in connections.all(initialized_only=True):
+        _connection_created(None, connection)
+
+
+def exists(key, using=None):
+    connection = connections[using or _using()]
+    if _is_sqlite(connection):
+        if not _sqlite_path(key).exists():
+            return False
+        attach(key, using)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT 1 FROM "{_schema(key)}".sqlite_master WHERE type = %s AND name = %s',
+                ['table', _schema(key)],
+            )
+            return cursor.fetchone() is not None
+    with connection.cursor() as cursor:
+        return _schema(key) in connection.introspection.table_names(cursor)
+
+
+def ensure_partition(key, using=None):
+    """Create the partition if it doesn't exist yet and return its model"""
+    using = using or _using()
+    model = partition_model(key)
+    if exists(key, using):
+        return model
+
+    connection = connections[using]
+    start_id = int(key) * ID_MULTIPLIER
+    if _is_sqlite(connection):
+        attach(key, using)
+        _create_sqlite_partition(key, connection, start_id)
+    else:
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)", [_schema(key), start_id])
+            elif connection.vendor == 'mysql':
+                cursor.execute(f'ALTER TABLE {connection.ops.quote_name(_schema(key))} AUTO_INCREMENT = {start_id}')
+    install_path_search(using, model)
+    install_search_index(using, model)
+    return model
+
+
+def _create_sqlite_partition(key, connection, start_id):
+    """Copy the schema of the main table into the attached partition database"""
+    table = APILog._meta.db_table
+    schema = _schema(key)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [table],
+        )
+        sql, = cursor.fetchone()
+        sql = sql.replace(f'CREATE TABLE "{table}"', f'CREATE TABLE IF NOT EXISTS "{schema}"."{schema}"', 1)
+        sql = re.sub(r' REFERENCES "\w+" \("\w+"\)( DEFERRABLE INITIALLY DEFERRED)?', '', sql)
+        cursor.execute(sql)
+        cursor.execute(
+            f'INSERT INTO "{schema}".sqlite_sequence (name, seq) VALUES (%s, %s)', [schema, start_id - 1]
+        )
+    _copy_sqlite_indexes(key, connection)
+
+
+def _copy_sqlite_indexes(key, connection):
+    """Create the indexes of the main table the partition doesn't have yet"""
+    table = APILog._meta.db_table
+    schema = _schema(key)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL", [table],
+        )
+        for sql, in cursor.fetchall():
+            sql = re.sub(r'^CREATE (UNIQUE )?INDEX "', rf'CREATE \1INDEX IF NOT EXISTS "{schema}"."', sql)
+            sql = sql.replace(f' ON "{table}" ', f' ON "{schema}" ', 1)
+            cursor.execute(sql)
+
+
+def sync_schemas(using=None):
+    """
+    Add the columns and indexes APILog gained since a partition was
+    created, and its search indexes, run after migrations. Only nullable
+    columns can be added this way, which is what new log fields should be.
+    """
+    using = using or _using()
+    connection = connections[using]
+    for key in existing_partitions(using):
+        model = partition_model(key)
+        attach(key, using)
+        with connection.cursor() as cursor:
+            columns = {
+                column.name for column in connection.introspection.get_table_description(cursor, _schema(key))
+            }
+            constraints = connection.introspection.get_constraints(cursor, _schema(key))
+        missing = [field for field in model._meta.local_fields if field.column not in columns]
+        for field in missing:
+            if not field.null:
+                print(f"Error syncing API log partition {key}: column {field.column} isn't nullable")
+                continue
+            with connection.schema_editor() as editor:
+                editor.add_field(model, field)
+        if _is_sqlite(connection):
+            _copy_sqlite_indexes(key, connection)
+        else:
+            for index in model._meta.indexes:
+                if index.name not in constraints:
+                    with connection.schema_editor() as editor:
+                        editor.add_index(model, index)
+        install_path_search(using, model)
+        install_search_index(using, model)
+
+
+def existing_partitions(using=None):
+    """Keys of all existing partitions, oldest first"""
+    connection = connections[using or _using()]
+    prefix = f'{APILog._meta.db_table}_'
+    if _is_sqlite(connection):
+        directory = _sqlite_directory()
+        names = [path.stem for path in directory.glob(f'{prefix}*.sqlite3')] if directory.exists() else []
+    else:
+        with connection.cursor() as cursor:
+            names = connection.introspection.table_names(cursor)
+    pattern = re.compile(rf'^{re.escape(prefix)}(\d+)$')
+    keys = [match.group(1) for match in map(pattern.match, names) if match]
+    return sorted(key for key in keys if len(key) == _KEY_LENGTHS[period()])
+
+
+def partitions_between(start=None, end=None, using=None):
+    """Keys of the existing partitions overlapping `[start, end]`, newest first"""
+    keys = []
+    for key in existing_partitions(using):
+        partition_start, partition_end = partition_bounds(key)
+        if start is not None and partition_end <= start:
+            continue
+        if end is not None and partition_start > end:
+            continue
+        keys.append(key)
+    return keys[::-1]
+
+
+def log_querysets(start=None, end=None):
+    """
+    Querysets over the logs between `start` and `end`: the main table
+    followed by the overlapping partitions, newest first
+    """
+    querysets = [APILog.objects.all()]
+    if enabled():
+        for key in partitions_between(start, end):
+            querysets.append(partition_model(key).objects.all())
+    return querysets
+
+
+def get_log(pk, select_related=()):
+    """Look up a log by id in the main table or the partition it belongs to"""
+    key = partition_for_id(pk)
+    if key is None:
+        return APILog.objects.select_related(*select_related).get(pk=pk)
+    if not exists(key):
+        raise APILog.DoesNotExist
+    return partition_model(key).objects.select_related(*select_related).get(pk=pk)
+
+
+def drop_partition(key, using=None):
+    """Delete a partition and all the logs in it"""
+    using = using or _using()
+    connection = connections[using]
+    if _is_sqlite(connection):
+        path = _sqlite_path(key)
+        if key in connection.__dict__.get('_api_log_partitions', {}):
+            connection.connection.execute(f'DETACH DATABASE "{_schema(key)}"')
+            del connection.__dict__['_api_log_partitions'][key]
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+    else:
+        with connection.schema_editor() as editor:
+            editor.delete_model(partition_model(key))
+    with _models_lock:
+        _models.pop(key, None)
+
+
+def group_records(records):
+    """
+    Group log records by the model of the partition they belong to,
+    creating missing partitions. Yields `{model: records}` dicts of no more
+    partitions than a transaction can write to.
+    """
+    by_key = {}
+    for record in records:
+        by_key.setdefault(partition_key(record['request_timestamp']), []).append(record)
+    keys = list(by_key)
+    size = max_attached() or len(keys)
+    for start in range(0, len(keys), size):
+        chunk = keys[start:start + size]
+        yield {ensure_partition(key): by_key[key] for key in chunk}
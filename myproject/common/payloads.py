@@ -0,0 +1,175 @@
+"""
+Content-addressed store for the bulky parts of API logs.
+
+Request/response headers and bodies are kept in `APILogPayload` rows keyed
+by a hash of their content, so `api_logs` rows stay narrow and identical
+payloads (the same header set or error body over and over) are stored
+once. Payloads above a small size are compressed with zstd when available
+(Python 3.14's `compression.zstd` or the `zstandard` package) and zlib
+otherwise.
+"""
+import hashlib
+import zlib
+
+from django.db.models import Exists, OuterRef
+
+from .conf import api_logging_settings
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+# Log record keys moved to the payload store, and the foreign keys replacing them
+PAYLOAD_FIELDS = {
+    'request_headers': 'request_headers_payload',
+    'request_body': 'request_body_payload',
+    'response_headers': 'response_headers_payload',
+    'response_body': 'response_body_payload',
+}
+
+ENCODINGS = ('', 'zlib', 'zstd')
+
+
+def digest(data):
+    """Hex digest identifying a payload"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def _zstd_compress(data, level):
+    if hasattr(zstd, 'ZstdCompressor'):
+        compressor = zstd.ZstdCompressor(level=level) if level is not None else zstd.ZstdCompressor()
+        return compressor.compress(data)
+    return zstd.compress(data, level) if level is not None else zstd.compress(data)
+
+
+def _zstd_decompress(data):
+    if hasattr(zstd, 'ZstdDecompressor') and not hasattr(zstd, 'decompress'):
+        return zstd.ZstdDecompressor().decompress(data)
+    return zstd.decompress(data)
+
+
+def compression():
+    """The configured compression, falling back to zlib without zstd"""
+    value = api_logging_settings('PAYLOADS')['COMPRESSION'] or ''
+    if value not in ENCODINGS:
+        raise ValueError(f"Unknown payload compression {value!r}, expected one of {ENCODINGS}")
+    if value == 'zstd' and zstd is None:
+        return 'zlib'
+    return value
+
+
+def encode(text, encoding=None, min_size=None):
+    """
+    Return `(digest, encoding, data, size)` for a payload. The digest is
+    taken before compression so it doesn't depend on the settings.
+    """
+    conf = api_logging_settings('PAYLOADS')
+    raw = text.encode('utf-8')
+    encoding = compression() if encoding is None else encoding
+    min_size = conf['MIN_SIZE'] if min_size is None else min_size
+    if len(raw) < min_size:
+        encoding = ''
+
+    if encoding == 'zstd':
+        data = _zstd_compress(raw, conf['LEVEL'])
+    elif encoding == 'zlib':
+        data = zlib.compress(raw, conf['LEVEL'] if conf['LEVEL'] is not None else zlib.Z_DEFAULT_COMPRESSION)
+    else:
+        data = raw
+    if encoding and len(data) >= len(raw):
+        # Not worth decompressing
+        encoding, data = '', raw
+    return digest(raw), encoding, data, len(raw)
+
+
+def decode(encoding, data):
+    data = bytes(data)
+    if encoding == 'zstd':
+        if zstd is None:
+            raise RuntimeError('Reading zstd payloads requires Python 3.14 or the zstandard package')
+        data = _zstd_decompress(data)
+    elif encoding == 'zlib':
+        data = zlib.decompress(data)
+    return data.decode('utf-8')
+
+
+def store_records(records):
+    """
+    Move the payloads of log records to the payload store. Returns new
+    records with the payload foreign keys instead of the text fields.
+    Must run in the transaction inserting the logs.
+    """
+    from .models import APILogPayload
+
+    payloads = {}
+    stored = []
+    for record in records:
+        record = dict(record)
+        for field, fk in PAYLOAD_FIELDS.items():
+            text = record.pop(field, None)
+            if text is None:
+                record[f'{fk}_id'] = None
+                continue
+            key, encoding, data, size = encode(text)
+            payloads.setdefault(key, (encoding, data, size))
+            record[f'{fk}_id'] = key
+        stored.append(record)
+
+    if payloads:
+        # Existing payloads are left alone, whatever their compression
+        APILogPayload.objects.bulk_create(
+            [
+                APILogPayload(digest=key, encoding=encoding, data=data, size=size)
+                for key, (encoding, data, size) in payloads.items()
+            ],
+            ignore_conflicts=True,
+            batch_size=500,
+        )
+    return stored
+
+
+def collect_garbage(batch_size=1000):
+    """
+    Delete the payloads no log refers to anymore. Returns the number deleted.
+
+    Payloads are walked in batches of digests, and the digests of a batch
+    are looked up in the main table and in each partition in turn, so the
+    lookups don't need all the partitions at once. Logs written meanwhile
+    may use the payloads found unreferenced again, so the DELETE checks
+    again that no log refers to them in the same statement. On SQLite that
+    check covers the main table and as many of the newest partitions as can
+    be attached at once; logs go to the partition of their timestamp, so
+    older partitions don't get new references.
+    """
+    from .models import APILogPayload
+    from .partitions import log_querysets, max_attached
+
+    querysets = log_querysets()
+    limit = max_attached()
+    recheck = querysets if limit is None else querysets[:1 + limit]
+    total = 0
+    last = ''
+    while True:
+        batch = APILogPayload.objects.filter(digest__gt=last).order_by('digest')
+        keys = list(batch.values_list('digest', flat=True)[:batch_size])
+        if not keys:
+            return total
+        last = keys[-1]
+        unreferenced = set(keys)
+        for queryset in querysets:
+            for fk in PAYLOAD_FIELDS.values():
+                if unreferenced:
+                    unreferenced -= set(
+                        queryset.filter(**{f'{fk}__in': unreferenced}).values_list(fk, flat=True).distinct()
+                    )
+        if unreferenced:
+            unused = APILogPayload.objects.filter(digest__in=unreferenced)
+            for queryset in recheck:
+                for fk in PAYLOAD_FIELDS.values():
+                    unused = unused.filter(~Exists(queryset.filter(**{fk: OuterRef('digest')})))
+            deleted, _ = unused.delete()
+            total += deleted
@@ -0,0 +1,186 @@
+"""
+Versioned response cache for read endpoints.
+
+Every cached model has a version in the Django cache, replaced whenever
+one of its objects is saved, deleted or bulk written (see
+`BaseModel.VERSIONED_CACHE`). GET responses of views using
+`CachedResponseMixin` are cached under the current version, so a write
+makes every cached response of the model unreachable at once.
+
+Responses carry an ETag derived from the version, so a poll with a
+matching `If-None-Match` gets a 304 after a single cache lookup, without
+a query or serialization.
+
+Versions must be shared by all processes serving the API: use a shared
+cache backend (`RESPONSE_CACHE['CACHE']`) when running more than one.
+The cache is disabled by default since the default cache is per-process.
+
+Hits, misses, 304s and the bytes they saved are counted in the live
+metrics (see common.metrics) per model.
+"""
+import hashlib
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import metrics
+from .conf import response_cache_settings
+
+KEY_PREFIX = 'response_cache'
+
+# Result label in the live metrics of each counter
+_RESULTS = {'hits': 'hit', 'misses': 'miss', 'not_modified': 'not_modified'}
+
+
+class ResponseCache:
+    """Cache of serialized responses, keyed by model version and request"""
+
+    def __init__(self, alias='default', timeout=300):
+        self.alias = alias
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    @classmethod
+    def from_settings(cls):
+        conf = response_cache_settings()
+        return cls(alias=conf['CACHE'], timeout=conf['TIMEOUT'])
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def version(self, model):
+        """Current version of `model`'s responses"""
+        key = self._version_key(model)
+        version = self.cache.get(key)
+        if version is None:
+            # Another process may have set it first
+            self.cache.add(key, uuid.uuid4().hex, None)
+            version = self.cache.get(key)
+        return version
+
+    def bump(self, model):
+        """
+        Replace the version of `model`. Versions are random rather than
+        incremented, so concurrent bumps can't end on a version already used.
+        """
+        self.cache.set(self._version_key(model), uuid.uuid4().hex, None)
+
+    def response(self, view, request, handler, *args, **kwargs):
+        """
+        Respond to a GET from the cache, with a 304 when the client has the
+        current version, or with `handler` whose response gets cached
+        """
+        model = view.get_queryset().model
+        version = self.version(model)
+        key = self._response_key(model, version, request)
+        etag = '"%s"' % hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            entry = self.cache.get(key)
+            self._count(model, not_modified=1, bytes_saved=entry['size'] if entry else 0)
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self._count(model, hits=1)
+                response = Response(entry['data'])
+            else:
+                self._count(model, misses=1)
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                data = response.data
+                response.add_post_render_callback(
+                    lambda rendered: self.cache.set(
+                        key, {'data': data, 'size': len(rendered.content)}, self.timeout
+                    )
+                )
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def stats(self):
+        requests = self.hits + self.misses + self.not_modified
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_ratio': (self.hits + self.not_modified) / requests if requests else 0.0,
+            'bytes_saved': self.bytes_saved,
+        }
+
+    def _count(self, model, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+        if metrics.enabled():
+            label = model._meta.label_lower
+            bytes_saved = counts.pop('bytes_saved', 0)
+            for name in counts:
+                metrics.RESPONSE_CACHE_REQUESTS.inc(label, _RESULTS[name])
+            if bytes_saved:
+                metrics.RESPONSE_CACHE_BYTES_SAVED.inc(label, amount=bytes_saved)
+
+    @staticmethod
+    def _version_key(model):
+        return f'{KEY_PREFIX}:version:{model._meta.label_lower}'
+
+    @staticmethod
+    def _response_key(model, version, request):
+        # The representation depends on the path, query and renderer
+        renderer = getattr(request, 'accepted_renderer', None)
+        return (
+            f'{KEY_PREFIX}:{model._meta.label_lower}:{version}:'
+            f'{getattr(renderer, "format", "")}:{request.get_full_path()}'
+        )
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide response cache, creating it on first use"""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache.from_settings()
+    return _response_cache
+
+
+def invalidate_model(model, using=None):
+    """Bump the version of `model` once the current transaction commits"""
+    if response_cache_settings()['ENABLED']:
+        transaction.on_commit(lambda: get_response_cache().bump(model), using=using)
+
+
+class CachedResponseMixin:
+    """
+    Serve the GET responses of list and retrieve views from the response
+    cache. The model needs `VERSIONED_CACHE = True` so writes invalidate it.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        if not response_cache_settings()['ENABLED']:
+            return handler(request, *args, **kwargs)
+        return get_response_cache().response(self, request, handler, *args, **kwargs)
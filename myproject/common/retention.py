@@ -0,0 +1,168 @@
+"""
+Retention of API logs.
+
+Old logs are deleted in bounded primary key ranges rather than with one
+big DELETE, so each statement only locks and journals a batch of rows.
+How long a log is kept can depend on its status code and path. With
+partitioning enabled, partitions whose logs are all expired are dropped
+as a whole.
+"""
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .conf import api_logging_settings
+from .models import APILog
+
+
+@dataclass
+class RetentionPolicy:
+    """Keep logs matching the status code range and path prefix for `days` days"""
+    days: int
+    name: str = ''
+    status_min: int | None = None
+    status_max: int | None = None
+    path_prefix: str | None = None
+
+    @classmethod
+    def from_setting(cls, value):
+        return cls(
+            days=value['DAYS'],
+            name=value.get('NAME', ''),
+            status_min=value.get('STATUS_MIN'),
+            status_max=value.get('STATUS_MAX'),
+            path_prefix=value.get('PATH_PREFIX'),
+        )
+
+    def match(self):
+        """Q object matching the logs this policy applies to"""
+        query = Q()
+        if self.status_min is not None:
+            query &= Q(response_status_code__gte=self.status_min)
+        if self.status_max is not None:
+            query &= Q(response_status_code__lte=self.status_max)
+        if self.path_prefix:
+            query &= Q(path__startswith=self.path_prefix)
+        return query
+
+    def __str__(self):
+        if self.name:
+            return self.name
+        parts = []
+        if self.status_min is not None or self.status_max is not None:
+            parts.append(f'status {self.status_min or ""}-{self.status_max or ""}')
+        if self.path_prefix:
+            parts.append(f'path {self.path_prefix}*')
+        return ', '.join(parts) or 'all logs'
+
+
+def policies_from_settings():
+    """Return the configured policies and the number of days other logs are kept"""
+    conf = api_logging_settings('RETENTION')
+    return [RetentionPolicy.from_setting(value) for value in conf['POLICIES']], conf['DEFAULT_DAYS']
+
+
+def expired(policies, default_days, now=None):
+    """
+    Q object matching the logs that are past their retention. The first
+    matching policy applies to a log, and `default_days` to logs matching
+    none of them.
+    """
+    now = now or timezone.now()
+    clauses = []
+    matched = []
+    for policy in policies:
+        clause = policy.match() & Q(request_timestamp__lt=now - timedelta(days=policy.days))
+        if matched:
+            clause &= ~reduce(or_, matched)
+        clauses.append(clause)
+        matched.append(policy.match())
+
+    default = Q(request_timestamp__lt=now - timedelta(days=default_days))
+    if matched:
+        default &= ~reduce(or_, matched)
+    clauses.append(default)
+    return reduce(or_, clauses)
+
+
+def expired_partitions(policies, default_days, now=None):
+    """Keys of the partitions holding only logs past every retention"""
+    from . import partitions
+
+    now = now or timezone.now()
+    longest = max([policy.days for policy in policies] + [default_days])
+    cutoff = now - timedelta(days=longest)
+    return [key for key in partitions.existing_partitions() if partitions.partition_bounds(key)[1] <= cutoff]
+
+
+class RetentionEngine:
+    """
+    Delete expired logs in batches of at most `batch_size` rows, walking
+    the primary key upwards and sleeping `sleep` seconds between batches.
+
+    Deletion can be stopped at any time and resumed with `start_id`, the
+    last id reported as done plus one. `model` is APILog or the model of a
+    partition.
+    """
+
+    def __init__(self, policies, default_days, batch_size=5000, sleep=0.0, now=None, model=APILog):
+        self.policies = policies
+        self.default_days = default_days
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.now = now or timezone.now()
+        self.model = model
+
+    def expired_logs(self):
+        return self.model.objects.filter(expired(self.policies, self.default_days, self.now))
+
+    def upper_id(self):
+        """
+        Largest id that can be expired: the id of the newest log older than
+        the shortest retention, found by walking the timestamp index. Ids
+        follow the order logs are written in, so an expired log written
+        after newer ones is left for a later run.
+        """
+        cutoff = self.now - timedelta(days=self.shortest_days())
+        return self.model.objects.filter(request_timestamp__lt=cutoff).order_by(
+            '-request_timestamp', '-id'
+        ).values_list('id', flat=True).first()
+
+    def shortest_days(self):
+        return min([policy.days for policy in self.policies] + [self.default_days])
+
+    def run(self, start_id=None, progress=None):
+        """
+        Delete the expired logs. `progress` is called after each batch with
+        `(deleted_in_batch, total_deleted, last_id)`. Returns the total.
+        """
+        upper = self.upper_id()
+        if upper is None:
+            return 0
+
+        expired_logs = self.expired_logs().filter(id__lte=upper)
+        low = start_id or 0
+        total = 0
+        while True:
+            # The id closing a batch of `batch_size` expired logs
+            ids = expired_logs.filter(id__gte=low).order_by('id').values_list('id', flat=True)
+            first = ids.first()
+            if first is None:
+                break
+            high = ids[self.batch_size - 1:self.batch_size].first() or upper
+
+            deleted, _ = expired_logs.filter(id__gte=first, id__lte=high).delete()
+            total += deleted
+            if progress is not None:
+                progress(deleted, total, high)
+            if high >= upper:
+                break
+            low = high + 1
+            if self.sleep:
+                time.sleep(self.sleep)
+        return total
@@ -0,0 +1,462 @@
+"""
+Minute/hour/day rollups of API logs.
+
+Every log written is added to one bucket of each granularity. Statistics
+for an arbitrary time range are then read from the coarsest buckets that
+fit inside it (minutes at the edges, hours, then whole days), so their
+cost depends on the length of the range and not on the number of logs.
+
+Requests are grouped by route template (see common.routes) rather than
+raw path, so the number of rows doesn't grow with object ids. Latency
+percentiles come from quantile sketches kept per route and bucket, which
+are merged over the same buckets.
+
+Logs count for their sample weight (see common.sampling), so statistics
+estimate all requests when only a sample of them is logged.
+
+Rows of each granularity are kept for `RETENTION['ROLLUP_DAYS']` (see
+`prune`): minute rows are only dropped where the whole hour is kept, and
+hour rows where the whole day is, so ranges reaching past a cutoff are
+read from the coarser buckets instead.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least, Trunc
+from django.utils import timezone
+
+from .conf import DEFAULTS, api_logging_settings
+from .models import APILogLatencySketch, APILogRollup, APILogUserRollup
+from .sketches import DDSketch
+
+GRANULARITIES = ('minute', 'hour', 'day')
+
+ROLLUP_MODELS = (APILogRollup, APILogUserRollup, APILogLatencySketch)
+
+PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+# Optimistic attempts at updating a sketch before locking its row
+SKETCH_UPDATE_ATTEMPTS = 10
+
+# Duration breakdown summed per rollup row: log field -> rollup field
+TIMING_SUMS = {
+    'sql_count': 'sql_count_sum',
+    'sql_time_ms': 'sql_time_sum',
+    'auth_time_ms': 'auth_time_sum',
+    'view_time_ms': 'view_time_sum',
+    'render_time_ms': 'render_time_sum',
+}
+
+_STEPS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+
+def truncate(dt, granularity):
+    """Return the start of the bucket containing `dt`, in UTC"""
+    dt = dt.astimezone(dt_timezone.utc).replace(second=0, microsecond=0)
+    if granularity in ('hour', 'day'):
+        dt = dt.replace(minute=0)
+    if granularity == 'day':
+        dt = dt.replace(hour=0)
+    return dt
+
+
+def ceil(dt, granularity):
+    """Return the start of the first bucket starting at or after `dt`"""
+    start = truncate(dt, granularity)
+    return start if start == dt else start + _STEPS[granularity]
+
+
+def rollup_ranges(start, end):
+    """
+    Split `[start, end)` into `(granularity, from, to)` ranges of whole
+    buckets, using the coarsest buckets possible. The range is widened to
+    whole minutes, the finest granularity kept.
+    """
+    start = truncate(start, 'minute')
+    end = ceil(end, 'minute')
+    if start >= end:
+        return []
+
+    first_hour, last_hour = ceil(start, 'hour'), truncate(end, 'hour')
+    if first_hour >= last_hour:
+        return [('minute', start, end)]
+
+    first_day, last_day = ceil(start, 'day'), truncate(end, 'day')
+    if first_day < last_day:
+        middle = [('hour', first_hour, first_day), ('day', first_day, last_day), ('hour', last_day, last_hour)]
+    else:
+        middle = [('hour', first_hour, last_hour)]
+
+    ranges = [('minute', start, first_hour)] + middle + [('minute', last_hour, end)]
+    return [r for r in ranges if r[1] < r[2]]
+
+
+def rollup_cutoffs(now=None):
+    """
+    Start of the kept buckets per granularity, or None when they are kept
+    forever. Cutoffs are aligned on the next coarser granularity.
+    """
+    now = now or timezone.now()
+    days = {**DEFAULTS['RETENTION']['ROLLUP_DAYS'], **api_logging_settings('RETENTION')['ROLLUP_DAYS']}
+    cutoffs = {}
+    for granularity, coarser in zip(GRANULARITIES, (*GRANULARITIES[1:], 'day')):
+        kept = days.get(granularity)
+        cutoffs[granularity] = None if kept is None else truncate(now - timedelta(days=kept), coarser)
+    return cutoffs
+
+
+def retained_range(start, end, now=None):
+    """Widen `[start, end)` to the buckets still kept where it reaches past a cutoff"""
+    cutoffs = rollup_cutoffs(now)
+    for granularity, coarser in (('minute', 'hour'), ('hour', 'day')):
+        cutoff = cutoffs[granularity]
+        if cutoff is None:
+            continue
+        if start < cutoff:
+            start = truncate(start, coarser)
+        if end < cutoff:
+            end = ceil(end, coarser)
+    return start, end
+
+
+def rollup_filter(start, end):
+    """Q object selecting the rollup rows that cover `[start, end)`"""
+    query = Q(pk__in=[])
+    for granularity, range_start, range_end in rollup_ranges(*retained_range(start, end)):
+        query |= Q(granularity=granularity, bucket__gte=range_start, bucket__lt=range_end)
+    return query
+
+
+def aggregate_records(records):
+    """
+    Aggregate log records (dicts of APILog field values) into rollup
+    increments, keyed like the rollup tables. Totals are lists of log
+    count, weighted count, duration sum, min and max, timed request count
+    and the sums of TIMING_SUMS, sums being weighted.
+    """
+    totals = {}
+    users = defaultdict(int)
+    sketches = defaultdict(DDSketch)
+    for record in records:
+        timestamp = record['request_timestamp']
+        duration = record['duration_ms']
+        weight = record.get('sample_weight') or 1.0
+        user_id = record.get('request_user_id')
+        route = record.get('route') or ''
+        if record.get('sql_count') is None:
+            timed = [0] * (len(TIMING_SUMS) + 1)
+        else:
+            timed = [weight, *((record.get(field) or 0) * weight for field in TIMING_SUMS)]
+        for granularity in GRANULARITIES:
+            bucket = truncate(timestamp, granularity)
+            key = (granularity, bucket, record['method'], route, record['response_status_code'])
+            total = totals.get(key)
+            if total is None:
+                totals[key] = [1, weight, duration * weight, duration, duration, *timed]
+            else:
+                total[0] += 1
+                total[1] += weight
+                total[2] += duration * weight
+                total[3] = min(total[3], duration)
+                total[4] = max(total[4], duration)
+                for index, value in enumerate(timed, 5):
+                    total[index] += value
+            if user_id is not None:
+                users[(granularity, bucket, user_id)] += 1
+            sketches[(granularity, bucket, route)].add(duration, weight)
+    return totals, users, sketches
+
+
+def apply_records(records):
+    """
+    Add log records to the rollups. Rows are incremented in the database
+    with F() expressions, so concurrent writers never lose updates.
+    """
+    totals, users, sketches = aggregate_records(records)
+    with transaction.atomic():
+        for (granularity, bucket, method, route, status_code), values in totals.items():
+            count, weighted, total, low, high, timed_count, *timing_sums = values
+            key = dict(granularity=granularity, bucket=bucket, method=method, route=route, status_code=status_code)
+            sums = dict(zip(TIMING_SUMS.values(), timing_sums), weighted_count=weighted, timed_count=timed_count)
+            _increment(
+                APILogRollup, key,
+                dict(
+                    request_count=F('request_count') + count,
+                    duration_sum=F('duration_sum') + total,
+                    duration_min=Least('duration_min', low),
+                    duration_max=Greatest('duration_max', high),
+                    **{name: F(name) + value for name, value in sums.items()},
+                ),
+                dict(request_count=count, duration_sum=total, duration_min=low, duration_max=high, **sums),
+            )
+        for (granularity, bucket, user_id), count in users.items():
+            _increment(
+                APILogUserRollup,
+                dict(granularity=granularity, bucket=bucket, user_id=user_id),
+                dict(request_count=F('request_count') + count),
+                dict(request_count=count),
+            )
+        for (granularity, bucket, route), sketch in sketches.items():
+            _merge_sketch(dict(granularity=granularity, bucket=bucket, route=route), sketch)
+
+
+def _merge_sketch(key, sketch):
+    """
+    Merge `sketch` into the stored sketch matching `key`. Sketches can't be
+    merged in SQL, so the row is read, merged and written back only if
+    nobody changed its version in the meantime. A row that keeps changing
+    is locked instead, rather than failing the logs being written.
+    """
+    for _ in range(SKETCH_UPDATE_ATTEMPTS):
+        row = APILogLatencySketch.objects.filter(**key).values('sketch', 'version').first()
+        if row is None:
+            try:
+                with transaction.atomic():
+                    APILogLatencySketch.objects.create(**key, sketch=sketch.to_json())
+                return
+            except IntegrityError:
+                continue
+        merged = DDSketch.from_json(row['sketch'])
+        merged.merge(sketch)
+        if APILogLatencySketch.objects.filter(**key, version=row['version']).update(
+            sketch=merged.to_json(), version=row['version'] + 1,
+        ):
+            return
+    with transaction.atomic():
+        stored = APILogLatencySketch.objects.select_for_update().get(**key)
+        merged = DDSketch.from_json(stored.sketch)
+        merged.merge(sketch)
+        stored.sketch = merged.to_json()
+        stored.version += 1
+        stored.save(update_fields=['sketch', 'version'])
+
+
+def _increment(model, key, updates, initial):
+    """Update the row matching `key`, or create it if there is none yet"""
+    if model.objects.filter(**key).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **initial)
+    except IntegrityError:
+        # Another writer created the row in the meantime
+        model.objects.filter(**key).update(**updates)
+
+
+def prune(now=None, batch_size=5000, dry_run=False):
+    """
+    Delete the rollup, user rollup and sketch rows older than the retention
+    of their granularity, `batch_size` rows per statement. Returns the
+    number of rows deleted (or that would be) per granularity.
+    """
+    counts = {}
+    for granularity, cutoff in rollup_cutoffs(now).items():
+        counts[granularity] = 0
+        if cutoff is None:
+            continue
+        for model in ROLLUP_MODELS:
+            expired = model.objects.filter(granularity=granularity, bucket__lt=cutoff)
+            if dry_run:
+                counts[granularity] += expired.count()
+                continue
+            while True:
+                ids = list(expired.values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                counts[granularity] += model.objects.filter(pk__in=ids).delete()[0]
+    return counts
+
+
+def rebuild(start, end):
+    """
+    Recompute the rollups of whole days between `start` and `end` from the
+    raw logs, replacing what is there. Returns the number of days rebuilt.
+    """
+    from .partitions import log_querysets
+
+    day = truncate(start, 'day')
+    end = ceil(end, 'day')
+    days = 0
+    while day < end:
+        next_day = day + _STEPS['day']
+        logs = [
+            queryset.filter(request_timestamp__gte=day, request_timestamp__lt=next_day)
+            for queryset in log_querysets(day, next_day)
+        ]
+        with transaction.atomic():
+            APILogRollup.objects.filter(bucket__gte=day, bucket__lt=next_day).delete()
+            APILogUserRollup.objects.filter(bucket__gte=day, bucket__lt=next_day).delete()
+            APILogLatencySketch.objects.filter(bucket__gte=day, bucket__lt=next_day).delete()
+            for granularity in GRANULARITIES:
+                _rebuild_granularity(logs, granularity)
+            _rebuild_sketches(logs)
+        day = next_day
+        days += 1
+    return days
+
+
+def _rebuild_granularity(querysets, granularity):
+    # The same bucket can have logs in the main table and in a partition
+    totals = {}
+    users = defaultdict(int)
+    for logs in querysets:
+        bucketed = logs.annotate(
+            bucket=Trunc('request_timestamp', granularity, tzinfo=dt_timezone.utc),
+            route_key=Coalesce('route', Value('')),
+            weight=Coalesce('sample_weight', Value(1.0)),
+        ).order_by()
+        for row in bucketed.values('bucket', 'method', 'route_key', 'response_status_code').annotate(
+            request_count=Count('id'),
+            weighted_count=Sum('weight'),
+            duration_sum=Sum(F('duration_ms') * F('weight')),
+            duration_min=Min('duration_ms'),
+            duration_max=Max('duration_ms'),
+            timed_count=Coalesce(Sum(Case(When(sql_count__isnull=False, then=F('weight')))), Value(0.0)),
+            **{name: Coalesce(Sum(F(field) * F('weight')), Value(0.0)) for field, name in TIMING_SUMS.items()},
+        ).iterator():
+            key = (row['bucket'], row['method'], row['route_key'], row['response_status_code'])
+            total = totals.get(key)
+            if total is None:
+                totals[key] = row
+            else:
+                total['request_count'] += row['request_count']
+                total['weighted_count'] += row['weighted_count']
+                total['duration_sum'] += row['duration_sum']
+                total['duration_min'] = min(total['duration_min'], row['duration_min'])
+                total['duration_max'] = max(total['duration_max'], row['duration_max'])
+                for name in ('timed_count', *TIMING_SUMS.values()):
+                    total[name] += row[name]
+        for row in bucketed.filter(request_user__isnull=False).values('bucket', 'request_user').annotate(
+            request_count=Count('id'),
+        ).iterator():
+            users[(row['bucket'], row['request_user'])] += row['request_count']
+
+    APILogRollup.objects.bulk_create(
+        [
+            APILogRollup(
+                granularity=granularity,
+                bucket=row['bucket'],
+                method=row['method'],
+                route=row['route_key'],
+                status_code=row['response_status_code'],
+                request_count=row['request_count'],
+                weighted_count=row['weighted_count'],
+                duration_sum=row['duration_sum'],
+                duration_min=row['duration_min'],
+                duration_max=row['duration_max'],
+                timed_count=row['timed_count'],
+                **{name: row[name] for name in TIMING_SUMS.values()},
+            )
+            for row in totals.values()
+        ],
+        batch_size=1000,
+    )
+    APILogUserRollup.objects.bulk_create(
+        [
+            APILogUserRollup(granularity=granularity, bucket=bucket, user_id=user_id, request_count=count)
+            for (bucket, user_id), count in users.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def _rebuild_sketches(querysets):
+    sketches = defaultdict(DDSketch)
+    for logs in querysets:
+        rows = logs.values_list('route', 'request_timestamp', 'duration_ms', 'sample_weight')
+        for route, timestamp, duration, weight in rows.iterator():
+            for granularity in GRANULARITIES:
+                sketches[(granularity, truncate(timestamp, granularity), route or '')].add(duration, weight or 1.0)
+    APILogLatencySketch.objects.bulk_create(
+        [
+            APILogLatencySketch(granularity=granularity, bucket=bucket, route=route, sketch=sketch.to_json())
+            for (granularity, bucket, route), sketch in sketches.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def latency_percentiles(start, end):
+    """
+    Merge the latency sketches covering `[start, end)`. Returns the overall
+    percentiles and the percentiles per route.
+    """
+    overall = DDSketch()
+    endpoints = defaultdict(DDSketch)
+    rows = APILogLatencySketch.objects.filter(rollup_filter(start, end)).values_list('route', 'sketch')
+    for route, data in rows.iterator():
+        sketch = DDSketch.from_json(data)
+        overall.merge(sketch)
+        endpoints[route].merge(sketch)
+
+    return _percentiles(overall), [
+        {'route': route, 'count': round(sketch.count), **_percentiles(sketch)}
+        for route, sketch in sorted(endpoints.items(), key=lambda item: (-item[1].count, item[0]))
+    ]
+
+
+def _percentiles(sketch):
+    values = {name: sketch.quantile(q) for name, q in PERCENTILES}
+    values['max'] = sketch.max
+    return values
+
+
+def compute_stats(start, end, top=10):
+    """API usage statistics for `[start, end)` read from the rollups"""
+    rows = APILogRollup.objects.filter(rollup_filter(start, end))
+    users = APILogUserRollup.objects.filter(rollup_filter(start, end))
+
+    totals = rows.aggregate(
+        total_requests=Sum('weighted_count'), logged_requests=Sum('request_count'), duration_sum=Sum('duration_sum'),
+    )
+    total_requests = totals['total_requests'] or 0
+    logged_requests = totals['logged_requests'] or 0
+    user_totals = users.aggregate(unique_users=Count('user', distinct=True), request_count=Sum('request_count'))
+    unique_users = user_totals['unique_users']
+    # Anonymous requests count as one more user, like counting distinct request_user values
+    if logged_requests > (user_totals['request_count'] or 0):
+        unique_users += 1
+
+    latency, endpoint_latency = latency_percentiles(start, end)
+
+    # Average breakdown per route, over the requests that have one
+    endpoint_timings = [
+        {
+            'route': row['route'],
+            'count': round(row['timed']),
+            **{f'avg_{field}': row[field] / row['timed'] for field in TIMING_SUMS},
+        }
+        for row in rows.filter(timed_count__gt=0).values('route').annotate(
+            timed=Sum('timed_count'), **{field: Sum(name) for field, name in TIMING_SUMS.items()},
+        ).order_by('-timed', 'route')
+    ]
+
+    return {
+        'total_requests': round(total_requests),
+        'logged_requests': logged_requests,
+        'unique_endpoints': rows.values('route').distinct().count(),
+        'unique_users': unique_users,
+        'avg_response_time': totals['duration_sum'] / total_requests if total_requests else 0,
+        'status_code_distribution': [
+            {'response_status_code': row['status_code'], 'count': round(row['count'])}
+            for row in rows.values('status_code').annotate(count=Sum('weighted_count')).order_by('status_code')
+        ],
+        'method_distribution': [
+            {'method': row['method'], 'count': round(row['count'])}
+            for row in rows.values('method').annotate(count=Sum('weighted_count')).order_by('method')
+        ],
+        'top_endpoints': [
+            {'route': row['route'], 'count': round(row['count'])}
+            for row in rows.values('route').annotate(count=Sum('weighted_count')).order_by('-count', 'route')[:top]
+        ],
+        'latency_percentiles': latency,
+        'endpoint_latency_percentiles': endpoint_latency,
+        'endpoint_timings': endpoint_timings,
+    }
+
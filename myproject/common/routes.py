@@ -0,0 +1,127 @@
+"""
+Route templates and indexed path search for API logs.
+
+Logs record the URL pattern a request was resolved to, e.g.
+`/api/sample/sample/<int:pk>/`, so statistics group requests by endpoint
+instead of by object id.
+
+Substring search on `path` uses an index instead of scanning every row: a
+trigram FTS5 table kept up to date by triggers on SQLite, and a pg_trgm
+index on PostgreSQL, for `api_logs` and each partition (see
+common.partitions). Other databases and searches shorter than a trigram
+fall back to `icontains`.
+"""
+from django.db import OperationalError, connections
+from django.db.models.expressions import RawSQL
+
+PATH_SEARCH_TABLE = 'api_log_path_search'
+
+# Trigram indexes can't find anything shorter
+MIN_SEARCH_LENGTH = 3
+
+
+def request_route(request):
+    """Route template of a resolved request, or None"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None or match.route is None:
+        return None
+    return '/' + match.route
+
+
+def _sqlite_names(model):
+    """
+    `(schema, table, search table)` of the path search index of the logs of
+    `model`, APILog or a partition model. The schema prefixes the names of
+    tables in a partition's attached database.
+    """
+    from .models import APILog
+
+    table = model._meta.db_table
+    if table == APILog._meta.db_table:
+        return '', table, PATH_SEARCH_TABLE
+    return f'"{table}".', table, f'{table}_path_search'
+
+
+def install_path_search(using='default', model=None):
+    """
+    Create the path search index of the logs of `model` (default APILog,
+    or a partition model) if it doesn't exist. Runs after every migrate,
+    which also restores the SQLite triggers when a migration rebuilt the
+    table, and when a partition is created.
+    """
+    from .models import APILog
+
+    model = model or APILog
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            schema, table, search_table = _sqlite_names(model)
+            cursor.execute(f"SELECT 1 FROM {schema}sqlite_master WHERE type = 'table' AND name = %s", [table])
+            if cursor.fetchone() is None:
+                return
+            cursor.execute(f'SELECT 1 FROM {schema}sqlite_master WHERE name = %s', [search_table])
+            created = cursor.fetchone() is None
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {schema}{search_table} USING fts5("
+                    f"path, content='{table}', content_rowid='id', tokenize='trigram')"
+                )
+            except OperationalError as e:
+                # FTS5 or its trigram tokenizer (SQLite 3.34+) is not available
+                print(f"Error creating the API log path search index: {e}")
+                return
+            # Trigger bodies can't qualify table names, they are those of the trigger's schema
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {schema}{search_table}_insert AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {search_table} (rowid, path) VALUES (new.id, new.path); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {schema}{search_table}_delete AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {search_table} ({search_table}, rowid, path) "
+                f"VALUES ('delete', old.id, old.path); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {schema}{search_table}_update AFTER UPDATE OF path ON {table} BEGIN "
+                f"INSERT INTO {search_table} ({search_table}, rowid, path) "
+                f"VALUES ('delete', old.id, old.path); "
+                f"INSERT INTO {search_table} (rowid, path) VALUES (new.id, new.path); END"
+            )
+            if created:
+                cursor.execute(f"INSERT INTO {schema}{search_table} ({search_table}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            if table not in connection.introspection.table_names(cursor):
+                return
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            # Matches the UPPER(path::text) LIKE UPPER(...) that icontains generates
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {table}_path_trgm ON {table} USING gin ((UPPER(path::text)) gin_trgm_ops)'
+            )
+    connection.__dict__.setdefault('_api_log_path_search', {})[table] = True
+
+
+def _has_path_search(connection, model):
+    schema, table, search_table = _sqlite_names(model)
+    known = connection.__dict__.setdefault('_api_log_path_search', {})
+    if table not in known:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {schema}sqlite_master WHERE name = %s', [search_table])
+            known[table] = cursor.fetchone() is not None
+    return known[table]
+
+
+def search_path(queryset, value):
+    """Filter logs whose path contains `value`, ignoring case"""
+    connection = connections[queryset.db]
+    if (
+        connection.vendor == 'sqlite'
+        and len(value) >= MIN_SEARCH_LENGTH
+        and _has_path_search(connection, queryset.model)
+    ):
+        # A quoted phrase of trigrams matches the substring
+        schema, _, search_table = _sqlite_names(queryset.model)
+        phrase = '"' + value.replace('"', '""') + '"'
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {schema}{search_table} WHERE path MATCH %s', [phrase])
+        )
+    return queryset.filter(path__icontains=value)
@@ -0,0 +1,154 @@
+"""
+Sampling of API request logs.
+
+Whether a request is logged is decided before its view runs and its body
+is captured, from the rate of its route (`SAMPLING['ROUTES']`, longest
+prefix of the route template wins) and a token bucket capping the logs
+written per route and second. Errors and slow requests are logged
+whatever the decision, since they are only known once the response is.
+
+Every log carries a `sample_weight`: the number of requests it stands
+for. Sampled logs weigh `1 / rate`, plus the requests of the same route
+the cap dropped since the previous one, and always-kept logs weigh 1.
+Rollups sum weights rather than counting logs, so statistics estimate
+the real traffic.
+"""
+import random
+import threading
+import time
+
+from .capture import sample_rate_for_path
+from .conf import api_logging_settings
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, and bursts of `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SamplingDecision:
+    """Head decision for a request: `admitted` requests have their body captured"""
+    __slots__ = ('route', 'rate', 'sampled', 'admitted')
+
+    def __init__(self, route, rate, sampled, admitted):
+        self.route = route
+        self.rate = rate
+        self.sampled = sampled
+        self.admitted = admitted
+
+
+class Sampler:
+    """Per-route sampling with a per-route cap on logs per second"""
+
+    def __init__(self, default_rate=1.0, routes=None, keep_errors=True, slow_ms=None,
+                 max_per_second=None, burst=None):
+        self.default_rate = default_rate
+        self.routes = dict(routes or {})
+        self.keep_errors = keep_errors
+        self.slow_ms = slow_ms
+        self.max_per_second = max_per_second
+        self.burst = burst if burst is not None else max_per_second
+        self._lock = threading.Lock()
+        self._rates = {}
+        self._buckets = {}
+        # Requests dropped by the cap per route, added to the weight of the next log
+        self._dropped = {}
+
+        # Counters
+        self.sampled = 0
+        self.skipped = 0
+        self.capped = 0
+        self.kept = 0
+
+    @classmethod
+    def from_settings(cls):
+        conf = api_logging_settings('SAMPLING')
+        return cls(
+            default_rate=conf['DEFAULT_RATE'],
+            routes=conf['ROUTES'],
+            keep_errors=conf['KEEP_ERRORS'],
+            slow_ms=conf['SLOW_MS'],
+            max_per_second=conf['MAX_PER_SECOND'],
+            burst=conf['BURST'],
+        )
+
+    def rate(self, route):
+        rate = self._rates.get(route)
+        if rate is None:
+            rate = self._rates[route] = min(max(sample_rate_for_path(route, self.routes, self.default_rate), 0), 1)
+        return rate
+
+    def decide(self, route):
+        """Head decision for a request to `route` ('' when it didn't resolve)"""
+        rate = self.rate(route)
+        sampled = rate >= 1 or (rate > 0 and random.random() < rate)
+        admitted = sampled
+        if sampled and self.max_per_second is not None:
+            with self._lock:
+                bucket = self._buckets.get(route)
+                if bucket is None:
+                    bucket = self._buckets[route] = TokenBucket(self.max_per_second, max(self.burst, 1))
+                admitted = bucket.take()
+        return SamplingDecision(route, rate, sampled, admitted)
+
+    def weight(self, decision, status_code, duration_ms):
+        """Sample weight of the request's log, or None if it isn't logged"""
+        if (self.keep_errors and status_code >= 400) or (self.slow_ms is not None and duration_ms >= self.slow_ms):
+            self._count(kept=1)
+            return 1.0
+        if not decision.sampled:
+            self._count(skipped=1)
+            return None
+        with self._lock:
+            if not decision.admitted:
+                self._dropped[decision.route] = self._dropped.get(decision.route, 0) + 1
+                self.capped += 1
+                return None
+            dropped = self._dropped.pop(decision.route, 0)
+            self.sampled += 1
+        return (1 + dropped) / decision.rate
+
+    def stats(self):
+        return {
+            'sampled': self.sampled,
+            'skipped': self.skipped,
+            'capped': self.capped,
+            'kept': self.kept,
+        }
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def enabled():
+    return api_logging_settings('SAMPLING')['ENABLED']
+
+
+def get_sampler():
+    """Return the process-wide sampler, creating it on first use"""
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = Sampler.from_settings()
+    return _sampler
@@ -0,0 +1,227 @@
+"""
+Full-text search over API logs.
+
+On SQLite, logs are indexed in a contentless FTS5 table (`api_log_search`,
+and `api_logs_<period>_search` in each partition) covering the path,
+client IP, user agent and the request/response headers and bodies. The
+writer adds logs to the index in the transaction that
+inserts them and a trigger removes deleted logs, so the index never needs
+a rebuild. The text itself stays in the payload store (see
+common.payloads); the index only holds the terms.
+
+Searches return at most `API_LOGGING['SEARCH']['MAX_RESULTS']` logs,
+best matches first (bm25), ranked after the other filters of the search
+apply. Other databases fall back to a `icontains` match on the path and
+user agent.
+"""
+import re
+
+from django.db import OperationalError, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .conf import api_logging_settings
+
+SEARCH_TABLE = 'api_log_search'
+
+# Indexed columns, as log record keys, and their bm25 weights
+SEARCH_COLUMNS = {
+    'path': 4.0,
+    'request_ip': 2.0,
+    'user_agent': 1.0,
+    'request_headers': 1.0,
+    'request_body': 2.0,
+    'response_headers': 1.0,
+    'response_body': 2.0,
+}
+
+BATCH_SIZE = 500
+
+
+def enabled():
+    return api_logging_settings('SEARCH')['ENABLED']
+
+
+def _sqlite_names(model):
+    """
+    `(schema, table, search table)` of the search index of the logs of
+    `model`, APILog or a partition model. The schema prefixes the names of
+    tables in a partition's attached database.
+    """
+    from .models import APILog
+
+    table = model._meta.db_table
+    if table == APILog._meta.db_table:
+        return '', table, SEARCH_TABLE
+    return f'"{table}".', table, f'{table}_search'
+
+
+def install_search_index(using='default', model=None):
+    """
+    Create the search index of the logs of `model` (default APILog, or a
+    partition model) if it doesn't exist, indexing the existing logs. Runs
+    after every migrate, like the path search index, and when a partition
+    is created.
+    """
+    from .models import APILog
+
+    model = model or APILog
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not enabled():
+        return
+    schema, table, search_table = _sqlite_names(model)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT 1 FROM {schema}sqlite_master WHERE type = 'table' AND name = %s", [table])
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(f'SELECT 1 FROM {schema}sqlite_master WHERE name = %s', [search_table])
+        created = cursor.fetchone() is None
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {schema}{search_table} USING fts5("
+                f"{', '.join(SEARCH_COLUMNS)}, content='', contentless_delete=1)"
+            )
+        except OperationalError as e:
+            # FTS5 or contentless_delete (SQLite 3.43+) is not available
+            print(f"Error creating the API log search index: {e}")
+            return
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {schema}{search_table}_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM {search_table} WHERE rowid = old.id; END"
+        )
+    connection.__dict__.setdefault('_api_log_search', {})[table] = True
+    if created:
+        _index_existing(using, model)
+
+
+def _index_existing(using, model):
+    from .payloads import PAYLOAD_FIELDS
+
+    logs = model.objects.using(using).select_related(*PAYLOAD_FIELDS.values()).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(logs.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            return
+        index_logs(
+            [log.id for log in batch],
+            [{column: getattr(log, column) for column in SEARCH_COLUMNS} for log in batch],
+            using,
+            model,
+        )
+        last_id = batch[-1].id
+
+
+def has_search_index(connection, model=None):
+    from .models import APILog
+
+    if connection.vendor != 'sqlite' or not enabled():
+        return False
+    schema, table, search_table = _sqlite_names(model or APILog)
+    known = connection.__dict__.setdefault('_api_log_search', {})
+    if table not in known:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {schema}sqlite_master WHERE name = %s', [search_table])
+            known[table] = cursor.fetchone() is not None
+    return known[table]
+
+
+def index_logs(ids, records, using='default', model=None):
+    """Add logs of `model` (default APILog) to its search index, given their ids and log records"""
+    from .models import APILog
+
+    model = model or APILog
+    connection = connections[using]
+    if not ids or not has_search_index(connection, model):
+        return
+    schema, _, search_table = _sqlite_names(model)
+    columns = ', '.join(SEARCH_COLUMNS)
+    placeholders = ', '.join(['%s'] * (len(SEARCH_COLUMNS) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {schema}{search_table} (rowid, {columns}) VALUES ({placeholders})',
+            [[pk, *(record.get(column) for column in SEARCH_COLUMNS)] for pk, record in zip(ids, records)],
+        )
+
+
+def match_expression(query):
+    """
+    FTS5 query matching all the words of `query`, each taken literally:
+    `abc-123 timeout` becomes `"abc-123" "timeout"`
+    """
+    words = re.findall(r'\S+', query)
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def _search_table(queryset):
+    """
+    `(schema, search table)` of the index of the logs of `queryset`, or
+    None if there isn't one
+    """
+    if not has_search_index(connections[queryset.db], queryset.model):
+        return None
+    schema, _, search_table = _sqlite_names(queryset.model)
+    return schema, search_table
+
+
+def filter_matching(queryset, query):
+    """Filter the logs matching `query` through the index, or None without one"""
+    names = _search_table(queryset)
+    if names is None:
+        return None
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    schema, table = names
+    return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {schema}{table} WHERE {table} MATCH %s', [expression]))
+
+
+def ranked_ids(queryset, query, limit):
+    """
+    `(id, rank)` of the `limit` logs of `queryset` best matching `query`,
+    best first (lowest bm25 rank), or None without an index. The index is
+    joined with the filtered logs, so `queryset`'s filters apply before the
+    limit does.
+    """
+    names = _search_table(queryset)
+    if names is None:
+        return None
+    expression = match_expression(query)
+    if not expression:
+        return []
+    schema, table = names
+    weights = ', '.join(str(weight) for weight in SEARCH_COLUMNS.values())
+    logs, params = queryset.order_by().values('id').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f'SELECT {table}.rowid, bm25({table}, {weights}) AS rank '
+            f'FROM {schema}{table} JOIN ({logs}) AS logs ON logs.id = {table}.rowid '
+            f'WHERE {table} MATCH %s ORDER BY rank, {table}.rowid LIMIT %s',
+            [*params, expression, limit],
+        )
+        return cursor.fetchall()
+
+
+def search_logs(queryset, query, limit=None):
+    """
+    Logs of `queryset` matching `query`, best matches first and at most
+    `limit` of them (`SEARCH['MAX_RESULTS']` at most). Each log has a
+    `search_rank`, lower first, to merge the results of several tables.
+    """
+    max_results = api_logging_settings('SEARCH')['MAX_RESULTS']
+    limit = min(limit or max_results, max_results)
+    ranked = ranked_ids(queryset, query, limit)
+    if ranked is None:
+        # No index: newest matches of the path or user agent
+        words = Q()
+        for word in re.findall(r'\S+', query):
+            words &= Q(path__icontains=word) | Q(user_agent__icontains=word)
+        logs = list(queryset.filter(words).order_by('-request_timestamp', '-id')[:limit])
+        for log in logs:
+            log.search_rank = -log.request_timestamp.timestamp()
+        return logs
+    rank = dict(ranked)
+    logs = sorted(queryset.filter(id__in=rank), key=lambda log: (rank[log.id], log.id))
+    for log in logs:
+        log.search_rank = rank[log.id]
+    return logs
@@ -8,10 +8,11 @@ class APILogSerializer(serializers.ModelSerializer):
     class Meta:
         model = APILog
         fields = [
-            'id', 'method', 'path', 'query_params', 'request_headers',
+            'id', 'method', 'path', 'route', 'query_params', 'request_headers',
             'request_body', 'request_user', 'request_ip', 'response_status_code',
-            'response_headers', 'response_body', 'request_timestamp',
-            'response_timestamp', 'duration_ms', 'user_agent', 'content_type',
+            'response_headers', 'response_body', 'response_size', 'request_timestamp',
+            'response_timestamp', 'duration_ms', 'sql_count', 'sql_time_ms',
+            'auth_time_ms', 'view_time_ms', 'render_time_ms', 'sample_weight', 'user_agent', 'content_type',
             'created_at'
         ]
         read_only_fields = fields
@@ -48,7 +49,7 @@ class APILogSummarySerializer(serializers.ModelSerializer):
     class Meta:
         model = APILog
         fields = [
-            'id', 'method', 'path', 'response_status_code',
+            'id', 'method', 'path', 'route', 'response_status_code',
             'request_timestamp', 'duration_ms', 'request_user'
         ]
         read_only_fields = fields
@@ -0,0 +1,266 @@
+"""
+Destinations for API log records.
+
+`APILog.log_request` hands every record to the sink configured with
+`API_LOGGING['SINK']`:
+
+- `DatabaseSink` (default) inserts the logs, through the background writer
+  when it is enabled.
+- `SegmentFileSink` appends them to NDJSON segment files, so requests only
+  pay for a buffered write. Sealed segments are loaded into `api_logs` off
+  the hot path by the `load_api_log_segments` command.
+"""
+import atexit
+import json
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from .conf import api_logging_settings
+from .log_writer import get_log_writer, write_records
+
+# Segments being written end with OPEN_SUFFIX and are renamed when sealed
+SEGMENT_SUFFIX = '.ndjson'
+OPEN_SUFFIX = '.open'
+
+# Record keys holding datetimes, serialized as ISO 8601
+DATETIME_FIELDS = ('request_timestamp', 'response_timestamp')
+
+
+class BaseLogSink:
+    """Interface of log sinks. `write` and `awrite` must never raise."""
+
+    def write(self, record):
+        """Store a log record. May return the created log."""
+        raise NotImplementedError
+
+    async def awrite(self, record):
+        """Store a log record from async code without blocking the event loop"""
+        return self.write(record)
+
+    def flush(self):
+        """Make sure everything written so far is stored"""
+
+    def close(self):
+        self.flush()
+
+
+class DatabaseSink(BaseLogSink):
+    """Insert logs into `api_logs`, through the background writer if enabled"""
+
+    def write(self, record):
+        if api_logging_settings('WRITER')['ENABLED']:
+            get_log_writer().submit(record)
+            return None
+        try:
+            return write_records([record])[0]
+        except Exception as e:
+            # Log the error but don't break the request
+            print(f"Error logging API request: {e}")
+            return None
+
+    async def awrite(self, record):
+        if api_logging_settings('WRITER')['ENABLED']:
+            # Never wait for queue space from the event loop
+            get_log_writer().submit(record, block=False)
+            return None
+        try:
+            logs = await sync_to_async(write_records)([record])
+            return logs[0]
+        except Exception as e:
+            # Log the error but don't break the request
+            print(f"Error logging API request: {e}")
+            return None
+
+    def flush(self):
+        if api_logging_settings('WRITER')['ENABLED']:
+            get_log_writer().flush()
+
+
+def encode_record(record):
+    values = dict(record)
+    for field in DATETIME_FIELDS:
+        if values.get(field) is not None:
+            values[field] = values[field].isoformat()
+    return json.dumps(values, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def decode_record(line):
+    record = json.loads(line)
+    for field in DATETIME_FIELDS:
+        if record.get(field) is not None:
+            record[field] = parse_datetime(record[field])
+    return record
+
+
+class SegmentFileSink(BaseLogSink):
+    """
+    Append logs as NDJSON lines to segment files in `directory`.
+
+    Writes go through a `buffer_size` buffer and are fsynced every
+    `fsync_records` records or `fsync_interval` seconds, so a crash loses at
+    most that much. A segment is sealed (renamed from `*.ndjson.open` to
+    `*.ndjson`) when it reaches `max_bytes` or `max_age` seconds, checked on
+    write, and when the sink is closed. Each process writes its own
+    segments, so no locking between processes is needed.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_age=300.0,
+                 fsync_records=1000, fsync_interval=1.0, buffer_size=64 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.fsync_records = fsync_records
+        self.fsync_interval = fsync_interval
+        self.buffer_size = buffer_size
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._pid = None
+        self._opened_at = 0.0
+        self._size = 0
+        self._unsynced = 0
+        self._synced_at = 0.0
+
+        # Counters
+        self.written = 0
+        self.failed = 0
+        self.segments = 0
+
+    @classmethod
+    def from_settings(cls):
+        conf = api_logging_settings('SEGMENTS')
+        return cls(
+            directory=conf['DIRECTORY'] or settings.BASE_DIR / 'api_log_segments',
+            max_bytes=conf['MAX_BYTES'],
+            max_age=conf['MAX_AGE'],
+            fsync_records=conf['FSYNC_RECORDS'],
+            fsync_interval=conf['FSYNC_INTERVAL'],
+            buffer_size=conf['BUFFER_SIZE'],
+        )
+
+    def write(self, record):
+        try:
+            line = encode_record(record)
+            with self._lock:
+                now = time.monotonic()
+                if self._pid != os.getpid():
+                    # Forked: leave the parent's segment to the parent
+                    self._file = None
+                if self._file is not None and (
+                    self._size + len(line) > self.max_bytes or now - self._opened_at >= self.max_age
+                ):
+                    self._seal()
+                if self._file is None:
+                    self._open(now)
+                self._file.write(line)
+                self._size += len(line)
+                self._unsynced += 1
+                self.written += 1
+                if self._unsynced >= self.fsync_records or now - self._synced_at >= self.fsync_interval:
+                    self._sync(now)
+        except Exception as e:
+            self.failed += 1
+            print(f"Error writing API log segment: {e}")
+        return None
+
+    async def awrite(self, record):
+        # Writes may fsync or seal a segment, so they run off the event loop.
+        # The lock makes them safe from any thread.
+        return await sync_to_async(self.write, thread_sensitive=False)(record)
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._sync(time.monotonic())
+
+    def close(self):
+        """Write out and seal the current segment"""
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._seal()
+
+    def stats(self):
+        return {'written': self.written, 'failed': self.failed, 'segments': self.segments}
+
+    def _open(self, now):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f'api-logs-{time.time_ns()}-{os.getpid()}{SEGMENT_SUFFIX}{OPEN_SUFFIX}'
+        self._path = self.directory / name
+        self._file = open(self._path, 'ab', buffering=self.buffer_size)
+        self._pid = os.getpid()
+        self._opened_at = self._synced_at = now
+        self._size = 0
+        self._unsynced = 0
+        self.segments += 1
+
+    def _sync(self, now):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = now
+
+    def _seal(self):
+        self._sync(time.monotonic())
+        self._file.close()
+        self._path.rename(self._path.with_name(self._path.name.removesuffix(OPEN_SUFFIX)))
+        self._file = None
+        self._path = None
+
+
+class SegmentReader:
+    """
+    Read the records of a segment through a memory map, starting at byte
+    `offset`. Iterating yields `(record, end_offset)` pairs; an incomplete
+    last line, left by a crash, is skipped.
+    """
+
+    def __init__(self, path, offset=0):
+        self.path = Path(path)
+        self.offset = offset
+
+    def __iter__(self):
+        with open(self.path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size <= self.offset:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                position = self.offset
+                while True:
+                    end = data.find(b'\n', position)
+                    if end == -1:
+                        return
+                    if end > position:
+                        yield decode_record(data[position:end]), end + 1
+                    position = end + 1
+
+
+def sealed_segments(directory):
+    """Sealed segment files in `directory`, oldest first"""
+    directory = Path(directory)
+    if not directory.exists():
+        return []
+    return sorted(directory.glob(f'*{SEGMENT_SUFFIX}'))
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_log_sink():
+    """Return the process-wide sink configured in `API_LOGGING['SINK']`"""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                sink_class = import_string(api_logging_settings('SINK')['BACKEND'])
+                _sink = sink_class.from_settings() if hasattr(sink_class, 'from_settings') else sink_class()
+                atexit.register(_sink.close)
+    return _sink
@@ -0,0 +1,111 @@
+"""
+Mergeable quantile sketch for request latencies.
+
+`DDSketch` keeps counts in logarithmically sized bins so that every
+quantile it returns is within `relative_accuracy` of the exact value, and
+two sketches can be merged by adding their bins. This lets latency
+percentiles be stored per time bucket and combined over any range of
+buckets without looking at the raw durations.
+
+See "DDSketch: A Fast and Fully-Mergeable Quantile Sketch with
+Relative-Error Guarantees" (Masson, Rim, Lee, 2019).
+"""
+import json
+import math
+
+# Values below this are counted as zero
+MIN_VALUE = 1e-9
+
+
+class DDSketch:
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value, weight=1):
+        """Add a value, optionally counted `weight` times"""
+        if value < MIN_VALUE:
+            self.zero_count += weight
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += weight
+        self.sum += value * weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add the values of another sketch with the same accuracy"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different relative accuracies')
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def quantile(self, q):
+        """Return the value at quantile `q` (0 to 1), or None if the sketch is empty"""
+        if not self.count:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        running = self.zero_count
+        if running > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            running += self.bins[key]
+            if running > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def _collapse(self):
+        """Fold the lowest bins together to stay within `max_bins`"""
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        target = keys[len(excess)]
+        self.bins[target] += sum(self.bins.pop(key) for key in excess)
+
+    def to_json(self):
+        return json.dumps({
+            'a': self.relative_accuracy,
+            'b': self.bins,
+            'z': self.zero_count,
+            'n': self.count,
+            's': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data):
+        values = json.loads(data)
+        sketch = cls(relative_accuracy=values['a'])
+        sketch.bins = {int(key): count for key, count in values['b'].items()}
+        sketch.zero_count = values['z']
+        sketch.count = values['n']
+        sketch.sum = values['s']
+        sketch.min = values['min']
+        sketch.max = values['max']
+        return sketch
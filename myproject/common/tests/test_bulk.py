@@ -0,0 +1,83 @@
+from unittest import mock
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from api.sample.models import Sample
+from api.sample.serializers import SampleListSerializer
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/sample/sample/bulk/'
+
+
+@pytest.fixture
+def client(settings):
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}}
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user('alice'))
+    return client
+
+
+def taken_meanwhile(times):
+    """Name lookups missing the samples another request creates, the first `times` times"""
+    lookup = SampleListSerializer._existing_names
+    calls = []
+
+    def existing_names(names):
+        calls.append(names)
+        return {} if len(calls) <= times else lookup(names)
+
+    return mock.patch.object(SampleListSerializer, '_existing_names', side_effect=existing_names)
+
+
+@pytest.mark.parametrize('on_conflict, status', [('error', 'error'), ('skip', 'skipped')])
+def test_names_created_concurrently_get_a_result(client, on_conflict, status):
+    taken = Sample.objects.create(name='taken')
+
+    with taken_meanwhile(1):
+        response = client.post(f'{URL}?on_conflict={on_conflict}', [{'name': 'new'}, {'name': 'taken'}], format='json')
+
+    assert response.status_code == 200
+    assert [result['status'] for result in response.json()['results']] == ['created', status]
+    assert Sample.objects.filter(name='new').exists()
+    assert Sample.objects.get(name='taken') == taken
+
+
+def test_names_created_concurrently_are_updated(client):
+    Sample.objects.create(name='taken', description='before')
+    in_bulk = Sample.objects.in_bulk
+    calls = []
+
+    def missing_first(*args, **kwargs):
+        calls.append(args)
+        return {} if len(calls) == 1 else in_bulk(*args, **kwargs)
+
+    with mock.patch.object(Sample.objects, 'in_bulk', side_effect=missing_first):
+        response = client.post(f'{URL}?on_conflict=update', [{'name': 'taken', 'description': 'after'}], format='json')
+
+    assert response.json()['updated'] == 1
+    assert Sample.objects.get(name='taken').description == 'after'
+
+
+def test_renames_to_names_taken_concurrently_are_errors(client):
+    sample = Sample.objects.create(name='first')
+    Sample.objects.create(name='taken')
+
+    with taken_meanwhile(1):
+        response = client.patch(URL, [{'id': sample.pk, 'name': 'taken'}], format='json')
+
+    assert response.json()['results'][0]['errors'] == {'name': ['sample with this name already exists.']}
+    assert Sample.objects.get(pk=sample.pk).name == 'first'
+
+
+def test_names_that_keep_conflicting_are_reported(client):
+    Sample.objects.create(name='taken')
+
+    with taken_meanwhile(3):
+        response = client.post(URL, [{'name': 'new'}, {'name': 'taken'}], format='json')
+
+    assert response.status_code == 409
+    assert response.json()['names'] == ['taken']
+    assert not Sample.objects.filter(name='new').exists()
@@ -0,0 +1,64 @@
+import io
+
+import pytest
+from django.test import RequestFactory
+
+from common.capture import PrefixedStream, capture_request_body
+
+BODY = b'first line\nsecond line\n\nfourth line without newline'
+
+
+def split_stream(at):
+    """A stream over BODY whose first `at` bytes were already captured"""
+    stream = io.BytesIO(BODY)
+    return PrefixedStream(stream.read(at), stream)
+
+
+def read_all(read, size):
+    chunks = []
+    while chunk := read(size):
+        chunks.append(chunk)
+    return chunks
+
+
+@pytest.mark.parametrize('at', [0, 1, 10, 11, 12, len(BODY) - 1, len(BODY)])
+@pytest.mark.parametrize('size', [None, -1, 1, 5, 10, 11, 12, 100])
+def test_read_matches_the_unwrapped_stream(at, size):
+    assert read_all(split_stream(at).read, size) == read_all(io.BytesIO(BODY).read, size)
+
+
+@pytest.mark.parametrize('at', [0, 1, 10, 11, 12, 23, 24, len(BODY) - 1, len(BODY)])
+@pytest.mark.parametrize('size', [None, -1, 1, 5, 10, 11, 12, 100])
+def test_readline_matches_the_unwrapped_stream(at, size):
+    assert read_all(split_stream(at).readline, size) == read_all(io.BytesIO(BODY).readline, size)
+
+
+def test_mixed_reads_across_the_prefix():
+    stream = split_stream(15)
+    assert stream.readline() == b'first line\n'
+    assert stream.read(2) == b'se'
+    assert stream.readline(5) == b'cond '
+    assert stream.readline() == b'line\n'
+    assert stream.read() == b'\nfourth line without newline'
+    assert stream.read() == b''
+
+
+@pytest.fixture
+def small_capture(settings):
+    settings.API_LOGGING = {'BODY_CAPTURE': {'MAX_BYTES': 16, 'SKIP_CONTENT_TYPES': []}}
+
+
+def test_view_sees_the_full_body_after_capture(small_capture):
+    body = b'{"name": "' + b'x' * 100 + b'"}'
+    request = RequestFactory().post('/api/sample/sample/', body, content_type='application/json')
+
+    assert capture_request_body(request) == body[:16].decode()
+    assert request.body == body
+
+
+def test_form_parsing_reads_through_the_prefix(small_capture):
+    request = RequestFactory().post('/api/sample/sample/', {'name': 'a' * 40, 'description': 'b' * 40})
+
+    assert capture_request_body(request).startswith('--')
+    assert request.POST['name'] == 'a' * 40
+    assert request.POST['description'] == 'b' * 40
@@ -0,0 +1,47 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from api.sample.models import Sample
+from middlewares.current_user import CurrentUserMiddleware
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user('alice', password='correct horse battery staple')
+
+
+def test_use_current_user_restores_the_previous_user(user):
+    with CurrentUserMiddleware.use_current_user(user):
+        assert CurrentUserMiddleware.get_current_user() == user
+        sample = Sample.objects.create(name='first')
+
+    assert CurrentUserMiddleware.get_current_user() is None
+    assert sample.created_by == user
+
+
+def test_set_current_user_is_undone_with_its_token(user):
+    other = User.objects.create_user('bob')
+    with CurrentUserMiddleware.use_current_user(other):
+        token = CurrentUserMiddleware.set_current_user(user)
+        assert CurrentUserMiddleware.get_current_user() == user
+
+        CurrentUserMiddleware.reset_current_user(token)
+        assert CurrentUserMiddleware.get_current_user() == other
+
+
+def test_authenticated_user_doesnt_outlive_the_request(user, settings):
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}}
+    client = APIClient()
+    token = client.post(
+        '/api/token/', {'username': 'alice', 'password': 'correct horse battery staple'}, format='json',
+    ).json()['access']
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    response = client.post('/api/sample/sample/', {'name': 'first'}, format='json')
+
+    assert response.status_code == 201
+    assert Sample.objects.get(name='first').created_by == user
+    assert CurrentUserMiddleware.get_current_user() is None
@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.test import AsyncClient
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common import export
+from common.log_writer import write_records
+
+URL = '/api/common/api-logs/export/'
+START = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def logs(settings, monkeypatch):
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}}
+    # Several chunks for a few logs
+    monkeypatch.setattr(export, 'CHUNK_SIZE', 512)
+    timestamps = [START + timedelta(seconds=seconds) for seconds in range(20)]
+    write_records([
+        dict(
+            method='PUT', path=f'/api/sample/sample/{index}/', response_status_code=200,
+            request_timestamp=timestamp, response_timestamp=timestamp, duration_ms=1.0,
+        )
+        for index, timestamp in enumerate(timestamps)
+    ])
+    return User.objects.create_user('admin', is_staff=True)
+
+
+def paths(content):
+    return [json.loads(line)['path'] for line in content.decode().splitlines()]
+
+
+@pytest.mark.django_db
+def test_export_streams_the_logs(logs):
+    client = APIClient()
+    client.force_authenticate(logs)
+
+    response = client.get(URL, {'method': 'PUT'})
+
+    assert not response.is_async
+    assert paths(b''.join(response.streaming_content)) == [f'/api/sample/sample/{index}/' for index in range(20)]
+
+
+# The view runs in another thread, which must see the logs
+@pytest.mark.django_db(transaction=True)
+def test_export_streams_asynchronously_under_asgi(logs):
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(logs)}'}
+
+    async def export_logs():
+        response = await AsyncClient().get(URL, {'method': 'PUT'}, headers=headers)
+        return response.is_async, [chunk async for chunk in response.streaming_content]
+
+    is_async, chunks = async_to_sync(export_logs)()
+
+    assert is_async
+    assert len(chunks) > 1
+    assert paths(b''.join(chunks)) == [f'/api/sample/sample/{index}/' for index in range(20)]
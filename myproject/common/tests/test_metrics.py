@@ -0,0 +1,51 @@
+import pytest
+from django.contrib.auth.models import User
+from django.test import Client
+
+pytestmark = pytest.mark.django_db
+
+URL = '/metrics'
+
+
+@pytest.fixture
+def client(settings):
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}}
+    return Client()
+
+
+def test_metrics_are_staff_only_without_a_token(client):
+    assert client.get(URL).status_code == 403
+
+    client.force_login(User.objects.create_user('alice'))
+    assert client.get(URL).status_code == 403
+
+    client.force_login(User.objects.create_user('admin', is_staff=True))
+    assert client.get(URL).status_code == 200
+
+
+def test_metrics_can_be_public(client, settings):
+    settings.METRICS = {'PUBLIC': True}
+
+    assert client.get(URL).status_code == 200
+
+
+def test_metrics_require_the_token(client, settings):
+    settings.METRICS = {'TOKEN': 'secret'}
+    client.force_login(User.objects.create_user('admin', is_staff=True))
+
+    assert client.get(URL).status_code == 401
+    assert client.get(URL, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get(URL, headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_unknown_methods_share_one_label(client, settings):
+    settings.METRICS = {'PUBLIC': True}
+    for method in ('FOO', 'BAR', 'BAZ'):
+        client.generic(method, '/api/sample/hello/')
+
+    lines = client.get(URL).content.decode().splitlines()
+
+    series = [line for line in lines if line.startswith('api_requests_total{') and '/api/sample/hello/' in line]
+    assert len(series) == 1
+    assert 'method="other"' in series[0]
+    assert float(series[0].split()[-1]) == 3
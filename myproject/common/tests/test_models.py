@@ -0,0 +1,74 @@
+import re
+
+import pytest
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.sample.models import Sample
+
+pytestmark = pytest.mark.django_db
+
+
+def sample_updates(queries):
+    """Columns set by each UPDATE of `sample_sample` among `queries`"""
+    updates = []
+    for query in queries:
+        match = re.match(r'UPDATE "sample_sample" SET (.*) WHERE', query['sql'])
+        if match:
+            updates.append(set(re.findall(r'"(\w+)" = ', match.group(1))))
+    return updates
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user('alice', password='correct horse battery staple')
+
+
+@pytest.fixture
+def client(user, settings):
+    # Logs are written in the request, the writer thread wouldn't see the test database
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}}
+    client = APIClient()
+    token = client.post(
+        '/api/token/', {'username': 'alice', 'password': 'correct horse battery staple'}, format='json',
+    ).json()['access']
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def test_patch_updates_only_changed_fields(client, user):
+    sample = Sample.objects.create(name='first', description='before', created_by=user)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.patch(f'/api/sample/sample/{sample.pk}/', {'description': 'after'}, format='json')
+
+    assert response.status_code == 200
+    assert sample_updates(queries) == [{'updated_by_id', 'updated_at', 'description'}]
+    sample.refresh_from_db()
+    assert (sample.name, sample.description, sample.updated_by.username) == ('first', 'after', 'alice')
+
+
+def test_unchanged_save_writes_nothing():
+    Sample.objects.create(name='first', description='before')
+    sample = Sample.objects.get(name='first')
+    sample.description = 'before'
+
+    with CaptureQueriesContext(connection) as queries:
+        sample.save()
+
+    assert sample_updates(queries) == []
+
+
+def test_save_after_refresh_detects_changes():
+    sample = Sample.objects.create(name='first', description='before')
+    Sample.objects.filter(pk=sample.pk).update(description='elsewhere')
+    sample.refresh_from_db()
+    sample.description = 'before'
+
+    with CaptureQueriesContext(connection) as queries:
+        sample.save()
+
+    assert sample_updates(queries) == [{'description', 'updated_by_id', 'updated_at'}]
+    assert Sample.objects.get(pk=sample.pk).description == 'before'
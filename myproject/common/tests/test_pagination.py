@@ -0,0 +1,139 @@
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from common import partitions
+from common.log_writer import write_records
+from common.models import APILog
+
+pytestmark = pytest.mark.django_db
+
+URL = '/api/common/api-logs/'
+START = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client(settings):
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}}
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+    return client
+
+
+def write_logs(timestamps):
+    # PUT keeps them apart from the logs of the test's own requests
+    write_records([
+        dict(
+            method='PUT', path=f'/api/sample/sample/{index}/', response_status_code=200,
+            request_timestamp=timestamp, response_timestamp=timestamp, duration_ms=1.0,
+        )
+        for index, timestamp in enumerate(timestamps)
+    ])
+
+
+def pages(client, **params):
+    """Ids of every page, following the next links"""
+    response = client.get(URL, {'method': 'PUT', **params})
+    result = []
+    while True:
+        assert response.status_code == 200
+        result.append([log['id'] for log in response.json()['results']])
+        if not response.json()['next']:
+            return result
+        response = client.get(response.json()['next'])
+
+
+def newest_first():
+    logs = APILog.objects.filter(method='PUT').order_by('-request_timestamp', '-id')
+    return list(logs.values_list('id', flat=True))
+
+
+def test_pages_walk_the_logs_newest_first(client):
+    write_logs([START + timedelta(minutes=minutes) for minutes in range(23)])
+
+    result = pages(client, page_size=5)
+
+    assert [len(page) for page in result] == [5, 5, 5, 5, 3]
+    assert [pk for page in result for pk in page] == newest_first()
+
+
+def test_ties_on_the_timestamp_are_split_by_id(client):
+    # Pages end in the middle of runs of logs sharing a timestamp
+    write_logs([START] * 7 + [START + timedelta(seconds=1)] * 6 + [START - timedelta(seconds=1)] * 4)
+
+    result = pages(client, page_size=4)
+
+    ids = [pk for page in result for pk in page]
+    assert len(ids) == len(set(ids)) == 17
+    assert ids == newest_first()
+
+
+def test_logs_written_while_paginating_dont_shift_the_pages(client):
+    write_logs([START + timedelta(minutes=minutes) for minutes in range(10)])
+    expected = newest_first()
+
+    first = client.get(URL, {'method': 'PUT', 'page_size': 4}).json()
+    write_logs([START + timedelta(minutes=minutes) for minutes in (20, 21, 22)])
+    second = client.get(first['next']).json()
+
+    assert [log['id'] for log in first['results'] + second['results']] == expected[:8]
+
+
+def encode(querystring):
+    return base64.urlsafe_b64encode(querystring.encode()).decode()
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    '%%%',
+    encode('garbage'),
+    encode('t=yesterday&id=1'),
+    encode('t=2026-10-01T00:00:00%2B00:00&id=abc'),
+    encode('t=2026-10-01T00:00:00%2B00:00'),
+    encode('t=2026-13-45T00:00:00%2B00:00&id=1'),
+    encode('t=2026-10-01T00:00:00%2B00:00&id=' + '9' * 30),
+    encode('t=2026-10-01T00:00:00%2B00:00&id=-1'),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+])
+def test_invalid_cursors_are_rejected(client, cursor):
+    write_logs([START])
+
+    response = client.get(URL, {'cursor': cursor})
+
+    assert response.status_code == 400
+    assert response.json() == {'cursor': ['Invalid cursor']}
+
+
+@pytest.mark.parametrize('cursor', [encode('o=-1'), encode('o=x'), encode('t=2026-10-01T00:00:00%2B00:00&id=1')])
+def test_invalid_search_cursors_are_rejected(client, cursor):
+    write_logs([START])
+
+    response = client.get(URL, {'q': 'sample', 'cursor': cursor})
+
+    assert response.status_code == 400
+
+
+def test_pages_are_merged_over_partitions(client, settings, tmp_path):
+    settings.API_LOGGING = {
+        'WRITER': {'ENABLED': False},
+        'PARTITIONING': {'ENABLED': True, 'PERIOD': 'day', 'DIRECTORY': str(tmp_path)},
+    }
+    # Ties across the day boundary and within each day
+    write_logs([START - timedelta(hours=hours // 3) for hours in range(30)] + [START] * 3)
+
+    result = pages(client, page_size=4, date_from='2026-09-29T00:00:00Z')
+
+    ids = [pk for page in result for pk in page]
+    logs = sorted(
+        (
+            log for key in partitions.partitions_between()
+            for log in partitions.partition_model(key).objects.filter(method='PUT')
+        ),
+        key=lambda log: (log.request_timestamp, log.id), reverse=True,
+    )
+    assert len(ids) == 33
+    assert ids == [log.id for log in logs]
+
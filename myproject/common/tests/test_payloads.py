@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+
+from common import partitions, payloads
+from common.log_writer import write_records
+from common.models import APILog, APILogPayload
+
+pytestmark = pytest.mark.django_db
+
+# A day of its own: partitions stay attached to the connection between tests
+TIMESTAMP = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def log(body):
+    return dict(
+        method='GET', path='/api/sample/sample/', response_status_code=200,
+        request_timestamp=TIMESTAMP, response_timestamp=TIMESTAMP, duration_ms=1.0, response_body=body,
+    )
+
+
+def test_unreferenced_payloads_are_collected():
+    write_records([log('kept'), log('dropped')])
+    APILog.objects.filter(response_body_payload=payloads.digest(b'dropped')).delete()
+
+    assert payloads.collect_garbage(batch_size=1) == 1
+    assert list(APILogPayload.objects.values_list('digest', flat=True)) == [payloads.digest(b'kept')]
+
+
+@pytest.fixture(params=[False, True], ids=['main table', 'partitioned'])
+def partitioning(request, settings, tmp_path):
+    settings.API_LOGGING = {
+        'PARTITIONING': {'ENABLED': request.param, 'PERIOD': 'day', 'DIRECTORY': str(tmp_path)},
+    }
+
+
+def test_payload_reused_during_collection_is_kept(partitioning):
+    write_records([log('shared'), log('unused')])
+    for queryset in partitions.log_querysets():
+        queryset.delete()
+
+    # Another process logs the same body between the lookups and the delete
+    filter = APILogPayload.objects.filter
+
+    def concurrent(*args, **lookups):
+        if 'digest__in' in lookups:
+            write_records([log('shared')])
+        return filter(*args, **lookups)
+
+    with mock.patch.object(APILogPayload.objects, 'filter', side_effect=concurrent):
+        assert payloads.collect_garbage() == 1
+
+    logs = [entry for queryset in partitions.log_querysets() for entry in queryset]
+    assert [entry.response_body for entry in logs] == ['shared']
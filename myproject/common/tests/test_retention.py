@@ -0,0 +1,117 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from common import partitions
+from common.log_writer import write_records
+from common.models import APILog
+from common.retention import RetentionEngine, RetentionPolicy
+
+pytestmark = pytest.mark.django_db
+
+POLICIES = [
+    RetentionPolicy(days=90, name='errors', status_min=500),
+    RetentionPolicy(days=7, path_prefix='/api/token/'),
+]
+
+
+def log(days_ago, status=200, path='/api/sample/sample/', now=None):
+    timestamp = (now or timezone.now()) - timedelta(days=days_ago)
+    return dict(
+        method='GET', path=path, response_status_code=status,
+        request_timestamp=timestamp, response_timestamp=timestamp, duration_ms=1.0,
+    )
+
+
+def write_logs(records):
+    # Oldest first, like the writer: ids follow the timestamps
+    return write_records(sorted(records, key=lambda record: record['request_timestamp']))
+
+
+def remaining(model=APILog):
+    return sorted(model.objects.values_list('path', 'response_status_code', 'request_timestamp'))
+
+
+def test_first_matching_policy_applies():
+    now = timezone.now()
+    kept = [
+        log(60, status=503, now=now),
+        log(60, status=500, path='/api/token/', now=now),  # errors wins over the token policy
+        log(5, path='/api/token/', now=now),
+        log(20, now=now),
+    ]
+    deleted = [
+        log(100, status=500, now=now),
+        log(10, path='/api/token/', now=now),
+        log(40, now=now),
+        log(40, status=404, now=now),
+    ]
+    write_logs(deleted + kept)
+
+    engine = RetentionEngine(POLICIES, 30, now=now)
+
+    assert engine.expired_logs().count() == 4
+    assert engine.run() == 4
+    assert remaining() == sorted(
+        (record['path'], record['response_status_code'], record['request_timestamp']) for record in kept
+    )
+
+
+def test_policy_order_changes_the_outcome():
+    now = timezone.now()
+    write_logs([log(60, status=500, path='/api/token/', now=now)])
+
+    assert RetentionEngine(POLICIES, 30, now=now).expired_logs().count() == 0
+    assert RetentionEngine(POLICIES[::-1], 30, now=now).expired_logs().count() == 1
+
+
+def test_batches_resume_from_start_id():
+    now = timezone.now()
+    logs = write_logs([log(40 + index, now=now) for index in range(7)] + [log(1, now=now)])
+    ids = [entry.pk for entry in logs[:7]]
+
+    batches = []
+    engine = RetentionEngine([], 30, batch_size=3, now=now)
+    assert engine.run(start_id=ids[2], progress=lambda *args: batches.append(args)) == 5
+
+    assert batches == [(3, 3, ids[4]), (2, 5, ids[6])]
+    assert sorted(APILog.objects.values_list('id', flat=True)) == ids[:2] + [logs[-1].pk]
+
+
+def test_command_resumes_from_start_id(settings):
+    settings.API_LOGGING = {'RETENTION': {'DEFAULT_DAYS': 30}}
+    ids = [entry.pk for entry in write_logs([log(40 + index) for index in range(4)])]
+
+    call_command(
+        'cleanup_api_logs', '--start-id', str(ids[2]), '--batch-size', '1', verbosity=0, stdout=StringIO(),
+    )
+
+    assert sorted(APILog.objects.values_list('id', flat=True)) == ids[:2]
+
+
+# Partitions are attached and detached outside of transactions
+@pytest.mark.django_db(transaction=True)
+def test_partitions_are_dropped_or_cleaned(settings, tmp_path):
+    settings.API_LOGGING = {
+        'PARTITIONING': {'ENABLED': True, 'PERIOD': 'day', 'DIRECTORY': str(tmp_path)},
+        'RETENTION': {'DEFAULT_DAYS': 30, 'POLICIES': [{'DAYS': 90, 'STATUS_MIN': 500}]},
+    }
+    now = timezone.now()
+    write_logs([
+        log(120, now=now), log(120, status=500, now=now),  # past every retention
+        log(60, now=now), log(60, status=500, now=now),  # only the error is kept
+        log(1, now=now),
+    ])
+    old, middle, recent = partitions.existing_partitions()
+
+    call_command('cleanup_api_logs', '--dry-run', stdout=StringIO())
+    assert partitions.existing_partitions() == [old, middle, recent]
+
+    call_command('cleanup_api_logs', verbosity=0, stdout=StringIO())
+
+    assert partitions.existing_partitions() == [middle, recent]
+    assert list(partitions.partition_model(middle).objects.values_list('response_status_code', flat=True)) == [500]
+    assert partitions.partition_model(recent).objects.count() == 1
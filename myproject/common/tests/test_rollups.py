@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+from unittest import mock
+
+import pytest
+
+from common import rollups
+from common.log_writer import write_records
+from common.models import APILogLatencySketch, APILogRollup
+from common.sketches import DDSketch
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+
+def log_at(timestamp):
+    return dict(
+        method='GET', path='/api/sample/sample/', response_status_code=200,
+        request_timestamp=timestamp, response_timestamp=timestamp, duration_ms=5.0,
+    )
+
+
+def test_cutoffs_are_aligned_on_the_coarser_granularity():
+    cutoffs = rollups.rollup_cutoffs(NOW)
+    assert cutoffs == {
+        'minute': datetime(2026, 10, 10, 12, 0, tzinfo=timezone.utc),
+        'hour': datetime(2026, 7, 19, 0, 0, tzinfo=timezone.utc),
+        'day': None,
+    }
+
+
+def test_ranges_past_a_cutoff_are_widened():
+    start, end = NOW - timedelta(days=10, minutes=40), NOW - timedelta(days=10, minutes=30)
+    assert rollups.retained_range(start, end, NOW) == (NOW - timedelta(days=10, hours=1), NOW - timedelta(days=10))
+    recent = (NOW - timedelta(minutes=40), NOW - timedelta(minutes=30))
+    assert rollups.retained_range(*recent, NOW) == recent
+
+
+@pytest.mark.django_db
+def test_prune_keeps_the_statistics_of_old_ranges():
+    times = [NOW - timedelta(days=days, minutes=37) for days in (1, 10, 100)]
+    write_records([log_at(timestamp) for timestamp in times])
+
+    def totals():
+        return [
+            rollups.compute_stats(timestamp - timedelta(minutes=5), timestamp + timedelta(minutes=5))['total_requests']
+            for timestamp in times
+        ]
+
+    assert rollups.prune(NOW, dry_run=True) == {'minute': 4, 'hour': 2, 'day': 0}
+    assert APILogRollup.objects.count() == 9
+    assert rollups.prune(NOW, batch_size=1) == {'minute': 4, 'hour': 2, 'day': 0}
+    assert sorted(APILogRollup.objects.values_list('granularity', flat=True)) == ['day'] * 3 + ['hour'] * 2 + ['minute']
+    assert APILogLatencySketch.objects.count() == 6
+    assert totals() == [1, 1, 1]
+
+
+@pytest.mark.django_db
+def test_contended_sketch_is_merged_under_a_lock():
+    key = dict(granularity='minute', bucket=NOW, route='/api/sample/sample/')
+    sketch = DDSketch()
+    sketch.add(5.0)
+    rollups._merge_sketch(key, sketch)
+
+    # Every optimistic update finds the version changed by another writer
+    filter = APILogLatencySketch.objects.filter
+
+    def contended(**lookups):
+        return filter(**{**lookups, 'version': -1} if 'version' in lookups else lookups)
+
+    with mock.patch.object(APILogLatencySketch.objects, 'filter', side_effect=contended):
+        rollups._merge_sketch(key, sketch)
+
+    stored = APILogLatencySketch.objects.get(**key)
+    assert (DDSketch.from_json(stored.sketch).count, stored.version) == (2, 1)
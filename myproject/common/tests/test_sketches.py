@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from common.benchmarks import DISTRIBUTIONS
+from common.rollups import PERCENTILES
+from common.sketches import DDSketch
+
+
+def sample(name, count=20000, seed=0):
+    rng = random.Random(seed)
+    return [max(DISTRIBUTIONS[name](rng), 0.0) for _ in range(count)]
+
+
+def sketch_of(values):
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def merged(*sketches):
+    result = DDSketch()
+    for sketch in sketches:
+        result.merge(sketch)
+    return result
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def relative_error(estimate, expected):
+    return abs(estimate - expected) / expected if expected else abs(estimate)
+
+
+@pytest.mark.parametrize('name', DISTRIBUTIONS)
+def test_percentiles_within_relative_accuracy(name):
+    values = sample(name)
+    sketch = sketch_of(values)
+    for label, q in PERCENTILES:
+        expected = exact_quantile(values, q)
+        assert relative_error(sketch.quantile(q), expected) <= sketch.relative_accuracy + 1e-9, label
+    assert sketch.quantile(1) == max(values)
+
+
+@pytest.mark.parametrize('name', DISTRIBUTIONS)
+def test_merged_percentiles_within_relative_accuracy(name):
+    values = sample(name)
+    # One sketch per bucket, stored and merged back as the rollups do
+    sketch = merged(*(DDSketch.from_json(sketch_of(values[i::50]).to_json()) for i in range(50)))
+    assert sketch.count == len(values)
+    for label, q in PERCENTILES:
+        expected = exact_quantile(values, q)
+        assert relative_error(sketch.quantile(q), expected) <= sketch.relative_accuracy + 1e-9, label
+
+
+def test_merge_is_associative_and_commutative():
+    a, b, c = (sketch_of(sample('bimodal', 5000, seed)) for seed in (1, 2, 3))
+    left = merged(merged(a, b), c)
+    right = merged(a, merged(c, b))
+
+    assert left.bins == right.bins
+    assert (left.count, left.zero_count, left.min, left.max) == (right.count, right.zero_count, right.min, right.max)
+    assert left.sum == pytest.approx(right.sum)
+    for _, q in PERCENTILES:
+        assert left.quantile(q) == right.quantile(q)
+
+
+def test_merge_rejects_different_accuracies():
+    with pytest.raises(ValueError):
+        DDSketch(relative_accuracy=0.01).merge(DDSketch(relative_accuracy=0.02))
+
+
+def test_empty_sketch():
+    assert DDSketch().quantile(0.5) is None
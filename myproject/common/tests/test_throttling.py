@@ -0,0 +1,54 @@
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+pytestmark = pytest.mark.django_db
+
+LOGIN_URL = '/api/token/'
+INFO_URL = '/api/token/info/'
+
+
+@pytest.fixture
+def throttling(settings):
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}}
+    settings.THROTTLING = {
+        'SCOPES': {
+            'token_obtain': {'IP': {'RATE': '2/min'}, 'USERNAME': {'RATE': '100/min'}},
+            'token_info': {'IP': {'RATE': '100/min'}, 'USERNAME': {'RATE': '2/min'}},
+        },
+    }
+    return settings
+
+
+def login(forwarded_for, remote_addr='10.0.0.1', username='alice'):
+    return APIClient().post(
+        LOGIN_URL, {'username': username, 'password': 'wrong'}, format='json',
+        REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for,
+    ).status_code
+
+
+def test_spoofed_forwarded_for_shares_the_client_bucket(throttling):
+    statuses = [login(f'203.0.113.{index}', username=f'user{index}') for index in range(4)]
+
+    assert statuses == [401, 401, 429, 429]
+
+
+def test_forwarded_for_is_read_behind_trusted_proxies(throttling):
+    throttling.THROTTLING = {**throttling.THROTTLING, 'NUM_PROXIES': 1}
+
+    # The proxy appends the address it got the request from
+    assert [login(f'1.1.1.1, 203.0.113.{index}') for index in range(4)] == [401] * 4
+    assert [login(f'{index}.1.1.1, 203.0.113.9') for index in range(4)] == [401, 401, 429, 429]
+
+
+def test_token_info_is_throttled_per_user(throttling):
+    token = AccessToken.for_user(User.objects.create_user('alice'))
+    statuses = [
+        APIClient().get(
+            INFO_URL, HTTP_AUTHORIZATION=f'Bearer {token}', REMOTE_ADDR=f'10.0.0.{index}',
+        ).status_code
+        for index in range(3)
+    ]
+
+    assert statuses == [200, 200, 429]
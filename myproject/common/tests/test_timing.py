@@ -0,0 +1,57 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common.models import APILog
+from middlewares.api_logging import APILoggingMiddleware
+
+URL = '/api/sample/sample/'
+
+
+@pytest.fixture
+def user(settings):
+    settings.API_LOGGING = {'WRITER': {'ENABLED': False}, 'TIMING': {'SERVER_TIMING': True}}
+    return User.objects.create_user('alice')
+
+
+def phases(response):
+    return [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+
+
+@pytest.mark.django_db
+def test_phases_are_timed(user):
+    client = APIClient()
+    client.force_authenticate(user)
+
+    response = client.get(URL)
+
+    assert phases(response) == ['db', 'view', 'render', 'total']
+    log = APILog.objects.get(path=URL)
+    assert log.view_time_ms is not None and log.render_time_ms is not None
+
+
+def test_hooks_run_on_the_event_loop_under_asgi():
+    handler = ASGIHandler()
+    hooks = [
+        getattr(hook, '__func__', hook) for hook in handler._view_middleware + handler._template_response_middleware
+        if isinstance(getattr(hook, '__self__', None), APILoggingMiddleware)
+    ]
+
+    # Not wrapped in sync_to_async
+    assert hooks == [APILoggingMiddleware.aprocess_view, APILoggingMiddleware.aprocess_template_response]
+
+
+# The view runs in another thread, which must see the user
+@pytest.mark.django_db(transaction=True)
+def test_phases_are_timed_under_asgi(user):
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+    response = async_to_sync(AsyncClient().get)(URL, headers=headers)
+
+    assert phases(response) == ['db', 'auth', 'view', 'render', 'total']
+    log = APILog.objects.get(path=URL)
+    assert log.view_time_ms is not None and log.render_time_ms is not None
@@ -0,0 +1,158 @@
+"""
+Token-bucket throttling per client IP and per username.
+
+Every login attempt runs a full PBKDF2 hash of the password, so the token
+endpoints are throttled before their serializer runs. Buckets are rows of
+`throttle_buckets` in the database named by `THROTTLING['DATABASE']`,
+shared by every process and host serving the API. A token is taken with a
+single UPDATE that refills the bucket and only succeeds if a token is
+left, so concurrent requests never take more tokens than the bucket holds.
+Buckets are deleted once they are full again, when new ones are created.
+
+Limits are configured per throttle scope (`THROTTLING['SCOPES']`), set on
+views as `throttle_scope` like DRF's ScopedRateThrottle. Client IPs are
+read from X-Forwarded-For only behind trusted proxies, see `IPRateThrottle`.
+"""
+import hashlib
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.db.models.lookups import GreaterThanOrEqual
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .conf import throttling_settings
+from .metrics import THROTTLED
+from .models import ThrottleBucket
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Fraction of bucket creations that also delete the buckets already full
+PRUNE_PROBABILITY = 0.01
+
+
+def parse_rate(rate):
+    """Return `(number, seconds)` of a rate such as '5/min'"""
+    number, period = rate.split('/')
+    return int(number), _PERIODS[period[0]]
+
+
+def throttle_scope(scope):
+    """Set the throttle scope of a function view, used with `@api_view`"""
+    def decorator(func):
+        func.throttle_scope = scope
+        return func
+    return decorator
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle taking one token per request from the bucket of the request's
+    identity. Subclasses name their limit and how requests are identified.
+    """
+    # Key of the limit in the scope's settings
+    limit = None
+
+    def get_identity(self, request):
+        """Identity the request counts against, or None to let it through"""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.delay = None
+        conf = throttling_settings()
+        scope = getattr(view, 'throttle_scope', None)
+        limit = conf['SCOPES'].get(scope, {}).get(self.limit) if conf['ENABLED'] else None
+        if not limit:
+            return True
+        identity = self.get_identity(request)
+        if identity is None:
+            return True
+
+        number, seconds = parse_rate(limit['RATE'])
+        rate = number / seconds
+        burst = limit.get('BURST') or number
+        key = f'throttle:{scope}:{self.limit.lower()}:{identity}'
+        try:
+            allowed = self.take(conf['DATABASE'], key, rate, burst)
+        except Exception as e:
+            # Don't lock everyone out when the database is unavailable
+            print(f"Error checking throttle {key}: {e}")
+            return True
+        if not allowed:
+            THROTTLED.inc(scope, self.limit.lower())
+        return allowed
+
+    def take(self, using, key, rate, burst):
+        """Take a token from the bucket stored under `key`"""
+        buckets = ThrottleBucket.objects.using(using)
+        # A concurrent request may create the bucket or take its token between
+        # the queries below, then they are tried again
+        for _ in range(3):
+            now = time.time()
+            tokens = Least(Value(float(burst)), F('tokens') + Greatest(Value(now) - F('updated'), Value(0.0)) * rate)
+            taken = buckets.filter(GreaterThanOrEqual(tokens, 1.0), key=key).update(
+                tokens=tokens - 1.0, updated=now, full_at=now + (Value(float(burst)) - tokens + 1.0) / rate,
+            )
+            if taken:
+                return True
+            state = buckets.filter(key=key).values_list('tokens', 'updated').first()
+            if state is None:
+                try:
+                    with transaction.atomic(using=using):
+                        buckets.create(key=key, tokens=burst - 1.0, updated=now, full_at=now + 1 / rate)
+                except IntegrityError:
+                    continue
+                if random.random() < PRUNE_PROBABILITY:
+                    buckets.filter(full_at__lt=now).delete()
+                return True
+            tokens = min(burst, state[0] + max(now - state[1], 0) * rate)
+            if tokens < 1:
+                self.delay = (1 - tokens) / rate
+                return False
+        return False
+
+    def wait(self):
+        return self.delay
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    """
+    Limits requests per client IP. X-Forwarded-For is set by the client
+    unless a proxy overwrites it, so it is only read with a number of
+    trusted proxies configured (`THROTTLING['NUM_PROXIES']`): the address
+    added by the outermost one is used, like DRF's `NUM_PROXIES`.
+    """
+    limit = 'IP'
+
+    def get_identity(self, request):
+        num_proxies = throttling_settings()['NUM_PROXIES']
+        if num_proxies is None:
+            num_proxies = api_settings.NUM_PROXIES
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if num_proxies and forwarded_for:
+            addresses = [address.strip() for address in forwarded_for.split(',')]
+            return addresses[-min(num_proxies, len(addresses))]
+        return request.META.get('REMOTE_ADDR')
+
+
+class UsernameRateThrottle(TokenBucketThrottle):
+    """
+    Limits requests per username, taken from the submitted credentials or
+    the authenticated user. Usernames are compared case-insensitively, so
+    variants of a username share its bucket.
+    """
+    limit = 'USERNAME'
+
+    def get_identity(self, request):
+        username = None
+        if hasattr(request.data, 'get'):
+            username = request.data.get(get_user_model().USERNAME_FIELD)
+        if not username and request.user.is_authenticated:
+            username = request.user.get_username()
+        if not username or not isinstance(username, str):
+            return None
+        return hashlib.sha256(username.strip().casefold().encode()).hexdigest()
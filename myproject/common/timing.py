@@ -0,0 +1,116 @@
+"""
+Per-request performance breakdown.
+
+`APILoggingMiddleware` gives every API request a `RequestTimings`, made
+current for the code handling the request through a context variable.
+SQL queries are timed by an execute wrapper installed on every database
+connection, authentication by `CustomJWTAuthentication`, and the view and
+its rendering by the middleware hooks. The breakdown is stored with the
+request's log and returned in a `Server-Timing` header.
+
+The context variable is copied into the threads `sync_to_async` runs
+code in, so queries of sync views served under ASGI are counted too.
+"""
+from contextvars import ContextVar
+from time import perf_counter_ns
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Time spent per phase of a request, in nanoseconds"""
+    __slots__ = (
+        'started_at', 'start_ns', 'sql_count', 'sql_ns', 'auth_ns', 'view_ns', 'render_ns', 'view_start_ns',
+    )
+
+    def __init__(self):
+        self.started_at = timezone.now()
+        self.start_ns = perf_counter_ns()
+        self.sql_count = 0
+        self.sql_ns = 0
+        self.auth_ns = 0
+        self.view_ns = None
+        self.render_ns = None
+        self.view_start_ns = None
+
+    def elapsed_ms(self):
+        return (perf_counter_ns() - self.start_ns) / 1e6
+
+    def view_started(self):
+        self.view_start_ns = perf_counter_ns()
+
+    def view_finished(self):
+        """End the view phase, unless it was ended already"""
+        if self.view_start_ns is not None and self.view_ns is None:
+            self.view_ns = perf_counter_ns() - self.view_start_ns
+
+    def fields(self):
+        """Field values of the breakdown for an APILog record"""
+        return {
+            'sql_count': self.sql_count,
+            'sql_time_ms': self.sql_ns / 1e6,
+            'auth_time_ms': self.auth_ns / 1e6,
+            'view_time_ms': self.view_ns / 1e6 if self.view_ns is not None else None,
+            'render_time_ms': self.render_ns / 1e6 if self.render_ns is not None else None,
+        }
+
+    def server_timing(self):
+        """Value of the Server-Timing header"""
+        metrics = [f'db;dur={self.sql_ns / 1e6:.3f};desc="{self.sql_count} queries"']
+        if self.auth_ns:
+            metrics.append(f'auth;dur={self.auth_ns / 1e6:.3f}')
+        if self.view_ns is not None:
+            metrics.append(f'view;dur={self.view_ns / 1e6:.3f}')
+        if self.render_ns is not None:
+            metrics.append(f'render;dur={self.render_ns / 1e6:.3f}')
+        metrics.append(f'total;dur={self.elapsed_ms():.3f}')
+        return ', '.join(metrics)
+
+
+def current_timings():
+    """Timings of the request being handled, or None"""
+    return _current.get()
+
+
+def activate(timings):
+    """Make `timings` current, returning the token to `deactivate` it with"""
+    return _current.set(timings)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def add_auth_time(elapsed_ns):
+    timings = _current.get()
+    if timings is not None:
+        timings.auth_ns += elapsed_ns
+
+
+def time_queries(execute, sql, params, many, context):
+    """Execute wrapper adding the time of each query to the current timings"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql_ns += perf_counter_ns() - start
+        timings.sql_count += 1
+
+
+def _install(sender, connection, **kwargs):
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+def install():
+    """Time the queries of every connection, including those already open"""
+    connection_created.connect(_install, dispatch_uid='common.timing')
+    for connection in connections.all(initialized_only=True):
+        _install(None, connection)
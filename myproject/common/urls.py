@@ -5,6 +5,7 @@ app_name = 'common'
 
 urlpatterns = [
     path('api-logs/', views.APILogListView.as_view(), name='api-logs-list'),
+    path('api-logs/export/', views.APILogExportView.as_view(), name='api-logs-export'),
     path('api-logs/<int:pk>/', views.APILogDetailView.as_view(), name='api-logs-detail'),
     path('api-logs/stats/', views.APILogStatsView.as_view(), name='api-logs-stats'),
 ]
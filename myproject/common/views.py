@@ -1,17 +1,33 @@
+import hmac
 from datetime import timedelta
 from django_filters import rest_framework as filters
-from django.db.models import Count, Avg
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.views import View
 from rest_framework import generics, permissions
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from . import partitions
+from .conf import metrics_settings
+from .export import CONTENT_TYPES, EXPORT_FORMATS, aexport_chunks, export_chunks
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry
 from .models import APILog
+from .payloads import PAYLOAD_FIELDS
+from .pagination import KeysetPagination
+from .rollups import compute_stats
+from .routes import search_path
+from .search import search_logs
 from .serializers import APILogSerializer, APILogSummarySerializer
+from .values import ValuesListMixin
 
 
 class APILogFilter(filters.FilterSet):
     """Filter for API logs"""
     method = filters.CharFilter(lookup_expr='iexact')
-    path = filters.CharFilter(lookup_expr='icontains')
+    path = filters.CharFilter(method='filter_path')
+    route = filters.CharFilter()
     response_status_code = filters.NumberFilter()
     request_user = filters.NumberFilter()
     date_from = filters.DateTimeFilter(
@@ -24,28 +40,128 @@ class APILogFilter(filters.FilterSet):
     class Meta:
         model = APILog
         fields = [
-            'method', 'path', 'response_status_code', 'request_user',
+            'method', 'path', 'route', 'response_status_code', 'request_user',
             'date_from', 'date_to'
         ]
 
+    def filter_path(self, queryset, name, value):
+        # Substring search through the path search index where there is one
+        return search_path(queryset, value)
 
-class APILogListView(generics.ListAPIView):
-    """View to list API logs with filtering"""
-    queryset = APILog.objects.all()
+
+class APILogListView(ValuesListMixin, generics.ListAPIView):
+    """
+    View to list API logs with filtering, newest first. With `q`, the logs
+    matching a full-text search instead, best matches first.
+    """
+    # Only load the summary columns, never the large text fields
+    queryset = APILog.objects.only(*APILogSummarySerializer.Meta.fields)
     serializer_class = APILogSummarySerializer
     permission_classes = [permissions.IsAdminUser]
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = APILogFilter
-    ordering = ['-request_timestamp']
-    ordering_fields = ['request_timestamp', 'duration_ms', 'response_status_code']
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query and not partitions.enabled():
+            return super().list(request, *args, **kwargs)
+
+        querysets = self.get_querysets(request)
+        if query:
+            # Best matches first, merged over the tables on their rank
+            def fetch(limit):
+                logs = [log for queryset in querysets for log in search_logs(queryset, query, limit)]
+                return sorted(logs, key=lambda log: log.search_rank)[:limit]
+
+            page = self.paginator.paginate_ranked(fetch, request, view=self)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        values = self.get_values_serializer()
+        page = self.paginator.paginate_querysets([values.rows(queryset) for queryset in querysets], request, view=self)
+        return self.get_paginated_response(values.serialize(page))
+
+    def get_querysets(self, request):
+        """The filtered logs, as one queryset per partition when partitioning is enabled"""
+        if not partitions.enabled():
+            return [self.filter_queryset(self.get_queryset())]
+        return filter_log_querysets(request.query_params, request, fields=APILogSummarySerializer.Meta.fields)
+
+
+class APILogExportView(generics.GenericAPIView):
+    """
+    Stream the filtered logs, oldest first, as NDJSON or CSV
+    (`export_format`), gzipped with `gzip=1`. Headers and bodies are only
+    included with `payloads=1`.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    filter_backends = (filters.DjangoFilterBackend,)
+    filterset_class = APILogFilter
+
+    def get(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': [f"Expected one of {', '.join(EXPORT_FORMATS)}."]})
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        payloads = request.query_params.get('payloads') in ('1', 'true')
+
+        querysets = filter_log_querysets(request.query_params, request)
+        filename = f'api-logs.{export_format}'
+        if compress:
+            content_type, filename = 'application/gzip', filename + '.gz'
+        else:
+            content_type = CONTENT_TYPES[export_format]
+        # Under ASGI a sync iterator would be read whole before sending
+        chunks = aexport_chunks if isinstance(request._request, ASGIRequest) else export_chunks
+        response = StreamingHttpResponse(
+            chunks(querysets, export_format, compress=compress, payloads=payloads),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+def filter_log_querysets(params, request=None, fields=None):
+    """
+    The logs matching the `APILogFilter` parameters `params`, as one
+    queryset per table: the main table, then the partitions overlapping the
+    requested dates, oldest first, when partitioning is enabled
+    """
+    filterset = APILogFilter(params, queryset=APILog.objects.all(), request=request)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    if not partitions.enabled():
+        return [filterset.qs]
+
+    # Only read the partitions overlapping the requested date range
+    date_from = filterset.form.cleaned_data.get('date_from')
+    date_to = filterset.form.cleaned_data.get('date_to')
+    main, *partitioned = partitions.log_querysets(date_from, date_to)
+    querysets = []
+    for queryset in [main, *reversed(partitioned)]:
+        if fields:
+            queryset = queryset.only(*fields)
+        querysets.append(APILogFilter(params, queryset=queryset, request=request).qs)
+    return querysets
 
 
 class APILogDetailView(generics.RetrieveAPIView):
     """View to get detailed information about a specific API log"""
-    queryset = APILog.objects.all()
+    # Headers and bodies are only loaded here, with the log
+    queryset = APILog.objects.select_related(*PAYLOAD_FIELDS.values())
     serializer_class = APILogSerializer
     permission_classes = [permissions.IsAdminUser]
 
+    def get_object(self):
+        if not partitions.enabled():
+            return super().get_object()
+        try:
+            log = partitions.get_log(int(self.kwargs[self.lookup_field]), select_related=PAYLOAD_FIELDS.values())
+        except (ObjectDoesNotExist, ValueError):
+            raise Http404
+        self.check_object_permissions(self.request, log)
+        return log
+
 
 class APILogStatsView(generics.GenericAPIView):
     """View to get API usage statistics"""
@@ -59,33 +175,31 @@ class APILogStatsView(generics.GenericAPIView):
         end_date = timezone.now()
         start_date = end_date - timedelta(days=days)
 
-        # Filter logs by date range
-        logs = APILog.objects.filter(
-            request_timestamp__range=(start_date, end_date)
-        )
-
-        # Calculate statistics
-        stats = {
-            'total_requests': logs.count(),
-            'unique_endpoints': logs.values('path').distinct().count(),
-            'unique_users': logs.values('request_user').distinct().count(),
-            'avg_response_time': logs.aggregate(
-                avg_time=Avg('duration_ms')
-            )['avg_time'] or 0,
-            'status_code_distribution': logs.values('response_status_code').annotate(
-                count=Count('id')
-            ).order_by('response_status_code'),
-            'method_distribution': logs.values('method').annotate(
-                count=Count('id')
-            ).order_by('method'),
-            'top_endpoints': logs.values('path').annotate(
-                count=Count('id')
-            ).order_by('-count')[:10],
-            'date_range': {
-                'start': start_date,
-                'end': end_date,
-                'days': days
-            }
+        # Read the statistics from the rollups instead of scanning the logs
+        stats = compute_stats(start_date, end_date)
+        stats['date_range'] = {
+            'start': start_date,
+            'end': end_date,
+            'days': days
         }
 
         return Response(stats)
+
+
+class MetricsView(View):
+    """
+    Live metrics of all processes in the Prometheus text format. A plain
+    Django view, so scrapes skip DRF authentication and aren't API logged.
+    Scrapers authenticate with `METRICS['TOKEN']`; without a token only
+    staff sessions get in, unless `METRICS['PUBLIC']` is set.
+    """
+
+    def get(self, request):
+        conf = metrics_settings()
+        if conf['TOKEN']:
+            expected = f'Bearer {conf["TOKEN"]}'
+            if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode()):
+                return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+        elif not conf['PUBLIC'] and not getattr(getattr(request, 'user', None), 'is_staff', False):
+            return HttpResponse(status=403)
+        return HttpResponse(registry.exposition(), content_type=METRICS_CONTENT_TYPE)
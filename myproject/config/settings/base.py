@@ -140,8 +140,25 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Caches. Login throttling keeps its token buckets in the database instead
+# (THROTTLING['DATABASE'], see common/conf.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 # Customize token lifetime (default: 5 mins access, 1 day refresh)
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
+
+# API request logging (see common/conf.py for all options and defaults)
+API_LOGGING = {
+    'WRITER': {
+        'ENABLED': True,
+        'BATCH_SIZE': 200,
+        'FLUSH_INTERVAL': 1.0,
+    },
+}
@@ -19,6 +19,7 @@ from django.urls import include, path
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from common.views import MetricsView
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -38,6 +39,7 @@ urlpatterns = [
     path('api/token/', include('api.token.urls')),
     path('api/sample/', include('api.sample.urls')),
     path('api/common/', include('common.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
@@ -1,37 +1,128 @@
-import time
-from django.utils.deprecation import MiddlewareMixin
+from time import perf_counter_ns
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import empty
+from common import metrics, sampling, timing
+from common.capture import StreamingResponseCapture, capture_request_body
+from common.conf import api_logging_settings
 from common.models import APILog
+from common.routes import request_route
 
 
-class APILoggingMiddleware(MiddlewareMixin):
+class APILoggingMiddleware:
     """
     Middleware to log all API requests and responses
+
+    Works natively in both sync (WSGI) and async (ASGI) mode, so Django
+    doesn't need to run it in a thread under ASGI. For the same reason its
+    view and template response hooks have async variants in async mode.
+
+    API requests are timed per phase (SQL, authentication, view, rendering,
+    see common.timing); the breakdown is logged and returned to staff in a
+    Server-Timing header. Requests are also counted in the live metrics
+    (see common.metrics).
+
+    With `API_LOGGING['SAMPLING']` enabled only a sample of the requests is
+    logged (see common.sampling). The decision is made before the request
+    body is captured, so requests left out cost no capture.
     """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django would run the sync hooks in a thread
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self.process_request(request)
+        token = timing.activate(request.timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        token = timing.activate(request.timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.deactivate(token)
+        if request.timings is None:
+            return response
+        self._admit(request)
+        duration_ms = self._finish_timings(request, response)
+        if not self._sampled(request, response, duration_ms):
+            return response
+        try:
+            user = await self._aget_user(request)
+            if response.streaming:
+                self._log_streaming_response(request, response, duration_ms, user=user)
+            else:
+                await APILog.alog_request(request, response, duration_ms, user=user)
+        except Exception as e:
+            # Don't let logging errors break the response
+            print(f"Error in API logging middleware: {e}")
+        return response
 
     def process_request(self, request):
-        """Store the start time of the request and capture request body"""
-        request.start_time = time.time()
+        """Start timing API requests, their body is captured in `_admit`"""
+        request.timings = None
+        request.metered = False
+        request.sampling = None
 
-        # Only capture body for API requests
+        # Only time and capture body for API requests
         if request.path.startswith('/api/'):
-            # Capture request body before it gets consumed
+            request.timings = timing.RequestTimings()
+            if metrics.enabled():
+                metrics.REQUESTS_IN_PROGRESS.inc()
+                request.metered = True
             request.captured_body = None
-            if hasattr(request, 'body') and request.body:
-                try:
-                    body_str = request.body.decode('utf-8')
-                    request.captured_body = body_str[:10000]  # Limit to 10,000 characters
-                except (UnicodeDecodeError, AttributeError):
-                    pass
+            # Decided once the route is known, see `_admit`
+            request.admission_pending = True
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self._start_view(request)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # The request body was received before the view was called, so
+        # capturing it doesn't block the event loop
+        self._start_view(request)
+        return None
+
+    def process_template_response(self, request, response):
+        self._time_rendering(request, response)
+        return response
+
+    async def aprocess_template_response(self, request, response):
+        self._time_rendering(request, response)
+        return response
 
     def process_response(self, request, response):
         """Log the API request and response"""
         # Only log API requests (requests to /api/ endpoints)
-        if hasattr(request, 'start_time') and request.path.startswith('/api/'):
-            duration_ms = (time.time() - request.start_time) * 1000
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            self._admit(request)
+            duration_ms = self._finish_timings(request, response)
+            if not self._sampled(request, response, duration_ms):
+                return response
 
-            # Log asynchronously to avoid blocking the response
+            # Hand the log to the background writer to avoid blocking the response
             try:
-                APILog.log_request(request, response, duration_ms)
+                if response.streaming:
+                    self._log_streaming_response(request, response, duration_ms)
+                else:
+                    APILog.log_request(request, response, duration_ms)
             except Exception as e:
                 # Don't let logging errors break the response
                 print(f"Error in API logging middleware: {e}")
@@ -40,8 +131,10 @@ class APILoggingMiddleware(MiddlewareMixin):
 
     def process_exception(self, request, exception):
         """Log exceptions that occur during request processing"""
-        if hasattr(request, 'start_time') and request.path.startswith('/api/'):
-            duration_ms = (time.time() - request.start_time) * 1000
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            timings.view_finished()
+            duration_ms = timings.elapsed_ms()
 
             # Create a mock response for the exception
             from django.http import HttpResponse
@@ -50,6 +143,8 @@ class APILoggingMiddleware(MiddlewareMixin):
                 status=500,
                 content_type='text/plain'
             )
+            if not self._sampled(request, error_response, duration_ms):
+                return None
 
             try:
                 APILog.log_request(request, error_response, duration_ms)
@@ -57,3 +152,137 @@ class APILoggingMiddleware(MiddlewareMixin):
                 print(f"Error logging API exception: {e}")
 
         return None
+
+    @staticmethod
+    def _admit(request):
+        """
+        Make the sampling decision of an API request from its route, reusing
+        the view's URL resolution, and capture the request body if it is
+        logged. Requests that never reach a view (unresolved, or answered by
+        an earlier middleware) are decided when their response is logged,
+        before anything read their body.
+        """
+        if not request.admission_pending:
+            return
+        request.admission_pending = False
+        route = request_route(request) or ''
+        try:
+            if sampling.enabled():
+                request.sampling = sampling.get_sampler().decide(route)
+            if request.sampling is None or request.sampling.admitted:
+                # Peek at the start of the body without consuming it for the view
+                request.captured_body = capture_request_body(request, route)
+        except Exception as e:
+            print(f"Error capturing API request body: {e}")
+
+    @classmethod
+    def _start_view(cls, request):
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            cls._admit(request)
+            timings.view_started()
+
+    @staticmethod
+    def _time_rendering(request, response):
+        """End the view phase and time the rendering of the response"""
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            timings.view_finished()
+            render_start = perf_counter_ns()
+
+            def rendered(response):
+                timings.render_ns = perf_counter_ns() - render_start
+
+            response.add_post_render_callback(rendered)
+
+    @staticmethod
+    def _finish_timings(request, response):
+        """End the timings of a request, returning its duration in ms"""
+        timings = request.timings
+        # Views whose response isn't rendered end here
+        timings.view_finished()
+        if _sends_server_timing(request):
+            response['Server-Timing'] = timings.server_timing()
+        duration_ms = timings.elapsed_ms()
+        if request.metered:
+            request.metered = False
+            try:
+                metrics.REQUESTS_IN_PROGRESS.dec()
+                metrics.record_request(
+                    request.method, request_route(request), response.status_code, duration_ms, timings.sql_count,
+                )
+            except Exception as e:
+                print(f"Error recording API request metrics: {e}")
+        return duration_ms
+
+    @staticmethod
+    def _sampled(request, response, duration_ms):
+        """Whether the request is logged, setting the weight of its log"""
+        decision = getattr(request, 'sampling', None)
+        if decision is None:
+            return True
+        try:
+            request.sample_weight = sampling.get_sampler().weight(decision, response.status_code, duration_ms)
+        except Exception as e:
+            print(f"Error sampling API request: {e}")
+            request.sample_weight = None
+            return True
+        return request.sample_weight is not None
+
+    @staticmethod
+    def _log_streaming_response(request, response, duration_ms, user=None):
+        """
+        Log a streaming response once it has been sent, keeping only the
+        first bytes of its content
+        """
+        if getattr(response, 'file_to_stream', None) is not None:
+            # Wrapping a FileResponse would stop the server from using
+            # wsgi.file_wrapper, and its size is already known
+            size = response.get('Content-Length')
+            APILog.log_request(
+                request, response, duration_ms, user=user,
+                response_capture=(None, int(size) if size else None),
+            )
+            return
+
+        capture = StreamingResponseCapture()
+        capture.install(response)
+
+        def log():
+            try:
+                APILog.log_request(
+                    request, response, duration_ms, user=user,
+                    response_capture=(capture.body, capture.size),
+                )
+            except Exception as e:
+                print(f"Error in API logging middleware: {e}")
+
+        # Called by the server once the response has been sent, or the
+        # client went away
+        response._resource_closers.append(log)
+
+    @staticmethod
+    async def _aget_user(request):
+        """
+        Get the request user without blocking the event loop.
+
+        DRF replaces `request.user` with the authenticated user, but if it is
+        still the lazy session user from AuthenticationMiddleware, evaluating
+        it synchronously would query the database from the event loop.
+        """
+        user = getattr(request, 'user', None)
+        if getattr(user, '_wrapped', None) is empty and hasattr(request, 'auser'):
+            return await request.auser()
+        return user
+
+
+def _sends_server_timing(request):
+    """Whether the response to `request` gets a Server-Timing header"""
+    send = api_logging_settings('TIMING')['SERVER_TIMING']
+    if send != 'staff':
+        return bool(send)
+    if settings.DEBUG:
+        return True
+    # Only users already loaded: the lazy session user would query the database
+    user = getattr(request, 'user', None)
+    return getattr(user, '_wrapped', None) is not empty and getattr(user, 'is_staff', False)
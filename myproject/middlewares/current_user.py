@@ -1,14 +1,39 @@
 import contextvars
-from asgiref.sync import iscoroutinefunction
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 
 _current_user = contextvars.ContextVar("current_user", default=None)
 
 
+class CurrentUser:
+    """
+    Lazy current user kept in the context variable. `request.user` is only
+    read when the user is first asked for, so requests that never need it
+    don't load it from the session.
+    """
+    __slots__ = ('request', 'user')
+
+    def __init__(self, request=None, user=None):
+        self.request = request
+        self.user = user
+
+    def resolve(self):
+        if self.user is None and self.request is not None:
+            # The JWT user once DRF has authenticated the request
+            self.user = self.request.user
+        return self.user
+
+
 class CurrentUserMiddleware:
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
         self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
         if self._is_async:
@@ -17,7 +42,7 @@ class CurrentUserMiddleware:
 
     def _sync_call(self, request):
         # Set context var for sync requests
-        token = _current_user.set(request.user)
+        token = _current_user.set(CurrentUser(request))
         try:
             return self.get_response(request)
         finally:
@@ -25,7 +50,7 @@ class CurrentUserMiddleware:
 
     async def _async_call(self, request):
         # Set context var for async requests
-        token = _current_user.set(request.user)
+        token = _current_user.set(CurrentUser(request))
         try:
             return await self.get_response(request)
         finally:
@@ -33,4 +58,29 @@ class CurrentUserMiddleware:
 
     @staticmethod
     def get_current_user():
-        return _current_user.get()
\ No newline at end of file
+        current = _current_user.get()
+        return current.resolve() if current is not None else None
+
+    @staticmethod
+    def set_current_user(user):
+        """
+        Record the user of the current request once it is known. Returns a
+        token for `reset_current_user`; within the middleware the previous
+        user is restored at the end of the request anyway.
+        """
+        return _current_user.set(CurrentUser(user=user))
+
+    @staticmethod
+    def reset_current_user(token):
+        """Restore the user current before `set_current_user` returned `token`"""
+        _current_user.reset(token)
+
+    @staticmethod
+    @contextmanager
+    def use_current_user(user):
+        """Make `user` the current user inside the block, e.g. in tasks and commands"""
+        token = _current_user.set(CurrentUser(user=user))
+        try:
+            yield user
+        finally:
+            _current_user.reset(token)
\ No newline at end of file